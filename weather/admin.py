@@ -1,6 +1,6 @@
 
 from django.contrib import admin
-from .models import WeatherRecord, UserWeatherPreference, UserAchievement, SearchHistory
+from .models import WeatherRecord, UserWeatherPreference, UserAchievement, SearchHistory, SearchRollup, Observation, Location
 
 @admin.register(WeatherRecord)
 class WeatherRecordAdmin(admin.ModelAdmin):
@@ -50,3 +50,26 @@ class SearchHistoryAdmin(admin.ModelAdmin):
     search_fields = ("location",)
     readonly_fields = ("searched_at",)
     ordering = ("-searched_at",)
+
+
+@admin.register(SearchRollup)
+class SearchRollupAdmin(admin.ModelAdmin):
+    list_display = ("location", "period", "period_start", "source", "found", "searches", "results")
+    list_filter = ("period", "source", "found")
+    search_fields = ("location",)
+    ordering = ("period", "-period_start")
+
+
+@admin.register(Observation)
+class ObservationAdmin(admin.ModelAdmin):
+    list_display = ("city", "observed_at", "temperature", "precipitation", "humidity", "wind_speed", "condition")
+    list_filter = ("city", "condition")
+    search_fields = ("city",)
+    ordering = ("-observed_at",)
+
+
+@admin.register(Location)
+class LocationAdmin(admin.ModelAdmin):
+    list_display = ("city", "latitude", "longitude", "updated_at")
+    search_fields = ("city",)
+    readonly_fields = ("updated_at",)
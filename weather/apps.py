@@ -0,0 +1,18 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class WeatherConfig(AppConfig):
+    name = 'weather'
+    default_auto_field = 'django.db.models.BigAutoField'
+
+    def ready(self):
+        # Register WeatherRecord signal handlers
+        from . import signals  # noqa: F401
+        from .db import apply_sqlite_pragmas
+        from .instrumentation import instrument_connection
+
+        # Tune every new SQLite connection for the active database profile
+        connection_created.connect(apply_sqlite_pragmas, dispatch_uid='weather_sqlite_pragmas')
+        # Count and time queries for the request timing middleware
+        connection_created.connect(instrument_connection, dispatch_uid='weather_query_timing')
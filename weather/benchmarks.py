@@ -0,0 +1,335 @@
+"""View benchmark suite over synthetic datasets of several sizes.
+
+For each ``(cities, years)`` size a throwaway database is created and
+migrated, filled by ``weather.synthetic`` (plus coordinates for every city
+and a week of sub-daily observations for one) and then every named URL in
+``weather_site/urls.py`` (except the admin) is requested through Django's
+test client. Per view the suite records the cold first request, latency
+percentiles over the warm repeats and the SQL query counts; streamed bodies
+are read in full inside the measurement. Views that raise or answer with a
+non-2xx status are recorded as failures, without timings.
+
+Results are plain JSON-serializable dicts carrying the commit they were
+measured on, so two runs can be diffed with ``compare``.
+"""
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from urllib.parse import urlencode
+
+import django
+import numpy as np
+import orjson
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, setup_databases, teardown_databases
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils import timezone
+
+from . import feeds, geo, history, observations, openweather, pagecache, synthetic, timeseries
+from .models import Observation
+from .signals import weather_records_bulk_saved
+
+SKIPPED_NAMESPACES = {'admin'}
+OBSERVATION_DAYS = 7  # of 10-minute readings for the benchmarked city
+INGEST_READINGS = 500  # per api_ingest request
+DEFAULT_SIZES = [(10, 1), (50, 2), (200, 5)]
+
+
+def parse_sizes(value):
+    """Parse ``"10x1,50x2"`` into ``[(10, 1), (50, 2)]`` (cities x years)"""
+    sizes = []
+    for part in value.split(','):
+        try:
+            cities, years = part.lower().split('x')
+            size = (int(cities), float(years))
+        except ValueError:
+            raise ValueError(f'Invalid dataset size {part!r}; expected CITIESxYEARS, e.g. 50x2')
+        if size[0] < 1 or size[1] <= 0:
+            raise ValueError(f'Invalid dataset size {part!r}; cities and years must be positive')
+        sizes.append(size)
+    return sizes
+
+
+def url_names(patterns=None, skip=SKIPPED_NAMESPACES):
+    """Yield ``(name, parameter names)`` for every named URL pattern"""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.app_name in skip or pattern.namespace in skip:
+                continue
+            yield from url_names(pattern.url_patterns, skip)
+        elif pattern.name:
+            yield pattern.name, set(pattern.pattern.regex.groupindex)
+
+
+def view_requests(city, coordinates=(0.0, 0.0)):
+    """URL kwargs, query parameters and optionally a POST body per URL name, for ``city`` at ``coordinates``.
+
+    ``name[variant]`` keys request the same URL a second way and are reported
+    under that label.
+    """
+    latitude, longitude = coordinates
+    return {
+        'city_analytics': ({'city_name': city}, {}),
+        'weather_trends': ({}, {'days': 365}),
+        'api_weather_data': ({}, {'city': city, 'limit': 100}),
+        'api_weather_data[bulk]': ({}, {'city': city, 'bulk': 1}),
+        'api_weather_batch': ({}, {'cities': city, 'days': 30}),
+        'api_observations': ({}, {'cities': city, 'bucket': 'hour'}),
+        'api_ingest': ({}, {}, ingest_body(city)),
+        'api_nearby': ({}, {'lat': latitude, 'lon': longitude, 'k': 10}),
+        'search_location': ({}, {'location': city}),
+        'search_location_async': ({}, {'location': city}),
+        'api_search': ({}, {'q': city}),
+    }
+
+
+@contextmanager
+def benchmark_database():
+    """Create, migrate and afterwards destroy a file-backed throwaway database"""
+    with tempfile.TemporaryDirectory(prefix='weather-bench-') as directory:
+        test_settings = connections['default'].settings_dict.setdefault('TEST', {})
+        previous_name = test_settings.get('NAME')
+        test_settings['NAME'] = os.path.join(directory, 'bench.sqlite3')
+        config = setup_databases(verbosity=0, interactive=False)
+        try:
+            yield
+        finally:
+            # The writer threads hold their own connections to the database being destroyed
+            history.stop()
+            feeds.stop()
+            teardown_databases(config, verbosity=0)
+            test_settings['NAME'] = previous_name
+
+
+def seed_locations(cities, seed=0):
+    """Give every city random coordinates; returns ``{city: (latitude, longitude)}``"""
+    rng = np.random.default_rng(seed)
+    coordinates = {
+        city: (round(float(rng.uniform(-60, 70)), 4), round(float(rng.uniform(-180, 180)), 4))
+        for city in cities
+    }
+    geo.upsert_locations((city, lat, lon) for city, (lat, lon) in coordinates.items())
+    return coordinates
+
+
+def ingest_body(city, readings=INGEST_READINGS):
+    """NDJSON body of ``readings`` 10-minute observations for ``city``, 30 days back (upserted on every request)"""
+    start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=30)
+    lines = [
+        orjson.dumps({
+            'city': city,
+            'observed_at': (start + timedelta(minutes=10 * i)).isoformat(),
+            'temperature': 10 + i % 12,
+            'humidity': 50,
+            'wind_speed': 4.0,
+            'condition': 'sunny',
+        })
+        for i in range(readings)
+    ]
+    return b'\n'.join(lines) + b'\n'
+
+
+def seed_observations(city, days=OBSERVATION_DAYS, seed=0):
+    """Write ``days`` of 10-minute readings for ``city`` up to now; returns how many"""
+    rng = np.random.default_rng(seed)
+    end = timezone.now().replace(second=0, microsecond=0)
+    count = days * 144
+    temperatures = 15 + 8 * np.sin(np.arange(count) * 2 * np.pi / 144) + rng.normal(0, 1, count)
+    readings = [
+        Observation(
+            city=city,
+            observed_at=end - timedelta(minutes=10 * i),
+            temperature=round(float(temperature), 1),
+            precipitation=0.0,
+            humidity=int(rng.integers(30, 90)),
+            wind_speed=round(float(rng.gamma(2.0, 3.0)), 1),
+            condition='cloudy',
+        )
+        for i, temperature in enumerate(temperatures)
+    ]
+    cities = observations.write(readings)
+    if cities:
+        weather_records_bulk_saved.send(sender=Observation, cities=cities)
+    return count
+
+
+def reset_caches():
+    timeseries.cache.invalidate()
+    geo.index.invalidate()
+    openweather.reset_clients()
+    caches[getattr(settings, 'WEATHER_PAGE_CACHE_ALIAS', 'default')].clear()
+    pagecache.page_counter.reset()
+    pagecache.fragment_counter.reset()
+
+
+def measure_views(city, repeat, coordinates=(0.0, 0.0)):
+    """Request every URL once cold and ``repeat`` times warm; return per-view results.
+
+    A view that raises or answers with a non-2xx status is not timed: its
+    result carries the ``status`` and an ``error`` instead (see ``failures``).
+    """
+    client = Client(raise_request_exception=True)
+    requests = view_requests(city, coordinates)
+    results = {}
+    targets = [
+        (label, name, parameters) for name, parameters in url_names()
+        for label in [name, *(key for key in requests if key.startswith(f'{name}['))]
+    ]
+    for label, name, parameters in targets:
+        kwargs, query, *body = requests.get(label, ({}, {}))
+        if parameters - set(kwargs):
+            results[label] = {'skipped': f'no values for {", ".join(sorted(parameters - set(kwargs)))}'}
+            continue
+        path = reverse(name, kwargs=kwargs)
+        timings = []
+        query_counts = []
+        status = None
+        error = None
+        for _ in range(repeat + 1):
+            with ExitStack() as stack:
+                captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+                started = time.perf_counter()
+                try:
+                    if body:
+                        response = client.post(
+                            f'{path}?{urlencode(query)}', body[0], content_type='application/x-ndjson',
+                        )
+                    else:
+                        response = client.get(path, query)
+                    # A streamed body runs its queries and encoding as it is read
+                    content = b''.join(response.streaming_content) if response.streaming else response.content
+                except Exception as e:
+                    status, error = 500, f'{type(e).__name__}: {e}'
+                    break
+                timings.append(time.perf_counter() - started)
+            query_counts.append(sum(len(context) for context in captured))
+            status = response.status_code
+            if not 200 <= status < 300:
+                error = response_error(status, content)
+                break
+        if error is not None:
+            results[label] = {'path': path, 'query': query, 'status': status, 'error': error}
+            continue
+        warm = sorted(timings[1:])
+        results[label] = {
+            'path': path,
+            'query': query,
+            'status': status,
+            'cold_ms': timings[0] * 1000,
+            'p50_ms': percentile(warm, 0.50) * 1000,
+            'p95_ms': percentile(warm, 0.95) * 1000,
+            'p99_ms': percentile(warm, 0.99) * 1000,
+            'max_ms': warm[-1] * 1000,
+            'cold_queries': query_counts[0],
+            'queries': statistics.median(query_counts[1:]),
+        }
+    return results
+
+
+def response_error(status, content, limit=200):
+    """Short description of an error response, from its body when it is text"""
+    body = content[:limit].decode(errors='replace').strip()
+    return f'HTTP {status}: {body}' if body else f'HTTP {status}'
+
+
+def failures(document):
+    """Yield ``(size, view, result)`` for every view that failed in a results document"""
+    for result in document['results']:
+        for name, view in result['views'].items():
+            if 'error' in view:
+                yield (result['cities'], result['years']), name, view
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(sizes=DEFAULT_SIZES, repeat=20, seed=0, page_cache=False, on_size=None):
+    """Benchmark every view at each ``(cities, years)`` size; return the results document.
+
+    ``on_size(result)`` is called as each size finishes.
+    """
+    results = []
+    # Failures are raised into measure_views and recorded there; the per-request
+    # log entries for them and for slow views would drown the report
+    loggers = [logging.getLogger(name) for name in ('django.request', 'weather.requests')]
+    disabled = [logger.disabled for logger in loggers]
+    try:
+        for logger in loggers:
+            logger.disabled = True
+        with override_settings(WEATHER_PAGE_CACHE_ENABLED=page_cache, ALLOWED_HOSTS=['testserver']):
+            results.extend(run_sizes(sizes, repeat, seed, on_size))
+    finally:
+        for logger, was_disabled in zip(loggers, disabled):
+            logger.disabled = was_disabled
+    return {'meta': metadata(seed=seed, repeat=repeat, page_cache=page_cache), 'results': results}
+
+
+def run_sizes(sizes, repeat, seed, on_size):
+    for cities, years in sizes:
+        with benchmark_database():
+            reset_caches()
+            started = time.perf_counter()
+            records = synthetic.generate(cities, years, seed=seed)
+            names = synthetic.city_names(cities)
+            city = names[0]
+            readings = seed_observations(city, seed=seed)
+            locations = seed_locations(names, seed=seed)
+            generate_seconds = time.perf_counter() - started
+            result = {
+                'cities': cities,
+                'years': years,
+                'records': records,
+                'observations': readings,
+                'generate_seconds': generate_seconds,
+                'views': measure_views(city, repeat, locations[city]),
+            }
+            reset_caches()
+        if on_size:
+            on_size(result)
+        yield result
+
+
+def metadata(**options):
+    return {
+        'commit': git_commit(),
+        'created_at': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connections['default'].vendor,
+        'db_profile': getattr(settings, 'WEATHER_DB_PROFILE', None),
+        **options,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, metric='p50_ms'):
+    """Yield ``(size, view, before, after, ratio)`` for views measured in both documents"""
+    before_by_size = {(result['cities'], result['years']): result['views'] for result in baseline['results']}
+    for result in current['results']:
+        size = (result['cities'], result['years'])
+        before_views = before_by_size.get(size, {})
+        for name, after in result['views'].items():
+            before = before_views.get(name, {})
+            if metric in after and before.get(metric):
+                yield size, name, before[metric], after[metric], after[metric] / before[metric]
@@ -0,0 +1,119 @@
+"""SQLite tuning and read-replica routing for the production database profile.
+
+With ``WEATHER_DB_PROFILE=production`` (see settings) every new SQLite
+connection gets the pragmas listed for its alias in ``SQLITE_PRAGMAS``, and
+``ReadReplicaRouter`` sends reads made inside ``@read_replica`` views to the
+``replica`` alias while every write goes to ``default``.
+
+By default the replica is the primary file opened read-only. In WAL mode
+those readers never wait on the ingest or search-history writers. Setting
+``WEATHER_DB_REPLICA`` points it at a separate copy instead, refreshed with
+``manage.py sync_sqlite_replica``.
+
+``executemany_upsert`` is the raw bulk upsert shared by the synthetic data
+loader and the observation writer.
+"""
+import asyncio
+import contextvars
+import sqlite3
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+REPLICA_DB_ALIAS = 'replica'
+
+_use_replica = contextvars.ContextVar('weather_use_replica', default=False)
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """``connection_created`` handler applying ``SQLITE_PRAGMAS[alias]``"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {}).get(connection.alias, {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def read_replica(view):
+    """Route the ORM reads of a view (sync or async) to the read replica"""
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            token = _use_replica.set(True)
+            try:
+                return await view(*args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = _use_replica.set(True)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+    return wrapper
+
+
+class ReadReplicaRouter:
+    """Send reads from ``@read_replica`` views to the replica, everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        if not _use_replica.get() or REPLICA_DB_ALIAS not in settings.DATABASES:
+            return DEFAULT_DB_ALIAS
+        # Reads that feed a write (e.g. a lazy rollup rebuild) must see the primary
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def copy_database(source, target):
+    """Copy a live SQLite database file with the online backup API"""
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+UPSERT_VENDORS = ('sqlite', 'postgresql')  # Backends that accept ``executemany_upsert``'s statement
+
+
+def executemany_upsert(model, fields, unique_fields, rows, update_fields=None):
+    """Upsert ``rows`` (tuples of database-ready values in ``fields`` order) with one ``executemany``.
+
+    Conflicts on ``unique_fields`` update ``update_fields`` (default: every
+    other field). Compiling one statement instead of one per model instance
+    is most of what this saves over ``bulk_create``. The statement is
+    ``INSERT ... ON CONFLICT``, so only UPSERT_VENDORS support it; callers fall
+    back to the ORM elsewhere.
+    """
+    if update_fields is None:
+        update_fields = [name for name in fields if name not in unique_fields]
+    meta = model._meta
+    quote = connection.ops.quote_name
+    column = {name: quote(meta.get_field(name).column) for name in fields}
+    updates = ', '.join(f'{column[name]} = EXCLUDED.{column[name]}' for name in update_fields)
+    sql = (
+        f'INSERT INTO {quote(meta.db_table)} ({", ".join(column[name] for name in fields)}) '
+        f'VALUES ({", ".join(["%s"] * len(fields))}) '
+        f'ON CONFLICT ({", ".join(column[name] for name in unique_fields)}) DO UPDATE SET {updates}'
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
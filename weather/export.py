@@ -0,0 +1,160 @@
+"""Streaming bulk export of WeatherRecord rows as CSV, gzipped CSV or Parquet.
+
+Rows are read with a chunked ``values_list().iterator()`` ordered on the
+``(city, date)`` unique index. They are encoded and yielded as byte chunks,
+so ``/api/export/`` and the ``export_weather`` command use constant memory
+whatever the size of the history. Parquet output needs the optional
+``pyarrow`` package and is written one row group at a time.
+"""
+import csv
+import importlib.util
+import io
+import zlib
+from itertools import islice
+
+from .models import WeatherRecord
+from .pagination import API_RECORD_FIELDS
+
+FORMATS = {
+    # format -> (content type, file extension)
+    'csv': ('text/csv', 'csv'),
+    'csv.gz': ('application/gzip', 'csv.gz'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+EXPORT_FIELDS = API_RECORD_FIELDS
+CHUNK_SIZE = 5000  # Rows fetched from the database and encoded at a time
+ROW_GROUP_SIZE = 50000  # Rows per Parquet row group
+GZIP_LEVEL = 6
+
+
+class RowCounter:
+    """Wraps a row iterator and counts the rows that pass through it"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.count += 1
+            yield row
+
+
+def parquet_available():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def export_queryset(cities=None, start=None, end=None):
+    records = WeatherRecord.objects.all()
+    if cities:
+        records = records.filter(city__in=cities)
+    if start:
+        records = records.filter(date__gte=start)
+    if end:
+        records = records.filter(date__lte=end)
+    return records.order_by('city', 'date')
+
+
+def iter_rows(queryset, chunk_size=CHUNK_SIZE):
+    return queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def stream(rows, fmt, chunk_size=CHUNK_SIZE, row_group_size=ROW_GROUP_SIZE):
+    """Yield ``rows`` (tuples of EXPORT_FIELDS values) encoded as ``fmt``"""
+    if fmt == 'csv':
+        return csv_chunks(rows, chunk_size)
+    if fmt == 'csv.gz':
+        return gzip_chunks(csv_chunks(rows, chunk_size))
+    if fmt == 'parquet':
+        return parquet_chunks(rows, row_group_size)
+    raise ValueError(f"Unknown export format {fmt!r}; expected one of {', '.join(FORMATS)}")
+
+
+def csv_chunks(rows, chunk_size=CHUNK_SIZE):
+    """Yield a header line, then ``chunk_size`` rows of CSV at a time, as UTF-8 bytes"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(EXPORT_FIELDS)
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if chunk:
+            writer.writerows(chunk)
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if not chunk:
+            return
+
+
+def gzip_chunks(chunks, level=GZIP_LEVEL):
+    """Compress a stream of byte chunks into one gzip member on the fly"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file that hands back whatever has been written since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def parquet_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ('city', pa.string()),
+        ('date', pa.date32()),
+        ('temp_high', pa.float64()),
+        ('temp_low', pa.float64()),
+        ('temp_avg', pa.float64()),
+        ('precipitation', pa.float64()),
+        ('humidity', pa.int32()),
+        ('wind_speed', pa.float64()),
+        ('condition', pa.string()),
+    ])
+
+
+def parquet_chunks(rows, row_group_size=ROW_GROUP_SIZE):
+    """Yield a Parquet file written one row group of ``row_group_size`` rows at a time.
+
+    Raises ImportError if pyarrow is not installed.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    sink = _Sink()
+    rows = iter(rows)
+    with pq.ParquetWriter(sink, schema, compression='snappy') as writer:
+        while True:
+            group = list(islice(rows, row_group_size))
+            if not group:
+                break
+            columns = [pa.array(values, type=field.type) for values, field in zip(zip(*group), schema)]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema), row_group_size=row_group_size)
+            yield sink.drain()
+    yield sink.drain()
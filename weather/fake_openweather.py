@@ -0,0 +1,113 @@
+"""A local stand-in for the OpenWeather current weather API.
+
+Used by the benchmark commands (and handy in tests) to exercise the upstream
+code paths without network access or an API key::
+
+    with FakeOpenWeatherServer(latency=0.2) as server:
+        client = OpenWeatherClient(base_url=server.url)
+
+Every location resolves to deterministic fake weather, except names starting
+with ``unknown``, which answer 404, and ``error``, which answer 503.
+"""
+import hashlib
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def fake_weather(location):
+    """Deterministic OpenWeather-shaped payload for ``location``"""
+    seed = int(hashlib.sha1(location.lower().encode()).hexdigest()[:8], 16)
+    temp = round(-10 + seed % 400 / 10, 1)
+    return {
+        'name': location.title(),
+        'coord': {'lat': round(seed % 18000 / 100 - 90, 4), 'lon': round(seed % 36000 / 100 - 180, 4)},
+        'main': {
+            'temp': temp,
+            'temp_max': round(temp + 3, 1),
+            'temp_min': round(temp - 3, 1),
+            'humidity': seed % 101,
+        },
+        'wind': {'speed': round(seed % 300 / 10, 1)},
+        'weather': [{'main': 'Clouds', 'description': 'scattered clouds'}],
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        with server.lock:
+            server.request_count += 1
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        location = query.get('q', [''])[0]
+        if not location or location.lower().startswith('unknown'):
+            status, body = 404, {'cod': '404', 'message': 'city not found'}
+        elif location.lower().startswith('error'):
+            status, body = 503, {'cod': '503', 'message': 'service unavailable'}
+        else:
+            status, body = 200, fake_weather(location)
+
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Benchmarks open hundreds of connections at once; the default backlog of 5 stalls them
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # Clients that gave up (timeouts, cancelled tasks) aren't server errors
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeOpenWeatherServer:
+    """Threaded HTTP server on a free local port, used as a context manager"""
+
+    def __init__(self, latency=0.0, host='127.0.0.1', port=0):
+        self.httpd = _Server((host, port), _Handler)
+        self.httpd.latency = latency
+        self.httpd.lock = threading.Lock()
+        self.httpd.request_count = 0
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def request_count(self):
+        return self.httpd.request_count
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
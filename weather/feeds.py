@@ -0,0 +1,300 @@
+"""Streaming NDJSON ingest for station feeds.
+
+``POST /api/ingest/`` reads its body (optionally chunked or gzip-encoded) one
+line at a time. Each line is validated with the model fields' own validators,
+through ``observations.build_observation``, or ``ingest.build_record`` with
+``?kind=records``. Valid rows are queued in batches for this process's
+``FeedWriter``, so a large body is never held in memory.
+
+The writer is a single background thread draining a bounded queue. It merges
+every batch waiting from concurrent stations into one upsert per transaction
+(up to ``INGEST_FEED_COMMIT_ROWS`` rows). That way the database's single writer
+commits a few large transactions instead of one small transaction per station.
+A request returns once all of its rows are committed.
+
+The bounded queue provides the backpressure. If a batch cannot be queued
+within ``INGEST_FEED_QUEUE_TIMEOUT`` seconds, the request stops reading and
+answers 429 with ``Retry-After``. The response includes ``lines``, the count of
+lines whose rows were committed, so the station can resend the rest. Writes are
+upserts, so resending a row that already arrived is harmless.
+"""
+import atexit
+import gzip
+import logging
+import os
+import queue
+import threading
+
+import orjson
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections
+
+from . import ingest, metrics, observations
+from .models import Observation, WeatherRecord
+from .signals import weather_records_bulk_saved
+
+logger = logging.getLogger(__name__)
+
+KINDS = {
+    # kind -> (row validator, batch upsert, model sent with weather_records_bulk_saved)
+    'observations': (observations.build_observation, observations.write, Observation),
+    'records': (ingest.build_record, ingest.upsert_records, WeatherRecord),
+}
+DEFAULT_KIND = 'observations'
+MAX_REPORTED_ERRORS = 100
+
+_STOP = object()
+
+
+class QueueFull(Exception):
+    """The writer's queue stayed full for the whole queue timeout"""
+
+
+class Batch:
+    """Validated rows of one request, queued for the writer as a unit"""
+
+    def __init__(self, kind, rows, last_line, rejected):
+        self.kind = kind
+        self.rows = rows
+        self.last_line = last_line  # Last body line covered by this batch
+        self.rejected = rejected
+        self.error = None
+        self.done = threading.Event()
+
+
+class FeedWriter:
+    def __init__(self, queue_size=64, commit_rows=5000, queue_timeout=0.5):
+        self.commit_rows = commit_rows
+        self.queue_timeout = queue_timeout
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._counters_lock = threading.Lock()
+        self._counters = dict.fromkeys(['written', 'failed', 'commits', 'throttled'], 0)
+
+    def saturated(self):
+        return self._queue.full()
+
+    def submit(self, batch):
+        """Queue ``batch``; raises QueueFull if there is no room within the queue timeout"""
+        self._ensure_started()
+        try:
+            self._queue.put(batch, timeout=self.queue_timeout)
+        except queue.Full:
+            self._count('throttled')
+            raise QueueFull
+        return batch
+
+    def stop(self, timeout=5.0):
+        """Write whatever is queued and stop the background thread"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._counters_lock:
+            stats = dict(self._counters)
+        stats['pending'] = self._queue.qsize()
+        return stats
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='ingest-feed-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                connections.close_all()
+                return
+            # Group commit: take every batch already waiting, up to commit_rows rows
+            pending = [item]
+            rows = len(item.rows)
+            stopping = False
+            while rows < self.commit_rows:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                pending.append(item)
+                rows += len(item.rows)
+
+            for kind in KINDS:
+                batches = [batch for batch in pending if batch.kind == kind]
+                if batches:
+                    self._write(kind, batches)
+            if stopping:
+                connections.close_all()
+                return
+
+    def _write(self, kind, batches):
+        _, upsert, model = KINDS[kind]
+        rows = [row for batch in batches for row in batch.rows]
+        try:
+            cities = upsert(rows)
+            if cities:
+                weather_records_bulk_saved.send(sender=model, cities=cities)
+        except Exception as e:
+            logger.exception('Failed to write %d ingested %s', len(rows), kind)
+            self._count('failed', len(rows))
+            for batch in batches:
+                batch.error = e
+        else:
+            self._count('written', len(rows))
+            self._count('commits')
+        finally:
+            for batch in batches:
+                batch.done.set()
+
+    def _count(self, name, amount=1):
+        with self._counters_lock:
+            self._counters[name] += amount
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer():
+    """Return this process's writer, configured from settings"""
+    # Keyed by pid: a writer thread doesn't survive a fork into worker processes
+    pid = os.getpid()
+    writer = _writers.get(pid)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(pid)
+            if writer is None:
+                writer = _writers[pid] = FeedWriter(
+                    queue_size=settings.INGEST_FEED_QUEUE_SIZE,
+                    commit_rows=settings.INGEST_FEED_COMMIT_ROWS,
+                    queue_timeout=settings.INGEST_FEED_QUEUE_TIMEOUT,
+                )
+    return writer
+
+
+def stop(timeout=5.0):
+    """Write out queued batches and stop this process's writer"""
+    with _writers_lock:
+        writer = _writers.pop(os.getpid(), None)
+    if writer is not None:
+        writer.stop(timeout)
+
+
+# --- Request bodies --------------------------------------------------------------
+
+def body_stream(request):
+    """File-like view of the request body, decoded from gzip if the client says so"""
+    stream = request
+    # Under WSGI Django only reads CONTENT_LENGTH bytes; a chunked body has none,
+    # and servers that accept one hand it over de-chunked in wsgi.input
+    if (
+        'chunked' in request.headers.get('Transfer-Encoding', '').lower()
+        and not request.META.get('CONTENT_LENGTH')
+        and 'wsgi.input' in request.META
+    ):
+        stream = request.META['wsgi.input']
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+    return stream
+
+
+def read_lines(stream, max_bytes):
+    """Yield the lines of a binary stream; a line longer than ``max_bytes`` is skipped and yielded as None"""
+    while True:
+        line = stream.readline(max_bytes + 1)
+        if not line:
+            return
+        if len(line) > max_bytes and not line.endswith(b'\n'):
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(max_bytes + 1)
+            yield None
+            continue
+        yield line
+
+
+def receive(stream, kind=DEFAULT_KIND, writer=None, batch_size=None, max_line_bytes=None):
+    """Validate the NDJSON lines of ``stream`` and write their rows through the feed writer.
+
+    Returns a dict of ``accepted`` and ``rejected`` row counts, ``lines`` (the
+    body lines whose rows are committed), up to MAX_REPORTED_ERRORS ``errors``
+    and, when the request has to be cut short, ``error`` and ``status``
+    (429 when the queue is full, 503 when a write failed).
+    """
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of: {', '.join(KINDS)}")
+    build = KINDS[kind][0]
+    writer = writer or get_writer()
+    batch_size = batch_size or settings.INGEST_FEED_BATCH_SIZE
+    max_line_bytes = max_line_bytes or settings.INGEST_FEED_MAX_LINE_BYTES
+
+    queued = []
+    errors = []
+    result = {'status': 200}
+    rows, rejected, last_line = [], 0, 0
+
+    def reject(line_number, messages):
+        nonlocal rejected
+        rejected += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'line': line_number, 'errors': messages})
+
+    def flush():
+        nonlocal rows, rejected
+        queued.append(writer.submit(Batch(kind, rows, last_line, rejected)))
+        rows, rejected = [], 0
+
+    try:
+        for last_line, line in enumerate(read_lines(stream, max_line_bytes), start=1):
+            if line is None:
+                reject(last_line, [f'Line is longer than {max_line_bytes} bytes.'])
+                continue
+            if not line.strip():
+                continue
+            try:
+                rows.append(build(orjson.loads(line)))
+            except orjson.JSONDecodeError:
+                reject(last_line, ['Invalid JSON.'])
+            except ValidationError as e:
+                reject(last_line, e.message_dict if hasattr(e, 'error_dict') else e.messages)
+            if len(rows) >= batch_size:
+                flush()
+        if rows or rejected:
+            flush()
+    except QueueFull:
+        result.update(status=429, error='Ingest queue is full; resend from the line after "lines".')
+    except (OSError, EOFError) as e:
+        # Truncated or corrupt gzip body
+        result.update(status=400, error=f'Cannot read request body: {e}')
+
+    # Count what was committed, in body order, up to the first failed batch
+    accepted = rejected_total = lines = 0
+    for batch in queued:
+        if not batch.done.wait(settings.INGEST_FEED_COMMIT_TIMEOUT) or batch.error is not None:
+            result.update(status=503, error='Writing a batch failed; resend from the line after "lines".')
+            break
+        accepted += len(batch.rows)
+        rejected_total += batch.rejected
+        lines = batch.last_line
+
+    metrics.INGEST_FEED_ROWS.labels('accepted').inc(accepted)
+    metrics.INGEST_FEED_ROWS.labels('rejected').inc(rejected_total)
+    if result['status'] == 429:
+        metrics.INGEST_FEED_THROTTLED.inc()
+    result.update(
+        accepted=accepted,
+        rejected=rejected_total,
+        lines=lines,
+        errors=[error for error in errors if error['line'] <= lines],
+    )
+    return result
@@ -0,0 +1,206 @@
+"""Buffered, batched writer for SearchHistory rows.
+
+Searches call ``record_search``, which only appends to an in-memory queue.
+A background thread writes the queue with ``bulk_create`` once
+``SEARCH_HISTORY_BATCH_SIZE`` entries are waiting or the oldest has waited
+``SEARCH_HISTORY_FLUSH_INTERVAL`` seconds, and drains it at process exit.
+
+When the queue is full, ``SEARCH_HISTORY_FULL_POLICY`` decides what happens:
+``'drop'`` discards the entry immediately, ``'block'`` waits up to
+``SEARCH_HISTORY_BLOCK_TIMEOUT`` seconds for room before discarding it.
+Set ``SEARCH_HISTORY_BUFFERED = False`` to write every entry synchronously.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from . import metrics
+from .models import SearchHistory
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class SearchHistoryWriter:
+    def __init__(self, batch_size=100, flush_interval=1.0, queue_size=10000,
+                 full_policy='drop', block_timeout=0.05):
+        if full_policy not in ('drop', 'block'):
+            raise ValueError(f"full_policy must be 'drop' or 'block', not {full_policy!r}")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.full_policy = full_policy
+        self.block_timeout = block_timeout
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._counters_lock = threading.Lock()
+        self._counters = dict.fromkeys(['queued', 'written', 'dropped', 'failed', 'flushes'], 0)
+
+    def submit(self, entry):
+        """Queue an unsaved SearchHistory instance; never raises on a full queue"""
+        self._ensure_started()
+        try:
+            if self.full_policy == 'block':
+                self._queue.put(entry, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(entry)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('queued')
+        return True
+
+    def flush(self, timeout=None):
+        """Block until every entry queued before this call has been written"""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def stop(self, timeout=5.0):
+        """Write whatever is queued and stop the background thread"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._counters_lock:
+            stats = dict(self._counters)
+        stats['pending'] = self._queue.qsize()
+        return stats
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='search-history-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if batch else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None  # The oldest entry has waited long enough
+
+            if item is _STOP:
+                self._write(batch)
+                connections.close_all()
+                return
+            if isinstance(item, threading.Event):
+                self._write(batch)
+                batch = []
+                item.set()
+                continue
+            if item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+
+            self._write(batch)
+            batch = []
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            SearchHistory.objects.bulk_create(batch)
+        except Exception:
+            logger.exception('Failed to write %d search history entries', len(batch))
+            self._count('failed', len(batch))
+        else:
+            self._count('written', len(batch))
+            self._count('flushes')
+
+    def _count(self, name, amount=1):
+        with self._counters_lock:
+            self._counters[name] += amount
+        if name != 'flushes':
+            metrics.SEARCH_HISTORY_ENTRIES.labels(name).inc(amount)
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer():
+    """Return this process's writer, configured from settings"""
+    # Keyed by pid: a writer thread doesn't survive a fork into worker processes
+    pid = os.getpid()
+    writer = _writers.get(pid)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(pid)
+            if writer is None:
+                writer = _writers[pid] = SearchHistoryWriter(
+                    batch_size=settings.SEARCH_HISTORY_BATCH_SIZE,
+                    flush_interval=settings.SEARCH_HISTORY_FLUSH_INTERVAL,
+                    queue_size=settings.SEARCH_HISTORY_QUEUE_SIZE,
+                    full_policy=settings.SEARCH_HISTORY_FULL_POLICY,
+                    block_timeout=settings.SEARCH_HISTORY_BLOCK_TIMEOUT,
+                )
+    return writer
+
+
+def record_search(location, source, result_count=0, found=True):
+    """Record a search without putting an INSERT on the request path"""
+    entry = _entry(location, source, result_count, found)
+    if not settings.SEARCH_HISTORY_BUFFERED:
+        entry.save()
+        metrics.SEARCH_HISTORY_ENTRIES.labels('written').inc()
+        return True
+    return get_writer().submit(entry)
+
+
+async def arecord_search(location, source, result_count=0, found=True):
+    """Async counterpart of record_search for async views"""
+    entry = _entry(location, source, result_count, found)
+    if not settings.SEARCH_HISTORY_BUFFERED:
+        await entry.asave()
+        metrics.SEARCH_HISTORY_ENTRIES.labels('written').inc()
+        return True
+    return get_writer().submit(entry)
+
+
+def _entry(location, source, result_count, found):
+    # Timestamped now rather than at flush time
+    return SearchHistory(
+        location=location,
+        source=source,
+        result_count=result_count,
+        found=found,
+        searched_at=timezone.now(),
+    )
+
+
+def flush(timeout=None):
+    """Write out every search recorded so far by this process"""
+    if not settings.SEARCH_HISTORY_BUFFERED:
+        return True
+    return get_writer().flush(timeout)
+
+
+def stop(timeout=5.0):
+    """Write out pending searches and stop this process's writer; the next search starts a new one"""
+    with _writers_lock:
+        writer = _writers.pop(os.getpid(), None)
+    if writer is not None:
+        writer.stop(timeout)
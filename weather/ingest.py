@@ -0,0 +1,153 @@
+"""Validation and batched upserts for bulk WeatherRecord writes.
+
+Bulk writes bypass ``WeatherRecord.save`` and the model signals, so callers
+finish by sending ``weather_records_bulk_saved`` with the cities they touched
+(``upsert_batches`` does this for them).
+"""
+import csv
+import gzip
+import io
+import json
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .models import WeatherRecord
+from .signals import weather_records_bulk_saved
+
+INGEST_FIELDS = [
+    'city', 'date', 'temp_high', 'temp_low', 'temp_avg',
+    'precipitation', 'humidity', 'wind_speed', 'condition',
+]
+UNIQUE_FIELDS = ['city', 'date']
+UPDATE_FIELDS = [name for name in INGEST_FIELDS if name not in UNIQUE_FIELDS]
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def build_record(row):
+    """Validate a mapping of raw values and return an unsaved WeatherRecord.
+
+    Values are converted and checked with the model fields' own validators.
+    Raises ValidationError listing every invalid field.
+    """
+    if not isinstance(row, dict):
+        raise ValidationError('Expected a mapping of field names to values.')
+
+    values = {}
+    errors = {}
+    for name in INGEST_FIELDS:
+        field = WeatherRecord._meta.get_field(name)
+        raw = row.get(name)
+        if raw == '':
+            raw = None
+        try:
+            values[name] = field.clean(raw, None)
+        except ValidationError as e:
+            errors[name] = e.messages
+    if errors:
+        raise ValidationError(errors)
+
+    record = WeatherRecord(**values)
+    record.fill_temp_avg()
+    return record
+
+
+def upsert_records(records):
+    """Insert or update ``records`` keyed on (city, date) in one transaction.
+
+    Returns the set of cities written. Later duplicates of a (city, date)
+    within the batch win.
+    """
+    unique = {(record.city, record.date): record for record in records}
+    if not unique:
+        return set()
+    with transaction.atomic():
+        WeatherRecord.objects.bulk_create(
+            unique.values(),
+            update_conflicts=True,
+            unique_fields=UNIQUE_FIELDS,
+            update_fields=UPDATE_FIELDS,
+        )
+    return {city for city, _ in unique}
+
+
+def upsert_batches(rows, batch_size=DEFAULT_BATCH_SIZE, on_error=None, on_batch=None,
+                   build=build_record, upsert=upsert_records):
+    """Validate and upsert an iterable of raw row mappings in batches.
+
+    Only one batch is held in memory at a time. ``on_error(index, error)`` is
+    called for rows that fail validation and ``on_batch(written)`` after each
+    committed batch. ``build`` and ``upsert`` default to WeatherRecord rows;
+    pass ``observations.build_observation`` and ``observations.write`` for
+    timestamped readings. Returns ``(accepted, rejected)`` counts.
+    """
+    accepted = rejected = 0
+    cities = set()
+    rows = enumerate(rows, start=1)
+    try:
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                break
+            batch = []
+            for index, row in chunk:
+                try:
+                    batch.append(build(row))
+                except ValidationError as e:
+                    rejected += 1
+                    if on_error:
+                        on_error(index, e)
+            cities |= upsert(batch)
+            accepted += len(batch)
+            if on_batch:
+                on_batch(len(batch))
+    finally:
+        if cities:
+            weather_records_bulk_saved.send(sender=WeatherRecord, cities=cities)
+    return accepted, rejected
+
+
+def open_text(path):
+    """Open ``path`` for reading as text, transparently un-gzipping ``.gz`` files"""
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def read_csv(stream):
+    """Yield one dict per CSV row; the header row names the fields"""
+    yield from csv.DictReader(stream)
+
+
+def read_ndjson(stream):
+    """Yield one dict per non-blank line of newline-delimited JSON"""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            # Rejected by build_record like any other malformed row
+            yield None
+
+
+READERS = {
+    'csv': read_csv,
+    'ndjson': read_ndjson,
+}
+FORMAT_EXTENSIONS = {
+    'csv': ('.csv',),
+    'ndjson': ('.ndjson', '.jsonl'),
+}
+
+
+def detect_format(path):
+    """Return the READERS format for ``path`` from its extension (ignoring ``.gz``); raises ValueError"""
+    name = path[:-3] if path.endswith('.gz') else path
+    for fmt, extensions in FORMAT_EXTENSIONS.items():
+        if name.endswith(extensions):
+            return fmt
+    raise ValueError(f'Cannot detect the format of {path}; pass --format')
@@ -0,0 +1,147 @@
+"""Per-request timing of database, template and upstream HTTP work.
+
+``RequestMetrics`` for the current request live in a context variable, so
+they follow the request into ``sync_to_async`` threads and async views.
+Every database connection gets ``query_wrapper`` as a permanent execute
+wrapper when it is opened. Outside an instrumented request it only does a
+context-variable lookup. Template rendering is timed by wrapping the Django
+template backend once, and upstream calls mark themselves with ``timed``.
+
+``weather.middleware.request_timing_middleware`` turns the metrics into a
+``Server-Timing`` header and slow-request log entries.
+"""
+import contextvars
+import re
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+_current = contextvars.ContextVar('weather_request_metrics', default=None)
+
+_IN_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)+\s*\)')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = None
+        self.timings = {'db': 0.0, 'template': 0.0, 'upstream': 0.0}
+        self.query_count = 0
+        self.statements = {}  # sql -> [calls, total seconds, slowest call]
+
+    def add(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def record_query(self, sql, seconds):
+        self.timings['db'] += seconds
+        self.query_count += 1
+        stats = self.statements.get(sql)
+        if stats is None:
+            self.statements[sql] = [1, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            if seconds > stats[2]:
+                stats[2] = seconds
+
+    def stop(self):
+        self.duration = time.perf_counter() - self.started
+        return self.duration
+
+    def query_shapes(self):
+        """Statements grouped by SQL shape, most total time first"""
+        shapes = {}
+        for sql, (calls, total, slowest) in self.statements.items():
+            shape = normalize_sql(sql)
+            entry = shapes.setdefault(shape, {'sql': shape, 'calls': 0, 'total': 0.0, 'slowest': 0.0})
+            entry['calls'] += calls
+            entry['total'] += total
+            entry['slowest'] = max(entry['slowest'], slowest)
+        return sorted(shapes.values(), key=lambda entry: entry['total'], reverse=True)
+
+    def server_timing(self):
+        parts = [f'db;dur={self.timings["db"] * 1000:.1f};desc="{self.query_count} queries"']
+        for name, label in (('template', 'tpl'), ('upstream', 'upstream')):
+            if self.timings[name]:
+                parts.append(f'{label};dur={self.timings[name] * 1000:.1f}')
+        if self.duration is not None:
+            parts.append(f'total;dur={self.duration * 1000:.1f}')
+        return ', '.join(parts)
+
+
+def normalize_sql(sql):
+    """Reduce a statement to its shape: literals and IN-list lengths removed"""
+    sql = _IN_LIST.sub('(...)', sql)
+    sql = _STRING.sub('?', sql)
+    return _NUMBER.sub('?', sql)
+
+
+def current():
+    return _current.get()
+
+
+def start():
+    """Begin collecting metrics for a request; returns ``(metrics, token)``"""
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def finish(token):
+    _current.reset(token)
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to ``name`` for the current request"""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(name, time.perf_counter() - started)
+
+
+def query_wrapper(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, time.perf_counter() - started)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """``connection_created`` handler installing ``query_wrapper`` once per connection"""
+    if query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_wrapper)
+
+
+def install_template_timing():
+    """Time Django template rendering, excluding queries run while rendering"""
+    from django.template.backends.django import Template
+
+    if getattr(Template.render, 'timed', False):
+        return
+    original = Template.render
+
+    @wraps(original)
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return original(self, context, request)
+        started = time.perf_counter()
+        db_before = metrics.timings['db']
+        try:
+            return original(self, context, request)
+        finally:
+            metrics.add('template', time.perf_counter() - started - (metrics.timings['db'] - db_before))
+
+    render.timed = True
+    Template.render = render
@@ -0,0 +1,65 @@
+"""Latest-observation-per-city snapshot maintenance.
+
+``LatestWeather`` holds one row per city pointing at its most recent
+``WeatherRecord``. Single saves keep it current through the signal handlers in
+``weather.signals``; bulk writers (which bypass model signals) send
+``weather_records_bulk_saved``, which calls ``refresh_cities``.
+"""
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from .models import LatestWeather, WeatherRecord
+
+
+def latest_records():
+    """Return the latest WeatherRecord of every city, newest first, in one query."""
+    snapshots = LatestWeather.objects.select_related('record').order_by('-date', 'city')
+    return [snapshot.record for snapshot in snapshots]
+
+
+def record_saved(record):
+    """Update the snapshot after ``record`` was inserted or corrected."""
+    # The record may have been the latest of its city before a city/date correction
+    moved = LatestWeather.objects.filter(record=record).exclude(city=record.city, date=record.date)
+    stale_cities = list(moved.values_list('city', flat=True))
+
+    current = LatestWeather.objects.filter(city=record.city).first()
+    if current is None or record.date >= current.date or current.record_id == record.pk:
+        if record.city not in stale_cities:
+            stale_cities.append(record.city)
+
+    if stale_cities:
+        refresh_cities(stale_cities)
+
+
+def record_deleted(record):
+    """Re-point the snapshot of ``record.city`` if its latest record was deleted."""
+    # Deleting the latest record cascades to its snapshot row
+    if not LatestWeather.objects.filter(city=record.city).exists():
+        refresh_cities([record.city])
+
+
+def refresh_cities(cities=None):
+    """Rebuild the snapshot rows for ``cities`` (all cities when None).
+
+    Runs a fixed number of queries regardless of how many cities are refreshed.
+    """
+    records = WeatherRecord.objects.all()
+    snapshots = LatestWeather.objects.all()
+    if cities is not None:
+        cities = set(cities)
+        if not cities:
+            return
+        records = records.filter(city__in=cities)
+        snapshots = snapshots.filter(city__in=cities)
+
+    newest_date = WeatherRecord.objects.filter(city=OuterRef('city')).order_by('-date').values('date')[:1]
+    latest = records.filter(date=Subquery(newest_date)).order_by().only('id', 'city', 'date')
+
+    with transaction.atomic():
+        # Clear the affected rows first so re-pointing never trips the one-to-one constraint
+        snapshots.delete()
+        LatestWeather.objects.bulk_create([
+            LatestWeather(city=record.city, date=record.date, record=record)
+            for record in latest
+        ])
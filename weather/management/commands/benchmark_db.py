@@ -0,0 +1,154 @@
+import multiprocessing
+import statistics
+import time
+import uuid
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+
+from weather.ingest import upsert_batches
+from weather.models import CityDataVersion, LatestWeather, WeatherRecord
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure read throughput of the analytics and API views, alone and while a writer '
+        'ingests records concurrently. Run it once per WEATHER_DB_PROFILE to compare profiles.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=5.0, help='Seconds per phase (default: 5)')
+        parser.add_argument('--readers', type=int, default=4, help='Reader processes (default: 4)')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Records the writer upserts per transaction (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        if options['duration'] <= 0 or min(options['readers'], options['batch_size']) < 1:
+            raise CommandError('--duration, --readers and --batch-size must be positive')
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError('benchmark_db needs the fork start method')
+        city = LatestWeather.objects.order_by('city').values_list('city', flat=True).first()
+        if city is None:
+            raise CommandError('No weather records to read; load some data first')
+
+        paths = [
+            f'/analytics/{city}/',
+            '/comparison/',
+            f'/api/weather/?city={city}&limit=100',
+            f'/api/search/records/?q={city}',
+        ]
+        # Unique per run so the writer never touches real data
+        bench_city = f'bench-{uuid.uuid4().hex[:8]}'
+
+        with connections['default'].cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+        self.stdout.write(
+            f"profile {settings.WEATHER_DB_PROFILE}: journal_mode={journal_mode}, "
+            f"routers={settings.DATABASE_ROUTERS or 'none'}, {options['readers']} readers"
+        )
+
+        # Page caching would hide the database entirely
+        with override_settings(WEATHER_PAGE_CACHE_ENABLED=False, ALLOWED_HOSTS=['testserver']):
+            try:
+                self.report('reads only', self.run_phase(paths, options, None), writer=False)
+                self.report('reads during ingest', self.run_phase(paths, options, bench_city), writer=True)
+            finally:
+                WeatherRecord.objects.filter(city=bench_city).delete()
+                CityDataVersion.objects.filter(city=bench_city).delete()
+
+    def run_phase(self, paths, options, writer_city):
+        # Worker processes, like a pre-fork server, so they contend on SQLite locks rather than the GIL
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        results = context.Queue()
+        written = context.Value('i', 0)
+        failed = context.Value('i', 0)
+        workers = [context.Process(target=read, args=(paths, i, stop, results)) for i in range(options['readers'])]
+        if writer_city:
+            workers.append(
+                context.Process(target=write, args=(writer_city, options['batch_size'], stop, written, failed))
+            )
+
+        connections.close_all()  # Children must not inherit open SQLite handles
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        time.sleep(options['duration'])
+        stop.set()
+        latencies = []
+        for _ in range(options['readers']):
+            latencies.extend(results.get())
+        for worker in workers:
+            worker.join()
+        result = self.summarize(latencies, time.perf_counter() - started)
+        result['writes'] = {'rows': written.value, 'errors': failed.value}
+        return result
+
+    def summarize(self, results, elapsed):
+        latencies = sorted(latency for latency, _ in results) or [0.0]
+        return {
+            'elapsed': elapsed,
+            'requests': len(results),
+            'errors': sum(1 for _, status in results if status != 200),
+            'p50': statistics.median(latencies),
+            'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            'rate': len(results) / elapsed if elapsed else 0,
+        }
+
+    def report(self, label, result, writer):
+        line = (
+            f"{label}: {result['rate']:.1f} req/s, p50 {result['p50'] * 1000:.0f} ms, "
+            f"p95 {result['p95'] * 1000:.0f} ms, {result['errors']} errors"
+        )
+        if writer:
+            writes = result['writes']
+            line += (
+                f"; writer {writes['rows'] / result['elapsed']:.0f} rows/s, "
+                f"{writes['errors']} failed batches"
+            )
+        self.stdout.write(line)
+
+
+def read(paths, offset, stop, results):
+    client = Client(raise_request_exception=False)
+    latencies = []
+    i = offset
+    try:
+        while not stop.is_set():
+            started = time.perf_counter()
+            response = client.get(paths[i % len(paths)])
+            latencies.append((time.perf_counter() - started, response.status_code))
+            i += 1
+    finally:
+        connections.close_all()
+        results.put(latencies)
+
+
+def write(city, batch_size, stop, written, failed):
+    # Rewrites the same window of days so the table does not grow during the run
+    start = date.today() - timedelta(days=batch_size)
+    rows = [
+        {'city': city, 'date': (start + timedelta(days=i)).isoformat(),
+         'temp_high': 20.0, 'temp_low': 10.0, 'condition': 'sunny'}
+        for i in range(batch_size)
+    ]
+    n = 0
+    try:
+        while not stop.is_set():
+            for row in rows:
+                row['temp_high'] = 20.0 + n % 10
+            try:
+                accepted, _ = upsert_batches(rows, batch_size=batch_size)
+                written.value += accepted
+            except Exception:
+                failed.value += 1
+            n += 1
+    finally:
+        connections.close_all()
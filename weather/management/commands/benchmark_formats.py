@@ -0,0 +1,72 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils.text import compress_string
+
+from weather.models import WeatherRecord
+from weather.pagination import API_RECORD_FIELDS, keyset_page
+from weather.renderers import encode, shape
+from weather.views import MAX_PAGE_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare payload size and serialization time of the API response formats on records '
+        'from the database, both for the encoders alone and through /api/weather/'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=MAX_PAGE_SIZE,
+                            help=f'Records per payload (default: {MAX_PAGE_SIZE}, the largest API page)')
+        parser.add_argument('--repeat', type=int, default=50, help='Timed runs per format (default: 50)')
+
+    def handle(self, *args, **options):
+        if options['records'] < 1 or options['repeat'] < 1:
+            raise CommandError('--records and --repeat must be at least 1')
+        records, _ = keyset_page(WeatherRecord.objects.all(), options['records'])
+        if not records:
+            raise CommandError('No weather records to serialize; load or generate some data first')
+        repeat = options['repeat']
+
+        self.stdout.write(f'{len(records)} records, median of {repeat} runs')
+        encoders = {
+            'stdlib json, rows (JsonResponse)': lambda: json.dumps({'records': records}, cls=DjangoJSONEncoder).encode(),
+            'orjson, rows': lambda: encode({'records': shape(records, 'json', API_RECORD_FIELDS)}, 'json'),
+            'orjson, columnar': lambda: encode({'records': shape(records, 'columnar', API_RECORD_FIELDS)}, 'columnar'),
+            'msgpack, columnar': lambda: encode({'records': shape(records, 'msgpack', API_RECORD_FIELDS)}, 'msgpack'),
+        }
+        baseline = None
+        for label, encoder in encoders.items():
+            body = encoder()
+            seconds = self.median_time(encoder, repeat)
+            compressed = compress_string(body)
+            baseline = baseline or (len(body), seconds)
+            self.stdout.write(
+                f'  {label:34} {len(body):>9,} B ({len(body) / baseline[0]:4.0%}), '
+                f'gzip {len(compressed):>8,} B, encode {seconds * 1000:7.2f} ms ({baseline[1] / seconds:4.1f}x)'
+            )
+
+        self.stdout.write('Through /api/weather/ with Accept-Encoding: gzip')
+        client = Client(HTTP_ACCEPT_ENCODING='gzip')
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for fmt in ('json', 'columnar', 'msgpack'):
+                params = {'limit': len(records), 'format': fmt}
+                response = client.get('/api/weather/', params)
+                seconds = self.median_time(lambda: client.get('/api/weather/', params), repeat)
+                self.stdout.write(
+                    f"  {fmt:9} {response.status_code} {len(response.content):>9,} B on the wire "
+                    f"({response.get('Content-Encoding', 'identity')}), {seconds * 1000:7.2f} ms per request"
+                )
+
+    def median_time(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings)
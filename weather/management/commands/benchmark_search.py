@@ -0,0 +1,112 @@
+import asyncio
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from weather import history, openweather
+from weather.fake_openweather import FakeOpenWeatherServer
+from weather.models import SearchHistory
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the sync and async location search endpoints against a local fake '
+        'OpenWeather server. Every lookup is a cache miss so each one waits on the upstream.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Searches per endpoint (default: 200)')
+        parser.add_argument(
+            '--concurrency', type=int, default=100,
+            help='Concurrent searches in flight against the async endpoint (default: 100)',
+        )
+        parser.add_argument(
+            '--sync-workers', type=int, default=8,
+            help='Worker threads serving the sync endpoint, like a WSGI pool (default: 8)',
+        )
+        parser.add_argument(
+            '--latency', type=float, default=0.2,
+            help='Seconds the fake upstream waits before answering (default: 0.2)',
+        )
+
+    def handle(self, *args, **options):
+        if min(options['requests'], options['concurrency'], options['sync_workers']) < 1:
+            raise CommandError('--requests, --concurrency and --sync-workers must be at least 1')
+
+        # Unique per run so every search misses both the database and the client cache
+        prefix = f'bench-{uuid.uuid4().hex[:8]}'
+        locations = [f'{prefix}-{i}' for i in range(options['requests'])]
+
+        with FakeOpenWeatherServer(latency=options['latency']) as server, \
+                override_settings(OPENWEATHER_BASE_URL=server.url, ALLOWED_HOSTS=['testserver']):
+            openweather.reset_clients()
+            try:
+                sync_result = self.run_sync([f'{name}-sync' for name in locations], options['sync_workers'])
+                async_result = asyncio.run(
+                    self.run_async([f'{name}-async' for name in locations], options['concurrency'])
+                )
+            finally:
+                openweather.reset_clients()
+                history.flush()
+                SearchHistory.objects.filter(location__startswith=prefix).delete()
+
+        self.stdout.write(
+            f"{options['requests']} searches per endpoint, upstream latency {options['latency'] * 1000:.0f} ms"
+        )
+        self.report(f"sync  ({options['sync_workers']} worker threads)", sync_result)
+        self.report(f"async ({options['concurrency']} concurrent)", async_result)
+        if sync_result['elapsed'] and async_result['elapsed']:
+            self.stdout.write(
+                self.style.SUCCESS(f"async throughput: {sync_result['elapsed'] / async_result['elapsed']:.1f}x sync")
+            )
+
+    def run_sync(self, locations, workers):
+        def search(location):
+            started = time.perf_counter()
+            try:
+                response = Client().get('/api/search/', {'location': location})
+                return time.perf_counter() - started, response.status_code
+            finally:
+                close_old_connections()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(search, locations))
+        return self.summarize(results, time.perf_counter() - started)
+
+    async def run_async(self, locations, concurrency):
+        client = AsyncClient()
+        limit = asyncio.Semaphore(concurrency)
+
+        async def search(location):
+            async with limit:
+                started = time.perf_counter()
+                response = await client.get('/api/search/async/', {'location': location})
+                return time.perf_counter() - started, response.status_code
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(search(location) for location in locations))
+        return self.summarize(results, time.perf_counter() - started)
+
+    def summarize(self, results, elapsed):
+        latencies = sorted(latency for latency, _ in results)
+        return {
+            'elapsed': elapsed,
+            'errors': sum(1 for _, status in results if status != 200),
+            'p50': statistics.median(latencies),
+            'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            'rate': len(results) / elapsed if elapsed else 0,
+        }
+
+    def report(self, label, result):
+        self.stdout.write(
+            f"{label}: {result['elapsed']:.2f}s total, {result['rate']:.1f} req/s, "
+            f"p50 {result['p50'] * 1000:.0f} ms, p95 {result['p95'] * 1000:.0f} ms, "
+            f"{result['errors']} errors"
+        )
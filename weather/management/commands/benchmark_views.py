@@ -0,0 +1,95 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from weather import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark every view in weather_site/urls.py against throwaway synthetic databases of '
+        'several sizes, reporting latency percentiles and SQL query counts per view; '
+        'fails if any view raises or answers with a non-2xx status'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='10x1,50x2,200x5',
+            help='Comma-separated CITIESxYEARS dataset sizes (default: 10x1,50x2,200x5)',
+        )
+        parser.add_argument('--repeat', type=int, default=20, help='Warm requests per view (default: 20)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the datasets (default: 0)')
+        parser.add_argument(
+            '--page-cache', action='store_true',
+            help='Leave the versioned page cache on (off by default so views are measured, not the cache)',
+        )
+        parser.add_argument('--output', help='Write the JSON results to this file ("-" for stdout)')
+        parser.add_argument('--compare', metavar='BASELINE', help='JSON results of an earlier run to compare against')
+        parser.add_argument(
+            '--threshold', type=float, default=1.25,
+            help='Flag views whose p50 grew by more than this factor against --compare (default: 1.25)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = benchmarks.parse_sizes(options['sizes'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read {options['compare']}: {e}")
+
+        # Progress goes to stderr when the JSON document takes stdout
+        out = self.stderr if options['output'] == '-' else self.stdout
+        document = benchmarks.run(
+            sizes,
+            repeat=options['repeat'],
+            seed=options['seed'],
+            page_cache=options['page_cache'],
+            on_size=lambda result: self.report(out, result),
+        )
+
+        if options['output'] == '-':
+            self.stdout.write(json.dumps(document, indent=2))
+        elif options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(document, f, indent=2)
+            out.write(f"Results written to {options['output']}")
+        if baseline:
+            self.report_comparison(out, baseline, document, options['threshold'])
+
+        failed = list(benchmarks.failures(document))
+        if failed:
+            raise CommandError(f'{len(failed)} view requests failed: ' + ', '.join(
+                f'{name} ({cities}x{years:g}, status {view["status"]})' for (cities, years), name, view in failed
+            ))
+
+    def report(self, out, result):
+        out.write(
+            f"\n{result['cities']} cities x {result['years']:g} years: {result['records']} records "
+            f"(generated in {result['generate_seconds']:.1f}s)"
+        )
+        out.write(f"  {'view':<24} {'status':>6} {'cold':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'queries':>8}")
+        for name, view in result['views'].items():
+            if 'skipped' in view:
+                out.write(f"  {name:<24} skipped: {view['skipped']}")
+                continue
+            if 'error' in view:
+                out.write(self.style.ERROR(f"  {name:<24} {view['status']:>6} FAILED: {view['error']}"))
+                continue
+            out.write(
+                f"  {name:<24} {view['status']:>6} {view['cold_ms']:>7.1f}ms {view['p50_ms']:>7.1f}ms "
+                f"{view['p95_ms']:>7.1f}ms {view['p99_ms']:>7.1f}ms {view['queries']:>8g}"
+            )
+
+    def report_comparison(self, out, baseline, document, threshold):
+        out.write(f"\np50 against {baseline['meta'].get('commit') or 'baseline'}:")
+        for (cities, years), name, before, after, ratio in benchmarks.compare(baseline, document):
+            line = f"  {cities}x{years:g} {name:<24} {before:>7.1f}ms -> {after:>7.1f}ms ({ratio:.2f}x)"
+            out.write(self.style.ERROR(line) if ratio > threshold else line)
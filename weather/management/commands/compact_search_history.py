@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from weather import searchstats
+
+
+class Command(BaseCommand):
+    help = 'Roll SearchHistory up into hourly/daily counts and purge rows past their retention windows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int,
+                            help='Days of raw searches to keep (default: SEARCH_HISTORY_RETENTION_DAYS)')
+        parser.add_argument('--hourly-retention-days', type=int,
+                            help='Days of hourly counts to keep (default: SEARCH_ROLLUP_HOURLY_RETENTION_DAYS)')
+        parser.add_argument('--daily-retention-days', type=int,
+                            help='Days of daily counts to keep (default: SEARCH_ROLLUP_DAILY_RETENTION_DAYS)')
+
+    def handle(self, *args, **options):
+        stats = searchstats.compact(
+            retention_days=options['retention_days'],
+            hourly_retention_days=options['hourly_retention_days'],
+            daily_retention_days=options['daily_retention_days'],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Compacted {stats['searches']} searches over {stats['hours']} hours "
+                f"(up to {stats['compacted_until']:%Y-%m-%d %H:%M %Z}); purged {stats['purged_searches']} searches, "
+                f"{stats['purged_hourly']} hourly and {stats['purged_daily']} daily rows"
+            )
+        )
@@ -0,0 +1,61 @@
+import sys
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from weather import export
+
+
+class Command(BaseCommand):
+    help = 'Stream WeatherRecord rows to a CSV, gzipped CSV or Parquet file in constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Output file, or '-' for standard output")
+        parser.add_argument('--format', choices=list(export.FORMATS),
+                            help='Output format (default: from the file extension, else csv)')
+        parser.add_argument('--cities', help='Comma-separated cities to export (default: all)')
+        parser.add_argument('--start', type=date.fromisoformat, help='First date to export (YYYY-MM-DD)')
+        parser.add_argument('--end', type=date.fromisoformat, help='Last date to export (YYYY-MM-DD)')
+        parser.add_argument('--chunk-size', type=int, default=export.CHUNK_SIZE,
+                            help=f'Rows read from the database at a time (default: {export.CHUNK_SIZE})')
+        parser.add_argument('--row-group-size', type=int, default=export.ROW_GROUP_SIZE,
+                            help=f'Rows per Parquet row group (default: {export.ROW_GROUP_SIZE})')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or self.format_for(options['output'])
+        if fmt == 'parquet' and not export.parquet_available():
+            raise CommandError('Parquet export requires the pyarrow package')
+        if min(options['chunk_size'], options['row_group_size']) < 1:
+            raise CommandError('--chunk-size and --row-group-size must be at least 1')
+
+        cities = [city.strip() for city in (options['cities'] or '').split(',') if city.strip()]
+        records = export.export_queryset(cities, options['start'], options['end'])
+        rows = export.RowCounter(export.iter_rows(records, options['chunk_size']))
+        chunks = export.stream(rows, fmt, options['chunk_size'], options['row_group_size'])
+
+        started = time.perf_counter()
+        written = 0
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        elapsed = time.perf_counter() - started
+
+        # Keep standard output clean when the export itself goes there
+        self.stderr.write(
+            self.style.SUCCESS(
+                f'Exported {rows.count} rows as {fmt} ({written / 1e6:.1f} MB) in {elapsed:.2f}s '
+                f'({rows.count / elapsed if elapsed else 0:,.0f} rows/s)'
+            )
+        )
+
+    def format_for(self, output):
+        for fmt, (_, extension) in sorted(export.FORMATS.items(), key=lambda item: -len(item[1][1])):
+            if output.endswith(f'.{extension}'):
+                return fmt
+        return 'csv'
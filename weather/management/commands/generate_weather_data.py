@@ -0,0 +1,52 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from weather.ingest import DEFAULT_BATCH_SIZE
+from weather.synthetic import DEFAULT_PREFIX, generate
+
+
+class Command(BaseCommand):
+    help = 'Bulk insert seeded synthetic daily weather history for any number of cities and years'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cities', type=int, default=100, help='Number of cities (default: 100)')
+        parser.add_argument('--years', type=float, default=5, help='Years of daily records per city (default: 5)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+        parser.add_argument('--end', type=date.fromisoformat, help='Last date generated (default: today)')
+        parser.add_argument(
+            '--prefix', default=DEFAULT_PREFIX,
+            help=f'City name prefix, e.g. "{DEFAULT_PREFIX} 001" (default: {DEFAULT_PREFIX})',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+            help=f'Rows written per transaction (default: {DEFAULT_BATCH_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        if options['cities'] < 1 or options['years'] <= 0 or options['batch_size'] < 1:
+            raise CommandError('--cities, --years and --batch-size must be positive')
+
+        def report_city(city, rows):
+            if options['verbosity'] >= 2:
+                self.stdout.write(f'{city}: {rows} rows')
+
+        started = time.perf_counter()
+        written = generate(
+            options['cities'],
+            options['years'],
+            seed=options['seed'],
+            end=options['end'],
+            prefix=options['prefix'],
+            batch_size=options['batch_size'],
+            on_city=report_city,
+        )
+
+        elapsed = time.perf_counter() - started
+        rate = written / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated {written} records for {options['cities']} cities in {elapsed:.1f}s ({rate:.0f} rows/s)"
+            )
+        )
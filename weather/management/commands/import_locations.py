@@ -0,0 +1,69 @@
+import time
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from weather import geo
+from weather.ingest import DEFAULT_BATCH_SIZE, READERS, detect_format, open_text
+
+
+class Command(BaseCommand):
+    help = 'Load city coordinates (city, latitude, longitude) from CSV or NDJSON files for nearest-city lookups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='CSV or NDJSON files (optionally .gz compressed)')
+        parser.add_argument(
+            '--format',
+            choices=sorted(READERS),
+            help='Input format; detected from the file extension when omitted',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Rows written per transaction (default: {DEFAULT_BATCH_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        total_written = total_rejected = 0
+        started = time.perf_counter()
+        for path in options['paths']:
+            try:
+                reader = READERS[options['format'] or detect_format(path)]
+            except ValueError as e:
+                raise CommandError(str(e))
+            try:
+                stream = open_text(path)
+            except OSError as e:
+                raise CommandError(f'Cannot open {path}: {e}')
+
+            written = rejected = 0
+            with stream:
+                rows = enumerate(reader(stream), start=1)
+                while True:
+                    chunk = list(islice(rows, options['batch_size']))
+                    if not chunk:
+                        break
+                    batch = []
+                    for index, row in chunk:
+                        try:
+                            batch.append(geo.location_row(row))
+                        except ValidationError as e:
+                            rejected += 1
+                            if options['verbosity'] >= 2:
+                                self.stderr.write(f'{path}:{index}: {"; ".join(e.messages)}')
+                    written += geo.upsert_locations(batch)
+            total_written += written
+            total_rejected += rejected
+            self.stdout.write(f'{path}: {written} locations upserted, {rejected} rejected')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Upserted {total_written} locations ({total_rejected} rejected) in {elapsed:.2f}s'
+            )
+        )
@@ -0,0 +1,78 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from weather import observations
+from weather.ingest import DEFAULT_BATCH_SIZE, READERS, detect_format, open_text, upsert_batches
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream weather records from CSV or NDJSON files and bulk upsert them by (city, date), '
+        'or timestamped observations with --observations'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='CSV or NDJSON files (optionally .gz compressed)')
+        parser.add_argument(
+            '--format',
+            choices=sorted(READERS),
+            help='Input format; detected from the file extension when omitted',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Rows written per transaction (default: {DEFAULT_BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--observations',
+            action='store_true',
+            help='Rows are timestamped observations (city, observed_at, temperature, ...); '
+                 'each day they cover is aggregated into its daily weather record',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        kind = 'observations' if options['observations'] else 'weather records'
+        writers = {}
+        if options['observations']:
+            writers = {'build': observations.build_observation, 'upsert': observations.write}
+        total_accepted = total_rejected = 0
+        started = time.perf_counter()
+
+        for path in options['paths']:
+            try:
+                reader = READERS[options['format'] or detect_format(path)]
+            except ValueError as e:
+                raise CommandError(str(e))
+            try:
+                stream = open_text(path)
+            except OSError as e:
+                raise CommandError(f'Cannot open {path}: {e}')
+
+            def report_error(index, error, path=path):
+                if options['verbosity'] >= 2:
+                    self.stderr.write(f'{path}:{index}: {"; ".join(error.messages)}')
+
+            with stream:
+                accepted, rejected = upsert_batches(
+                    reader(stream),
+                    batch_size=options['batch_size'],
+                    on_error=report_error,
+                    **writers,
+                )
+            total_accepted += accepted
+            total_rejected += rejected
+            self.stdout.write(f'{path}: {accepted} rows upserted, {rejected} rejected')
+
+        elapsed = time.perf_counter() - started
+        rate = total_accepted / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Upserted {total_accepted} {kind} ({total_rejected} rejected) '
+                f'in {elapsed:.2f}s ({rate:,.0f} rows/sec)'
+            )
+        )
@@ -0,0 +1,75 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test.utils import override_settings
+
+from weather import history, openweather, prefetch
+from weather.fake_openweather import FakeOpenWeatherServer
+
+
+class Command(BaseCommand):
+    help = (
+        'Fetch the most searched locations that only OpenWeather can answer and store '
+        "today's WeatherRecord for each, so repeat searches are served from the database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=settings.OPENWEATHER_PREFETCH_LOCATIONS,
+                            help='Locations fetched per run (default: OPENWEATHER_PREFETCH_LOCATIONS)')
+        parser.add_argument('--days', type=int, default=settings.OPENWEATHER_PREFETCH_WINDOW_DAYS,
+                            help='Days of search history ranked (default: OPENWEATHER_PREFETCH_WINDOW_DAYS)')
+        parser.add_argument('--workers', type=int, default=settings.OPENWEATHER_PREFETCH_WORKERS,
+                            help='Concurrent upstream calls (default: OPENWEATHER_PREFETCH_WORKERS)')
+        parser.add_argument('--rate', type=float, default=settings.OPENWEATHER_PREFETCH_RATE,
+                            help='Upstream calls per second (default: OPENWEATHER_PREFETCH_RATE)')
+        parser.add_argument('--burst', type=int, default=settings.OPENWEATHER_PREFETCH_BURST,
+                            help='Calls allowed back to back before the rate applies (default: OPENWEATHER_PREFETCH_BURST)')
+        parser.add_argument('--interval', type=float,
+                            help='Keep running, starting a new run this many seconds after the last one ended')
+        parser.add_argument('--fake-api', action='store_true',
+                            help='Fetch from a local fake OpenWeather server instead of the real API')
+        parser.add_argument('--fake-latency', type=float, default=0.2,
+                            help='Seconds the fake server waits before answering (default: 0.2)')
+
+    def handle(self, *args, **options):
+        if min(options['limit'], options['days'], options['workers'], options['burst']) < 1 or options['rate'] <= 0:
+            raise CommandError('--limit, --days, --workers and --burst must be at least 1 and --rate positive')
+
+        with ExitStack() as stack:
+            if options['fake_api']:
+                server = stack.enter_context(FakeOpenWeatherServer(latency=options['fake_latency']))
+                stack.enter_context(override_settings(OPENWEATHER_BASE_URL=server.url))
+                openweather.reset_clients()
+                stack.callback(openweather.reset_clients)
+            # Make sure searches made just before this run are counted
+            history.flush()
+
+            while True:
+                stats = prefetch.run(
+                    limit=options['limit'],
+                    days=options['days'],
+                    workers=options['workers'],
+                    rate=options['rate'],
+                    burst=options['burst'],
+                )
+                self.report(stats)
+                if options['interval'] is None:
+                    break
+                close_old_connections()
+                time.sleep(options['interval'])
+
+    def report(self, stats):
+        if not stats['locations']:
+            self.stdout.write('No missing locations to prefetch')
+            return
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Prefetched {stats['locations']} locations in {stats['elapsed']:.2f}s "
+                f"({stats['rate']:.1f} fetches/s, p50 {stats['p50'] * 1000:.0f} ms, "
+                f"p95 {stats['p95'] * 1000:.0f} ms): {stats['written']} written, "
+                f"{stats['located']} located, {stats['not_found']} not found, {stats['errors']} errors"
+            )
+        )
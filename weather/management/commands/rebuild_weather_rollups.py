@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from weather import latest, rollups, scoring, versions
+from weather.models import MonthlyWeatherRollup, RollingWeatherRollup, WeatherRecord
+
+
+class Command(BaseCommand):
+    help = 'Recompute the latest-per-city snapshot, the monthly/rolling weather rollups and user scores from raw records'
+
+    def handle(self, *args, **options):
+        latest.refresh_cities()
+        rollups.rebuild()
+        scoring.rebuild()
+        # Direct edits bypass the signals, so expire every cached page and ETag as well
+        versions.bump(WeatherRecord.objects.order_by().values_list('city', flat=True).distinct())
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Rebuilt {MonthlyWeatherRollup.objects.count()} monthly and '
+                f'{RollingWeatherRollup.objects.count()} rolling rollups'
+            )
+        )
@@ -0,0 +1,24 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from weather.db import copy_database
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database to the WEATHER_DB_REPLICA file served to read-only views'
+
+    def handle(self, *args, **options):
+        if not settings.WEATHER_DB_REPLICA:
+            raise CommandError('WEATHER_DB_REPLICA is not set; the replica reads the primary file directly')
+
+        started = time.perf_counter()
+        copy_database(settings.DATABASES['default']['NAME'], settings.WEATHER_DB_REPLICA)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Copied the primary database to {settings.WEATHER_DB_REPLICA} '
+                f'in {time.perf_counter() - started:.2f}s'
+            )
+        )
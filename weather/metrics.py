@@ -0,0 +1,118 @@
+"""Prometheus metrics for requests, OpenWeather calls, caches, SearchHistory writes and feed ingest.
+
+Metric objects are module-level and updated in place. Each value has its own
+lock, so instrumented code never waits on a registry-wide lock.
+
+Under a multi-process server, set ``PROMETHEUS_MULTIPROC_DIR`` to an empty,
+writable directory in the server's environment before it starts. Each
+worker then writes its samples to its own mmap'd files there, and
+``/metrics`` merges every worker's files at scrape time.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import REGISTRY
+from prometheus_client import multiprocess
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+REQUEST_LATENCY = Histogram(
+    'weather_http_request_duration_seconds',
+    'Time to produce a response, by URL name',
+    ['view', 'method', 'status'],
+)
+REQUEST_QUERIES = Histogram(
+    'weather_http_request_db_queries',
+    'Database queries run per request, by URL name',
+    ['view'],
+    buckets=QUERY_COUNT_BUCKETS,
+)
+DB_QUERIES = Counter('weather_db_queries', 'Database queries run while serving requests', ['view'])
+DB_TIME = Counter('weather_db_time_seconds', 'Time spent in database queries while serving requests', ['view'])
+
+OPENWEATHER_LATENCY = Histogram(
+    'weather_openweather_request_duration_seconds',
+    'OpenWeather upstream call latency',
+    ['client', 'outcome'],
+)
+OPENWEATHER_ERRORS = Counter(
+    'weather_openweather_errors',
+    'OpenWeather upstream calls that raised instead of returning a response',
+    ['client'],
+)
+OPENWEATHER_LOOKUPS = Counter(
+    'weather_openweather_lookups',
+    'OpenWeather client lookups by cache result (hits, negative_hits, misses, coalesced)',
+    ['client', 'result'],
+)
+
+CACHE_LOOKUPS = Counter(
+    'weather_cache_lookups',
+    'Versioned page and fragment cache lookups',
+    ['cache', 'name', 'result'],
+)
+
+SEARCH_HISTORY_ENTRIES = Counter(
+    'weather_search_history_entries',
+    'SearchHistory entries by outcome (queued, written, dropped, failed)',
+    ['outcome'],
+)
+
+INGEST_FEED_ROWS = Counter(
+    'weather_ingest_feed_rows',
+    'Rows received by the NDJSON ingest endpoint by outcome (accepted, rejected)',
+    ['outcome'],
+)
+INGEST_FEED_THROTTLED = Counter(
+    'weather_ingest_feed_throttled',
+    'Ingest requests answered 429 because the write queue was full',
+)
+
+
+def status_class(status_code):
+    return f'{status_code // 100}xx'
+
+
+@contextmanager
+def openweather_call(client):
+    """Time one upstream call; the block sets ``outcome['status']`` to the HTTP status"""
+    outcome = {}
+    started = time.perf_counter()
+    try:
+        yield outcome
+    except Exception:
+        OPENWEATHER_ERRORS.labels(client).inc()
+        OPENWEATHER_LATENCY.labels(client, 'error').observe(time.perf_counter() - started)
+        raise
+    OPENWEATHER_LATENCY.labels(client, status_class(outcome.get('status', 0))).observe(
+        time.perf_counter() - started
+    )
+
+
+def observe_request(request, response, request_metrics):
+    """Record a finished request, labelled by its URL name"""
+    match = getattr(request, 'resolver_match', None)
+    view = (match.view_name if match else None) or 'unmatched'
+    REQUEST_LATENCY.labels(view, request.method, status_class(response.status_code)).observe(
+        request_metrics.duration
+    )
+    REQUEST_QUERIES.labels(view).observe(request_metrics.query_count)
+    if request_metrics.query_count:
+        DB_QUERIES.labels(view).inc(request_metrics.query_count)
+        DB_TIME.labels(view).inc(request_metrics.timings['db'])
+
+
+def registry():
+    """The registry to scrape: every worker's files in multiprocess mode, else this process"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        merged = CollectorRegistry()
+        multiprocess.MultiProcessCollector(merged)
+        return merged
+    return REGISTRY
+
+
+def exposition():
+    """Return ``(body, content_type)`` in the Prometheus text format"""
+    return generate_latest(registry()), CONTENT_TYPE_LATEST
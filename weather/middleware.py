@@ -0,0 +1,84 @@
+import asyncio
+import logging
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.decorators import sync_and_async_middleware
+
+from . import instrumentation
+from .metrics import observe_request
+
+logger = logging.getLogger('weather.requests')
+
+
+@sync_and_async_middleware
+def request_timing_middleware(get_response):
+    """Report database, template and upstream time per request.
+
+    Every response gets a ``Server-Timing`` header and is recorded in the
+    per-URL-name Prometheus metrics (``weather.metrics``). Requests slower than
+    ``REQUEST_TIMING_SLOW_MS``, or repeating one SQL shape at least
+    ``REQUEST_TIMING_REPEATED_QUERIES`` times (an N+1 pattern), are logged
+    to ``weather.requests`` with their most expensive statements.
+    """
+    if not getattr(settings, 'REQUEST_TIMING_ENABLED', True):
+        raise MiddlewareNotUsed
+    instrumentation.install_template_timing()
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            metrics, token = instrumentation.start()
+            try:
+                response = await get_response(request)
+            finally:
+                instrumentation.finish(token)
+            return finish_request(request, response, metrics)
+    else:
+        def middleware(request):
+            metrics, token = instrumentation.start()
+            try:
+                response = get_response(request)
+            finally:
+                instrumentation.finish(token)
+            return finish_request(request, response, metrics)
+
+    return middleware
+
+
+def finish_request(request, response, metrics):
+    # Streaming bodies are produced after this point and are not included
+    metrics.stop()
+    response['Server-Timing'] = metrics.server_timing()
+    observe_request(request, response, metrics)
+    log_request(request, response, metrics)
+    return response
+
+
+def log_request(request, response, metrics):
+    slow = metrics.duration * 1000 >= settings.REQUEST_TIMING_SLOW_MS
+    if not slow and metrics.query_count < settings.REQUEST_TIMING_REPEATED_QUERIES:
+        return
+    shapes = metrics.query_shapes()
+    repeated = [shape for shape in shapes if shape['calls'] >= settings.REQUEST_TIMING_REPEATED_QUERIES]
+    if not slow and not repeated:
+        return
+
+    limit = settings.REQUEST_TIMING_LOGGED_STATEMENTS
+    lines = [
+        f'{"Slow request" if slow else "Repeated queries in"} {request.method} {request.path} '
+        f'{response.status_code} in {metrics.duration * 1000:.1f} ms: '
+        f'db {metrics.timings["db"] * 1000:.1f} ms over {metrics.query_count} queries, '
+        f'template {metrics.timings["template"] * 1000:.1f} ms, '
+        f'upstream {metrics.timings["upstream"] * 1000:.1f} ms'
+    ]
+    for shape in repeated[:limit]:
+        lines.append(
+            f'  possible N+1: {shape["calls"]} calls, {shape["total"] * 1000:.1f} ms: {shape["sql"][:300]}'
+        )
+    if slow:
+        for shape in shapes[:limit]:
+            lines.append(
+                f'  {shape["total"] * 1000:.1f} ms in {shape["calls"]} calls '
+                f'(slowest {shape["slowest"] * 1000:.1f} ms): {shape["sql"][:300]}'
+            )
+    logger.warning('\n'.join(lines))
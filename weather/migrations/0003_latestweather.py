@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def populate_latest_weather(apps, schema_editor):
+    WeatherRecord = apps.get_model("weather", "WeatherRecord")
+    LatestWeather = apps.get_model("weather", "LatestWeather")
+    newest_date = (
+        WeatherRecord.objects.filter(city=OuterRef("city"))
+        .order_by("-date")
+        .values("date")[:1]
+    )
+    latest = WeatherRecord.objects.filter(date=Subquery(newest_date)).order_by()
+    LatestWeather.objects.bulk_create(
+        [
+            LatestWeather(city=record.city, date=record.date, record=record)
+            for record in latest.only("id", "city", "date")
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0002_searchhistory"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LatestWeather",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("city", models.CharField(max_length=100, unique=True)),
+                ("date", models.DateField(db_index=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "record",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="latest_snapshot",
+                        to="weather.weatherrecord",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-date", "city"],
+            },
+        ),
+        migrations.RunPython(populate_latest_weather, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:44
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+
+
+def populate_monthly_rollups(apps, schema_editor):
+    # Rolling rollups are built lazily on first read
+    WeatherRecord = apps.get_model("weather", "WeatherRecord")
+    MonthlyWeatherRollup = apps.get_model("weather", "MonthlyWeatherRollup")
+    aggregates = {
+        "record_count": Count("id"),
+        "temp_high_max": Max("temp_high"),
+        "temp_low_min": Min("temp_low"),
+    }
+    for field in ("temp_avg", "precipitation", "humidity", "wind_speed"):
+        aggregates[f"{field}_sum"] = Coalesce(
+            Sum(field), Value(0.0), output_field=FloatField()
+        )
+        aggregates[f"{field}_count"] = Count(field)
+    grouped = (
+        WeatherRecord.objects.order_by()
+        .annotate(month=TruncMonth("date"))
+        .values("city", "month")
+        .annotate(**aggregates)
+    )
+    MonthlyWeatherRollup.objects.bulk_create(
+        [MonthlyWeatherRollup(**values) for values in grouped]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0003_latestweather"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RollingWeatherRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("record_count", models.IntegerField(default=0)),
+                ("temp_avg_sum", models.FloatField(default=0)),
+                ("temp_avg_count", models.IntegerField(default=0)),
+                ("temp_high_max", models.FloatField(blank=True, null=True)),
+                ("temp_low_min", models.FloatField(blank=True, null=True)),
+                ("precipitation_sum", models.FloatField(default=0)),
+                ("precipitation_count", models.IntegerField(default=0)),
+                ("humidity_sum", models.FloatField(default=0)),
+                ("humidity_count", models.IntegerField(default=0)),
+                ("wind_speed_sum", models.FloatField(default=0)),
+                ("wind_speed_count", models.IntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("city", models.CharField(max_length=100, unique=True)),
+                ("window_start", models.DateField()),
+            ],
+            options={
+                "ordering": ["city"],
+            },
+        ),
+        migrations.CreateModel(
+            name="MonthlyWeatherRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("city", models.CharField(max_length=100)),
+                ("record_count", models.IntegerField(default=0)),
+                ("temp_avg_sum", models.FloatField(default=0)),
+                ("temp_avg_count", models.IntegerField(default=0)),
+                ("temp_high_max", models.FloatField(blank=True, null=True)),
+                ("temp_low_min", models.FloatField(blank=True, null=True)),
+                ("precipitation_sum", models.FloatField(default=0)),
+                ("precipitation_count", models.IntegerField(default=0)),
+                ("humidity_sum", models.FloatField(default=0)),
+                ("humidity_count", models.IntegerField(default=0)),
+                ("wind_speed_sum", models.FloatField(default=0)),
+                ("wind_speed_count", models.IntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("month", models.DateField()),
+            ],
+            options={
+                "ordering": ["city", "-month"],
+                "unique_together": {("city", "month")},
+            },
+        ),
+        migrations.RunPython(populate_monthly_rollups, migrations.RunPython.noop),
+    ]
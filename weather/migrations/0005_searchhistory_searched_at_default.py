@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:52
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0004_weather_rollups"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="searchhistory",
+            name="searched_at",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+    ]
@@ -0,0 +1,66 @@
+from django.db import migrations
+
+# Full-text index over the city names in the latest-per-city snapshot. It is an
+# external-content FTS5 table kept in step by triggers, so every write path
+# that maintains LatestWeather (single saves, deletes, bulk refreshes) also
+# maintains the index. Other database backends fall back to LIKE queries.
+CREATE_INDEX = [
+    """
+    CREATE VIRTUAL TABLE weather_city_fts USING fts5(
+        city,
+        content='weather_latestweather',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER weather_city_fts_insert AFTER INSERT ON weather_latestweather BEGIN
+        INSERT INTO weather_city_fts(rowid, city) VALUES (new.id, new.city);
+    END
+    """,
+    """
+    CREATE TRIGGER weather_city_fts_delete AFTER DELETE ON weather_latestweather BEGIN
+        INSERT INTO weather_city_fts(weather_city_fts, rowid, city) VALUES ('delete', old.id, old.city);
+    END
+    """,
+    """
+    CREATE TRIGGER weather_city_fts_update AFTER UPDATE OF city ON weather_latestweather BEGIN
+        INSERT INTO weather_city_fts(weather_city_fts, rowid, city) VALUES ('delete', old.id, old.city);
+        INSERT INTO weather_city_fts(rowid, city) VALUES (new.id, new.city);
+    END
+    """,
+    "INSERT INTO weather_city_fts(weather_city_fts) VALUES ('rebuild')",
+]
+
+DROP_INDEX = [
+    "DROP TRIGGER IF EXISTS weather_city_fts_update",
+    "DROP TRIGGER IF EXISTS weather_city_fts_delete",
+    "DROP TRIGGER IF EXISTS weather_city_fts_insert",
+    "DROP TABLE IF EXISTS weather_city_fts",
+]
+
+
+def create_city_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for statement in CREATE_INDEX:
+        schema_editor.execute(statement)
+
+
+def drop_city_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for statement in DROP_INDEX:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0005_searchhistory_searched_at_default"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_city_search_index, drop_city_search_index),
+    ]
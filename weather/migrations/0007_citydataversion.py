@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:57
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def populate_city_versions(apps, schema_editor):
+    WeatherRecord = apps.get_model("weather", "WeatherRecord")
+    CityDataVersion = apps.get_model("weather", "CityDataVersion")
+    cities = WeatherRecord.objects.order_by().values_list("city", flat=True).distinct()
+    CityDataVersion.objects.bulk_create([CityDataVersion(city=city) for city in cities])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0006_city_search_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CityDataVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("city", models.CharField(max_length=100, unique=True)),
+                ("version", models.PositiveIntegerField(default=1)),
+                ("updated_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "ordering": ["city"],
+            },
+        ),
+        migrations.RunPython(populate_city_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:19
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_user_scores(apps, schema_editor):
+    UserAchievement = apps.get_model("weather", "UserAchievement")
+    UserScore = apps.get_model("weather", "UserScore")
+    totals = (
+        UserAchievement.objects.values("user_id")
+        .annotate(total_points=Sum("points"), achievements_count=Count("id"))
+        .order_by()
+    )
+    UserScore.objects.bulk_create([UserScore(**row) for row in totals], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0007_citydataversion"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserScore",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("user_id", models.IntegerField(unique=True)),
+                ("total_points", models.IntegerField(default=0)),
+                ("achievements_count", models.IntegerField(default=0)),
+                ("updated_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "ordering": ["-total_points", "user_id"],
+                "indexes": [
+                    models.Index(
+                        fields=["-total_points", "user_id"],
+                        name="weather_use_total_p_3fbe65_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_user_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0008_userscore"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchCompaction",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("compacted_until", models.DateTimeField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="SearchRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("hour", "Hourly"), ("day", "Daily")], max_length=4
+                    ),
+                ),
+                ("period_start", models.DateTimeField()),
+                ("location", models.CharField(max_length=100)),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[("database", "Database"), ("api", "OpenWeather API")],
+                        max_length=20,
+                    ),
+                ),
+                ("found", models.BooleanField()),
+                ("searches", models.PositiveIntegerField(default=0)),
+                ("results", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "ordering": ["period", "-period_start", "location"],
+                "unique_together": {
+                    ("period", "period_start", "location", "source", "found")
+                },
+            },
+        ),
+    ]
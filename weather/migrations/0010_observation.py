@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:31
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0009_search_rollups"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Observation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("city", models.CharField(max_length=100)),
+                ("observed_at", models.DateTimeField()),
+                ("temperature", models.FloatField()),
+                (
+                    "precipitation",
+                    models.FloatField(
+                        blank=True,
+                        null=True,
+                        validators=[django.core.validators.MinValueValidator(0)],
+                    ),
+                ),
+                (
+                    "humidity",
+                    models.IntegerField(
+                        blank=True,
+                        null=True,
+                        validators=[
+                            django.core.validators.MinValueValidator(0),
+                            django.core.validators.MaxValueValidator(100),
+                        ],
+                    ),
+                ),
+                (
+                    "wind_speed",
+                    models.FloatField(
+                        blank=True,
+                        null=True,
+                        validators=[django.core.validators.MinValueValidator(0)],
+                    ),
+                ),
+                (
+                    "condition",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("sunny", "Sunny"),
+                            ("cloudy", "Cloudy"),
+                            ("rainy", "Rainy"),
+                            ("snowy", "Snowy"),
+                            ("stormy", "Stormy"),
+                            ("foggy", "Foggy"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["city", "-observed_at"],
+                "unique_together": {("city", "observed_at")},
+            },
+        ),
+    ]
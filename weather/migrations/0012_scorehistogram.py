@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:55
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_score_histogram(apps, schema_editor):
+    UserScore = apps.get_model("weather", "UserScore")
+    ScoreHistogram = apps.get_model("weather", "ScoreHistogram")
+    levels = (
+        UserScore.objects.values("total_points")
+        .annotate(user_count=Count("id"))
+        .order_by()
+    )
+    ScoreHistogram.objects.bulk_create(
+        [ScoreHistogram(**row) for row in levels], batch_size=5000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0011_location"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ScoreHistogram",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("total_points", models.IntegerField(unique=True)),
+                ("user_count", models.IntegerField(default=0)),
+            ],
+            options={
+                "ordering": ["-total_points"],
+            },
+        ),
+        migrations.RunPython(populate_score_histogram, migrations.RunPython.noop),
+    ]
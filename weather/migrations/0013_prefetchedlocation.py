@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:58
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0012_scorehistogram"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PrefetchedLocation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("city", models.CharField(max_length=100, unique=True)),
+                ("date", models.DateField()),
+                ("fetched_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "ordering": ["city"],
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
 
 from django.db import models
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 class WeatherRecord(models.Model):
@@ -35,10 +36,13 @@ class WeatherRecord(models.Model):
         return f"{self.city} - {self.date}"
     
     def save(self, *args, **kwargs):
+        self.fill_temp_avg()
+        super().save(*args, **kwargs)
+
+    def fill_temp_avg(self):
         # Auto-calculate average temperature
         if not self.temp_avg:
             self.temp_avg = (self.temp_high + self.temp_low) / 2
-        super().save(*args, **kwargs)
 
 
 class UserWeatherPreference(models.Model):
@@ -88,7 +92,7 @@ class SearchHistory(models.Model):
         max_length=20,
         choices=[('database', 'Database'), ('api', 'OpenWeather API')],
     )
-    searched_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    searched_at = models.DateTimeField(default=timezone.now, db_index=True)
     result_count = models.IntegerField(default=0)
     found = models.BooleanField(default=True)
 
@@ -101,3 +105,245 @@ class SearchHistory(models.Model):
 
     def __str__(self):
         return f"Search: {self.location} ({self.source}) - {self.searched_at}"
+
+
+class LatestWeather(models.Model):
+    """Snapshot of the most recent WeatherRecord for each city.
+
+    Maintained by the WeatherRecord signal handlers (see ``weather.latest``) so
+    the dashboard and comparison views can read every city's current weather
+    in a single query instead of one ``latest()`` lookup per city.
+    """
+    city = models.CharField(max_length=100, unique=True)
+    date = models.DateField(db_index=True)
+    record = models.OneToOneField(
+        WeatherRecord,
+        on_delete=models.CASCADE,
+        related_name='latest_snapshot',
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-date', 'city']
+
+    def __str__(self):
+        return f"Latest: {self.city} - {self.date}"
+
+
+class WeatherAggregate(models.Model):
+    """Additive per-city statistics from which averages can be derived.
+
+    Sums and counts are kept per field because precipitation, humidity and
+    wind speed are optional on WeatherRecord.
+    """
+    city = models.CharField(max_length=100)
+    record_count = models.IntegerField(default=0)
+    temp_avg_sum = models.FloatField(default=0)
+    temp_avg_count = models.IntegerField(default=0)
+    temp_high_max = models.FloatField(null=True, blank=True)
+    temp_low_min = models.FloatField(null=True, blank=True)
+    precipitation_sum = models.FloatField(default=0)
+    precipitation_count = models.IntegerField(default=0)
+    humidity_sum = models.FloatField(default=0)
+    humidity_count = models.IntegerField(default=0)
+    wind_speed_sum = models.FloatField(default=0)
+    wind_speed_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+    def stats(self):
+        """Return the same keys the analytics views used to aggregate from raw rows"""
+        def mean(total, count):
+            return total / count if count else None
+
+        return {
+            'avg_temp': mean(self.temp_avg_sum, self.temp_avg_count),
+            'max_temp': self.temp_high_max,
+            'min_temp': self.temp_low_min,
+            'total_precipitation': mean(self.precipitation_sum, self.precipitation_count),
+            'avg_humidity': mean(self.humidity_sum, self.humidity_count),
+            'avg_wind': mean(self.wind_speed_sum, self.wind_speed_count),
+            'record_count': self.record_count,
+        }
+
+
+class MonthlyWeatherRollup(WeatherAggregate):
+    month = models.DateField()  # First day of the month
+
+    class Meta:
+        ordering = ['city', '-month']
+        unique_together = ['city', 'month']
+
+    def __str__(self):
+        return f"Monthly rollup: {self.city} - {self.month:%Y-%m}"
+
+
+class RollingWeatherRollup(WeatherAggregate):
+    """Statistics for records dated on or after ``window_start``.
+
+    A row whose ``window_start`` is behind the current window is stale and
+    gets recomputed on the next read (see ``weather.rollups``).
+    """
+    city = models.CharField(max_length=100, unique=True)
+    window_start = models.DateField()
+
+    class Meta:
+        ordering = ['city']
+
+    def __str__(self):
+        return f"Rolling rollup: {self.city} since {self.window_start}"
+
+
+class CityDataVersion(models.Model):
+    """Counter bumped whenever any WeatherRecord of ``city`` is written or deleted.
+
+    Gives the API a cheap validator for conditional requests: one indexed
+    lookup tells whether a city's data changed since the client last asked.
+    """
+    city = models.CharField(max_length=100, unique=True)
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['city']
+
+    def __str__(self):
+        return f"{self.city} v{self.version}"
+
+
+class UserScore(models.Model):
+    """Denormalized achievement totals per user, kept in sync by signals.
+
+    The ``(-total_points, user_id)`` index serves both the leaderboard
+    ordering and "how many users score higher" rank counts.
+    """
+    user_id = models.IntegerField(unique=True)
+    total_points = models.IntegerField(default=0)
+    achievements_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-total_points', 'user_id']
+        indexes = [
+            models.Index(fields=['-total_points', 'user_id']),
+        ]
+
+    def __str__(self):
+        return f"User {self.user_id}: {self.total_points} points"
+
+
+class ScoreHistogram(models.Model):
+    """How many users hold each point total, kept in step with UserScore.
+
+    A rank sums ``user_count`` over the totals above a score, so its cost
+    follows the number of distinct totals rather than the number of users.
+    """
+    total_points = models.IntegerField(unique=True)
+    user_count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-total_points']
+
+    def __str__(self):
+        return f"{self.user_count} users with {self.total_points} points"
+
+
+class SearchRollup(models.Model):
+    """SearchHistory counts per time bucket, compacted by ``weather.searchstats``.
+
+    ``period`` is ``'hour'`` or ``'day'`` and ``period_start`` the start of the
+    bucket in the current time zone. Locations are lowercased so different
+    spellings of the same search share a row.
+    """
+    PERIOD_CHOICES = [('hour', 'Hourly'), ('day', 'Daily')]
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    period_start = models.DateTimeField()
+    location = models.CharField(max_length=100)
+    source = models.CharField(
+        max_length=20,
+        choices=[('database', 'Database'), ('api', 'OpenWeather API')],
+    )
+    found = models.BooleanField()
+    searches = models.PositiveIntegerField(default=0)
+    results = models.PositiveIntegerField(default=0)  # Sum of result_count
+
+    class Meta:
+        ordering = ['period', '-period_start', 'location']
+        unique_together = ['period', 'period_start', 'location', 'source', 'found']
+
+    def __str__(self):
+        return f"{self.get_period_display()} searches: {self.location} ({self.source}) - {self.period_start}"
+
+
+class SearchCompaction(models.Model):
+    """Single row recording how far SearchHistory has been rolled up.
+
+    Raw searches before ``compacted_until`` are counted in ``SearchRollup``
+    and may be purged; later ones are picked up by the next compaction.
+    """
+    compacted_until = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Search history compacted until {self.compacted_until}"
+
+
+class Observation(models.Model):
+    """A timestamped station reading, e.g. every 10 minutes.
+
+    Each (city, local day) of observations is aggregated into that day's
+    WeatherRecord by ``weather.observations``, so the daily views keep
+    working on high-frequency feeds.
+    """
+    city = models.CharField(max_length=100)
+    observed_at = models.DateTimeField()
+    temperature = models.FloatField()
+    precipitation = models.FloatField(null=True, blank=True, validators=[MinValueValidator(0)])  # mm since the previous reading
+    humidity = models.IntegerField(null=True, blank=True, validators=[MinValueValidator(0), MaxValueValidator(100)])
+    wind_speed = models.FloatField(null=True, blank=True, validators=[MinValueValidator(0)])
+    condition = models.CharField(max_length=20, choices=WeatherRecord.CONDITION_CHOICES, blank=True)
+
+    class Meta:
+        ordering = ['city', '-observed_at']
+        unique_together = ['city', 'observed_at']
+
+    def __str__(self):
+        return f"{self.city} @ {self.observed_at}"
+
+
+class Location(models.Model):
+    """Coordinates of a city, for nearest-city lookups.
+
+    Held in memory as a spatial index by ``weather.geo``; the signal handlers
+    keep that index current when a location is saved or deleted.
+    """
+    city = models.CharField(max_length=100, unique=True)
+    latitude = models.FloatField(validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['city']
+
+    def __str__(self):
+        return f"{self.city} ({self.latitude:.4f}, {self.longitude:.4f})"
+
+
+class PrefetchedLocation(models.Model):
+    """Cities whose weather ``weather.prefetch`` fetched, with the date of the record it last wrote.
+
+    Prefetch only refreshes a city while that record is still its newest, so
+    cities fed by stations or imports are never overwritten with a snapshot.
+    """
+    city = models.CharField(max_length=100, unique=True)
+    date = models.DateField()
+    fetched_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['city']
+
+    def __str__(self):
+        return f"Prefetched: {self.city} - {self.date}"
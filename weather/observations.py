@@ -0,0 +1,239 @@
+"""Sub-daily observations: validation, bucketed aggregation and daily materialization.
+
+``Observation`` rows hold timestamped readings (a station feed every 10
+minutes is 144 rows per city and day). ``aggregate`` buckets them by hour,
+day or week in SQL. ``materialize`` recomputes the WeatherRecord of each
+(city, local day) it is given from that day's readings, so every view built
+on daily records keeps working. A materialized day replaces any daily record
+already stored for it.
+
+Bulk writers call ``write``, which upserts readings and materializes their days
+in one transaction, and then send ``weather_records_bulk_saved`` for the cities
+it returns (``ingest.upsert_batches`` does this for them). Single saves and
+deletes go through the Observation signal handlers in ``weather.signals``.
+"""
+from datetime import datetime, time, timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Avg, Count, Max, Min, Sum
+from django.db.models.functions import TruncDate, TruncDay, TruncHour, TruncWeek
+from django.utils import timezone
+
+from .db import UPSERT_VENDORS, executemany_upsert
+from .models import Observation, WeatherRecord
+
+OBSERVATION_FIELDS = ['city', 'observed_at', 'temperature', 'precipitation', 'humidity', 'wind_speed', 'condition']
+UNIQUE_FIELDS = ['city', 'observed_at']
+UPDATE_FIELDS = [name for name in OBSERVATION_FIELDS if name not in UNIQUE_FIELDS]
+
+BUCKETS = {'hour': TruncHour, 'day': TruncDay, 'week': TruncWeek}
+BUCKET_LENGTHS = {'hour': timedelta(hours=1), 'day': timedelta(days=1), 'week': timedelta(weeks=1)}
+AGGREGATE_FIELDS = [
+    'city', 'bucket', 'readings', 'temp_min', 'temp_max', 'temp_avg',
+    'precipitation_total', 'humidity_avg', 'wind_speed_avg', 'wind_speed_max',
+]
+
+MATERIALIZED_FIELDS = [
+    'temp_high', 'temp_low', 'temp_avg', 'precipitation', 'humidity', 'wind_speed', 'condition',
+]
+
+
+def build_observation(row):
+    """Validate a mapping of raw values and return an unsaved Observation.
+
+    Naive timestamps are taken to be in the current time zone. Raises
+    ValidationError listing every invalid field.
+    """
+    if not isinstance(row, dict):
+        raise ValidationError('Expected a mapping of field names to values.')
+
+    values = {}
+    errors = {}
+    for name in OBSERVATION_FIELDS:
+        field = Observation._meta.get_field(name)
+        raw = row.get(name)
+        if raw is None and name == 'condition':
+            raw = ''
+        elif raw == '' and name != 'condition':
+            raw = None
+        try:
+            values[name] = field.clean(raw, None)
+        except ValidationError as e:
+            errors[name] = e.messages
+    if errors:
+        raise ValidationError(errors)
+
+    if timezone.is_naive(values['observed_at']):
+        values['observed_at'] = timezone.make_aware(values['observed_at'])
+    return Observation(**values)
+
+
+def day_key(observation, tz=None):
+    return observation.city, timezone.localdate(observation.observed_at, tz)
+
+
+def write(observations):
+    """Upsert ``observations`` on (city, observed_at) and materialize their days.
+
+    Returns the set of cities whose WeatherRecords were written. Later
+    duplicates within the batch win.
+    """
+    unique = {(obs.city, obs.observed_at): obs for obs in observations}
+    if not unique:
+        return set()
+    with transaction.atomic():
+        upsert_observations(unique.values())
+        tz = timezone.get_current_timezone()  # Looked up once rather than per reading
+        return materialize({day_key(obs, tz) for obs in unique.values()})
+
+
+def upsert_observations(observations):
+    """Insert or update ``observations`` keyed on (city, observed_at).
+
+    On SQLite and PostgreSQL this is one ``db.executemany_upsert``, as in
+    ``synthetic.write_rows``; compiling the statement per instance is most of
+    the cost of ``bulk_create`` on feeds of thousands of rows.
+    """
+    if connection.vendor not in UPSERT_VENDORS:
+        Observation.objects.bulk_create(
+            observations,
+            update_conflicts=True,
+            unique_fields=UNIQUE_FIELDS,
+            update_fields=UPDATE_FIELDS,
+        )
+        return
+    adapt_datetime = connection.ops.adapt_datetimefield_value
+    params = [
+        (obs.city, adapt_datetime(obs.observed_at), obs.temperature, obs.precipitation,
+         obs.humidity, obs.wind_speed, obs.condition)
+        for obs in observations
+    ]
+    executemany_upsert(Observation, OBSERVATION_FIELDS, UNIQUE_FIELDS, params, update_fields=UPDATE_FIELDS)
+
+
+# --- Materialization -------------------------------------------------------------
+
+def materialize(keys):
+    """Recompute the WeatherRecord of each ``(city, date)`` in ``keys`` from its observations.
+
+    Days without observations are left alone. Returns the set of cities
+    written; the caller sends ``weather_records_bulk_saved`` for them.
+    """
+    keys = set(keys)
+    if not keys:
+        return set()
+    days = [day for _, day in keys]
+    # One pass over the readings, grouped by condition too, so the dated
+    # function runs once per reading; the groups are merged per day below
+    groups = (
+        Observation.objects.filter(
+            city__in={city for city, _ in keys},
+            observed_at__gte=day_start(min(days)),
+            observed_at__lt=day_start(max(days) + timedelta(days=1)),
+        )
+        .annotate(day=TruncDate('observed_at'))
+        .values('city', 'day', 'condition')
+        .annotate(
+            readings=Count('id'),
+            temp_high=Max('temperature'),
+            temp_low=Min('temperature'),
+            temp_sum=Sum('temperature'),
+            total_precipitation=Sum('precipitation'),
+            humidity_sum=Sum('humidity'),
+            humidity_readings=Count('humidity'),
+            wind_speed_sum=Sum('wind_speed'),
+            wind_speed_readings=Count('wind_speed'),
+        )
+        .order_by()
+    )
+    daily = {}
+    for group in groups:
+        key = (group['city'], group['day'])
+        if key not in keys:
+            continue
+        day = daily.get(key)
+        if day is None:
+            daily[key] = day = dict(group, condition=None, condition_readings=0)
+        else:
+            day['temp_high'] = max(day['temp_high'], group['temp_high'])
+            day['temp_low'] = min(day['temp_low'], group['temp_low'])
+            for name in ('readings', 'temp_sum', 'humidity_readings', 'wind_speed_readings'):
+                day[name] += group[name]
+            for name in ('total_precipitation', 'humidity_sum', 'wind_speed_sum'):
+                if group[name] is not None:
+                    day[name] = (day[name] or 0) + group[name]
+        # The most frequently reported condition of the day
+        if group['condition'] and group['readings'] > day['condition_readings']:
+            day['condition'], day['condition_readings'] = group['condition'], group['readings']
+
+    records = [
+        WeatherRecord(
+            city=city,
+            date=date,
+            temp_high=day['temp_high'],
+            temp_low=day['temp_low'],
+            temp_avg=day['temp_sum'] / day['readings'],
+            precipitation=day['total_precipitation'],
+            humidity=round(day['humidity_sum'] / day['humidity_readings']) if day['humidity_readings'] else None,
+            wind_speed=day['wind_speed_sum'] / day['wind_speed_readings'] if day['wind_speed_readings'] else None,
+            condition=day['condition'] or derived_condition(day),
+        )
+        for (city, date), day in daily.items()
+    ]
+    if not records:
+        return set()
+    with transaction.atomic():
+        WeatherRecord.objects.bulk_create(
+            records,
+            update_conflicts=True,
+            unique_fields=['city', 'date'],
+            update_fields=MATERIALIZED_FIELDS,
+        )
+    return {record.city for record in records}
+
+
+def derived_condition(day):
+    """Condition for a day whose readings reported none"""
+    if day['total_precipitation']:
+        return 'snowy' if day['temp_high'] <= 0 else 'rainy'
+    return 'cloudy'
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+# --- Reads ---------------------------------------------------------------------
+
+def aggregate(cities, start, end, bucket='hour'):
+    """Readings of ``cities`` between the dates ``start`` and ``end`` (inclusive), bucketed in SQL.
+
+    Returns dicts of AGGREGATE_FIELDS ordered by city, then bucket.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of: {', '.join(BUCKETS)}")
+    rows = (
+        Observation.objects.filter(
+            city__in=cities, observed_at__gte=day_start(start), observed_at__lt=day_start(end + timedelta(days=1)),
+        )
+        .annotate(bucket=BUCKETS[bucket]('observed_at'))
+        .values('city', 'bucket')
+        .annotate(
+            readings=Count('id'),
+            temp_min=Min('temperature'),
+            temp_max=Max('temperature'),
+            temp_avg=Avg('temperature'),
+            precipitation_total=Sum('precipitation'),
+            humidity_avg=Avg('humidity'),
+            wind_speed_avg=Avg('wind_speed'),
+            wind_speed_max=Max('wind_speed'),
+        )
+        .order_by('city', 'bucket')
+    )
+    return [dict(row, bucket=row['bucket'].isoformat()) for row in rows]
+
+
+def bucket_count(start, end, bucket):
+    """Upper bound on the buckets per city between two dates"""
+    return (day_start(end + timedelta(days=1)) - day_start(start)) // BUCKET_LENGTHS[bucket] + 1
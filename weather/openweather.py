@@ -0,0 +1,363 @@
+"""Pooled, cached and de-duplicated client for the OpenWeather current weather API.
+
+Responses are cached per normalized location in a TTL + LRU cache. Successful
+lookups are kept for ``ttl`` seconds and "city not found" (404) answers for
+``negative_ttl`` seconds; anything else (5xx, 401, network errors) is never
+cached. Concurrent misses for the same location are coalesced so only one
+request goes upstream and every waiter shares its result.
+
+``OpenWeatherClient`` is the blocking client used by the sync views;
+``AsyncOpenWeatherClient`` offers the same caching and coalescing on top of
+``httpx.AsyncClient`` for async views. The base URL is configurable so either
+client can be pointed at a local stub server::
+
+    client = OpenWeatherClient(api_key='test', base_url='http://127.0.0.1:8765')
+"""
+import abc
+import asyncio
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import requests
+from django.conf import settings
+from dotenv import load_dotenv
+
+from . import instrumentation, metrics
+
+# Load environment variables from .env file
+load_dotenv()
+
+DEFAULT_BASE_URL = 'https://api.openweathermap.org/data/2.5'
+
+UpstreamResponse = namedtuple('UpstreamResponse', ['status_code', 'data'])
+
+
+def cache_key(location):
+    return ' '.join(location.lower().split())
+
+
+class _LeaderCancelled(Exception):
+    """The task performing a coalesced async lookup was cancelled; waiters retry it"""
+
+
+class _InFlight:
+    """A lookup currently being performed by one thread on behalf of others"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class BaseOpenWeatherClient(abc.ABC):
+    """Response cache and counters shared by the sync and async clients"""
+
+    metrics_label = None  # ``client`` label of the Prometheus metrics
+
+    def __init__(self, api_key=None, base_url=DEFAULT_BASE_URL, timeout=5,
+                 cache_size=1024, ttl=600, negative_ttl=60, pool_size=10):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.pool_size = pool_size
+
+        self._cache = OrderedDict()  # key -> (expires_at, UpstreamResponse)
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ['hits', 'negative_hits', 'misses', 'coalesced', 'upstream_calls', 'upstream_errors', 'evictions'], 0
+        )
+
+    def stats(self):
+        """Return a snapshot of the cache and upstream counters"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['cached_entries'] = len(self._cache)
+            stats['in_flight'] = self._in_flight_count()
+        lookups = stats['hits'] + stats['negative_hits'] + stats['misses'] + stats['coalesced']
+        stats['hit_rate'] = (stats['hits'] + stats['negative_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def _params(self, location):
+        return {'q': location, 'appid': self.api_key, 'units': 'metric'}
+
+    @abc.abstractmethod
+    def _in_flight_count(self):
+        """Number of lookups currently waiting on upstream; called with ``self._lock`` held"""
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _count_lookup(self, result):
+        """Must be called with ``self._lock`` held"""
+        self._counters[result] += 1
+        metrics.OPENWEATHER_LOOKUPS.labels(self.metrics_label, result).inc()
+
+    def _cached(self, key):
+        """Return the cached response for ``key`` and count the hit, or None.
+
+        Must be called with ``self._lock`` held.
+        """
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires_at, response = entry
+        if expires_at <= time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        self._count_lookup('negative_hits' if response.status_code == 404 else 'hits')
+        return response
+
+    def _cache_put(self, key, response):
+        """Must be called with ``self._lock`` held"""
+        if response.status_code == 200:
+            ttl = self.ttl
+        elif response.status_code == 404:
+            ttl = self.negative_ttl
+        else:
+            return
+        self._cache[key] = (time.monotonic() + ttl, response)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+            self._counters['evictions'] += 1
+
+
+class OpenWeatherClient(BaseOpenWeatherClient):
+    metrics_label = 'sync'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._in_flight = {}  # key -> _InFlight
+
+    def current_weather(self, location):
+        """Return an UpstreamResponse for ``location``.
+
+        Raises ``requests.exceptions.RequestException`` if the upstream call
+        fails; every caller coalesced onto that call sees the same exception.
+        """
+        key = cache_key(location)
+        with self._lock:
+            cached = self._cached(key)
+            if cached is not None:
+                return cached
+
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _InFlight()
+            self._count_lookup('misses' if leader else 'coalesced')
+
+        if not leader:
+            with instrumentation.timed('upstream'):
+                call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.response
+
+        try:
+            call.response = self._fetch(location)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if call.response is not None:
+                    self._cache_put(key, call.response)
+                del self._in_flight[key]
+            call.done.set()
+        return call.response
+
+    def current_weather_many(self, locations, workers=None):
+        """Look up several locations concurrently.
+
+        Returns ``{location: UpstreamResponse or exception}``. At most
+        ``workers`` (default: the connection pool size) calls run at once;
+        cache hits and coalescing work as for single lookups.
+        """
+        locations = list(dict.fromkeys(locations))
+        if not locations:
+            return {}
+
+        def lookup(location):
+            try:
+                return self.current_weather(location)
+            except Exception as e:
+                return e
+
+        # Worker threads don't see the request's metrics, so time the whole batch here
+        with instrumentation.timed('upstream'):
+            with ThreadPoolExecutor(max_workers=min(len(locations), workers or self.pool_size)) as pool:
+                return dict(zip(locations, pool.map(lookup, locations)))
+
+    def close(self):
+        self.session.close()
+
+    def _fetch(self, location):
+        self._count('upstream_calls')
+        try:
+            with instrumentation.timed('upstream'), metrics.openweather_call(self.metrics_label) as outcome:
+                response = self.session.get(
+                    f'{self.base_url}/weather',
+                    params=self._params(location),
+                    timeout=self.timeout,
+                )
+                outcome['status'] = response.status_code
+                # JSON decode errors are RequestExceptions too
+                data = response.json() if response.status_code == 200 else None
+        except requests.exceptions.RequestException:
+            self._count('upstream_errors')
+            raise
+        return UpstreamResponse(response.status_code, data)
+
+    def _in_flight_count(self):
+        return len(self._in_flight)
+
+
+class AsyncOpenWeatherClient(BaseOpenWeatherClient):
+    """Non-blocking client for async views.
+
+    httpx connection pools and futures belong to an event loop, so each loop
+    the client is used from gets its own pool and in-flight table; the
+    response cache and counters are shared by all of them.
+    """
+
+    metrics_label = 'async'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._loops = weakref.WeakKeyDictionary()  # loop -> (httpx.AsyncClient, {key: Future})
+
+    async def current_weather(self, location):
+        """Return an UpstreamResponse for ``location``.
+
+        Raises ``httpx.HTTPError`` if the upstream call fails; every caller
+        coalesced onto that call sees the same exception. If the caller doing
+        the lookup is cancelled (say its client disconnected), the others retry
+        it rather than being cancelled with it.
+        """
+        key = cache_key(location)
+        http, in_flight = self._loop_state()
+        with self._lock:
+            cached = self._cached(key)
+            if cached is not None:
+                return cached
+            future = in_flight.get(key)
+            leader = future is None
+            self._count_lookup('misses' if leader else 'coalesced')
+
+        if not leader:
+            # Shield so a cancelled waiter doesn't cancel the shared lookup
+            try:
+                with instrumentation.timed('upstream'):
+                    return await asyncio.shield(future)
+            except _LeaderCancelled:
+                # The first waiter back becomes the new leader; the rest coalesce onto it
+                return await self.current_weather(location)
+
+        future = in_flight[key] = asyncio.get_running_loop().create_future()
+        try:
+            response = await self._fetch(http, location)
+        except asyncio.CancelledError:
+            # Cancelling the future would cancel every waiter too; have them retry instead
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved so a lookup nobody waited on isn't logged
+            raise
+        else:
+            with self._lock:
+                self._cache_put(key, response)
+            future.set_result(response)
+            return response
+        finally:
+            del in_flight[key]
+
+    async def aclose(self):
+        http, _ = self._loop_state()
+        await http.aclose()
+
+    async def _fetch(self, http, location):
+        self._count('upstream_calls')
+        try:
+            with instrumentation.timed('upstream'), metrics.openweather_call(self.metrics_label) as outcome:
+                response = await http.get(f'{self.base_url}/weather', params=self._params(location))
+                outcome['status'] = response.status_code
+                data = response.json() if response.status_code == 200 else None
+        except httpx.HTTPError:
+            self._count('upstream_errors')
+            raise
+        except ValueError as e:
+            self._count('upstream_errors')
+            raise httpx.DecodingError(f'Invalid JSON from upstream: {e}')
+        return UpstreamResponse(response.status_code, data)
+
+    def _loop_state(self):
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None:
+            limits = httpx.Limits(max_connections=None, max_keepalive_connections=self.pool_size)
+            state = self._loops[loop] = (httpx.AsyncClient(timeout=self.timeout, limits=limits), {})
+        return state
+
+    def _in_flight_count(self):
+        return sum(len(in_flight) for _, in_flight in list(self._loops.values()))
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _get_or_create(client_class):
+    client = _clients.get(client_class)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(client_class)
+            if client is None:
+                client = _clients[client_class] = client_class(
+                    api_key=os.getenv('OPENWEATHER_API_KEY'),
+                    base_url=settings.OPENWEATHER_BASE_URL,
+                    timeout=settings.OPENWEATHER_TIMEOUT,
+                    cache_size=settings.OPENWEATHER_CACHE_SIZE,
+                    ttl=settings.OPENWEATHER_CACHE_TTL,
+                    negative_ttl=settings.OPENWEATHER_NEGATIVE_CACHE_TTL,
+                )
+    return client
+
+
+def get_client():
+    """Return the process-wide sync client configured from settings and the environment"""
+    return _get_or_create(OpenWeatherClient)
+
+
+def get_async_client():
+    """Return the process-wide async client configured from settings and the environment"""
+    return _get_or_create(AsyncOpenWeatherClient)
+
+
+def reset_clients():
+    """Drop the process-wide clients so the next call rebuilds them from settings"""
+    with _clients_lock:
+        for client in _clients.values():
+            if isinstance(client, OpenWeatherClient):
+                client.close()
+        _clients.clear()
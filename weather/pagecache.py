@@ -0,0 +1,118 @@
+"""Versioned page and fragment caching for the HTML views.
+
+Cache keys embed the ``CityDataVersion`` token of the data a page or
+fragment was rendered from (see ``weather.versions``). The WeatherRecord
+signal handlers bump those versions on every save, delete and bulk write, so
+a changed city simply stops matching its old keys. Entries are stored
+without a timeout and age out through the cache backend's own culling.
+
+Pages whose numbers are relative to today (30-day windows, default trend
+ranges) also key on the current date.
+"""
+import hashlib
+import threading
+from collections import defaultdict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from . import metrics, versions
+
+KEY_PREFIX = 'weather'
+
+
+class HitCounter:
+    """Thread-safe hit/miss counters per page or fragment name"""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self._lock = threading.Lock()
+        self._counters = defaultdict(lambda: {'hits': 0, 'misses': 0})
+
+    def record(self, name, hit):
+        with self._lock:
+            self._counters[name]['hits' if hit else 'misses'] += 1
+        metrics.CACHE_LOOKUPS.labels(self.kind, name, 'hit' if hit else 'miss').inc()
+
+    def stats(self):
+        with self._lock:
+            stats = {name: dict(counters) for name, counters in self._counters.items()}
+        for counters in stats.values():
+            lookups = counters['hits'] + counters['misses']
+            counters['hit_rate'] = counters['hits'] / lookups if lookups else 0.0
+        return stats
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+
+page_counter = HitCounter('page')
+fragment_counter = HitCounter('fragment')
+
+
+def enabled():
+    return getattr(settings, 'WEATHER_PAGE_CACHE_ENABLED', True)
+
+
+def get_cache():
+    return caches[getattr(settings, 'WEATHER_PAGE_CACHE_ALIAS', 'default')]
+
+
+def make_key(kind, name, *parts):
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'{KEY_PREFIX}:{kind}:{name}:{digest}'
+
+
+def cached_page(name, city=None):
+    """Cache a view's rendered response until the data behind it changes.
+
+    ``city`` maps the view's URL kwargs to the single city the page shows;
+    without it the page is keyed on the version of every city. Only
+    successful GET/HEAD responses are stored, and pages for cities without
+    data are never cached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not enabled() or request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            state = versions.city_state(city(**kwargs)) if city else versions.global_state()
+            if state is None:
+                return view(request, *args, **kwargs)
+            key = make_key('page', name, request.get_full_path(), timezone.localdate(), state[0])
+            cache = get_cache()
+            response = cache.get(key)
+            page_counter.record(name, response is not None)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming:
+                    cache.set(key, response, None)
+            return response
+        return wrapper
+    return decorator
+
+
+def cached_fragment(name, city, token, render, vary_on=()):
+    """Return the cached output of ``render()`` for one city's fragment.
+
+    ``token`` is the city's version token; fragments are rendered uncached
+    when it is None.
+    """
+    if not enabled() or token is None:
+        return render()
+    key = make_key('fragment', name, city, timezone.localdate(), token, *vary_on)
+    cache = get_cache()
+    content = cache.get(key)
+    fragment_counter.record(name, content is not None)
+    if content is None:
+        content = render()
+        cache.set(key, content, None)
+    return content
+
+
+def stats():
+    """Hit rates of the page and fragment caches in this process"""
+    return {'pages': page_counter.stats(), 'fragments': fragment_counter.stats()}
@@ -0,0 +1,85 @@
+"""Keyset pagination and streaming helpers for the JSON API.
+
+Pages are ordered newest first on ``(date, id)``. The ``next`` cursor is an
+opaque token holding the key of the last row served; the following page
+starts strictly after it, so paging never rescans skipped rows the way an
+OFFSET would and stays stable while new records arrive.
+"""
+import base64
+from datetime import date
+
+import orjson
+from django.db.models import Q
+
+API_RECORD_FIELDS = [
+    'city', 'date', 'temp_high', 'temp_low', 'temp_avg',
+    'precipitation', 'humidity', 'wind_speed', 'condition',
+]
+KEYSET_ORDERING = ['-date', '-id']
+STREAM_CHUNK_SIZE = 2000
+
+
+def encode_cursor(record_date, record_id):
+    raw = f'{record_date.isoformat()}|{record_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return ``(date, id)`` from a cursor token; raises ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        record_date, record_id = raw.split('|')
+        return date.fromisoformat(record_date), int(record_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f'Invalid cursor: {token!r}') from e
+
+
+def after_cursor(queryset, token):
+    """Restrict a KEYSET_ORDERING queryset to rows after the cursor"""
+    record_date, record_id = decode_cursor(token)
+    return queryset.filter(Q(date__lt=record_date) | Q(date=record_date, id__lt=record_id))
+
+
+def keyset_page(queryset, limit, cursor=None):
+    """Return ``(rows, next_cursor)`` for one page of API record dicts"""
+    queryset = queryset.order_by(*KEYSET_ORDERING)
+    if cursor:
+        queryset = after_cursor(queryset, cursor)
+    rows = list(queryset.values_list('id', *API_RECORD_FIELDS)[:limit + 1])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[2], last[0])
+    return [api_record(row[1:]) for row in rows], next_cursor
+
+
+def api_record(values):
+    """Build the API dict for a row of API_RECORD_FIELDS values"""
+    record = dict(zip(API_RECORD_FIELDS, values))
+    record['date'] = record['date'].isoformat()
+    return record
+
+
+def stream_records_json(queryset, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield ``{"records": [...]}`` as JSON bytes, one chunk of rows at a time.
+
+    Rows come from a chunked ``values_list().iterator()``, so memory stays
+    constant however many records match and the first bytes go out as soon
+    as the first chunk is read. Each chunk is encoded by orjson in one call;
+    it writes dates in ISO format itself.
+    """
+    rows = queryset.order_by(*KEYSET_ORDERING).values_list(*API_RECORD_FIELDS).iterator(chunk_size=chunk_size)
+    yield b'{"records":['
+    separator = b''
+    buffer = []
+    for row in rows:
+        buffer.append(dict(zip(API_RECORD_FIELDS, row)))
+        if len(buffer) >= chunk_size:
+            yield separator + orjson.dumps(buffer)[1:-1]
+            separator = b','
+            buffer = []
+    if buffer:
+        yield separator + orjson.dumps(buffer)[1:-1]
+    yield b']}'
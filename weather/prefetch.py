@@ -0,0 +1,236 @@
+"""Warm the database with popular locations that are only answered by OpenWeather.
+
+``missing_locations`` ranks the locations that recent searches found and
+that have no WeatherRecord, plus those prefetch itself keeps current whose
+newest record it wrote on an earlier day (``PrefetchedLocation``). Cities
+fed by stations or imports are never candidates. ``prefetch`` fetches them
+from a bounded thread pool under a shared token-bucket rate limit and upserts
+today's record and coordinates for each one, keeping the day's highest high
+and lowest low across refreshes. Once a location has a WeatherRecord,
+``search_location`` answers it from the database, by name or by nearby
+coordinates.
+
+The ``prefetch_locations`` command runs this once or on an interval.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from . import geo, ingest, openweather
+from .models import LatestWeather, PrefetchedLocation, SearchHistory, WeatherRecord
+
+# OpenWeather "main" groups -> WeatherRecord.condition
+CONDITIONS = {
+    'Clear': 'sunny',
+    'Clouds': 'cloudy',
+    'Rain': 'rainy',
+    'Drizzle': 'rainy',
+    'Snow': 'snowy',
+    'Thunderstorm': 'stormy',
+    'Tornado': 'stormy',
+    'Squall': 'stormy',
+}
+DEFAULT_CONDITION = 'foggy'  # Mist, Fog, Haze, Smoke, Dust, Sand, Ash
+
+
+class RateLimiter:
+    """Token bucket shared by threads: ``rate`` acquisitions per second, bursts of ``burst``"""
+
+    def __init__(self, rate, burst=1):
+        if rate <= 0 or burst < 1:
+            raise ValueError('rate must be positive and burst at least 1')
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a call is allowed; returns the seconds waited"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # A negative balance reserves a future slot, so waiters are served in order
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+def missing_locations(limit, days, today=None):
+    """Most searched locations that prefetch should fetch for ``today``.
+
+    Ranks found searches from the last ``days`` days, whether they went
+    upstream or were answered from the database. A location qualifies when it
+    has no WeatherRecord, or when its newest record is one prefetch wrote
+    before ``today``. Returns ``[(location, searches), ...]``, most searched
+    first. Spellings of a location are grouped case-insensitively.
+    """
+    today = today or timezone.localdate()
+    ranked = (
+        SearchHistory.objects.filter(
+            source__in=['api', 'database'], found=True, searched_at__gte=timezone.now() - timedelta(days=days),
+        )
+        .annotate(key=Lower('location'))
+        .values('key')
+        .annotate(searches=Count('id'), spelling=Max('location'))
+        .order_by('-searches', 'key')
+    )
+    locations = []
+    # Pull candidates in pages until enough of them qualify
+    offset, page = 0, max(limit * 2, 100)
+    while len(locations) < limit:
+        candidates = list(ranked[offset:offset + page])
+        if not candidates:
+            break
+        offset += page
+        keys = [row['key'] for row in candidates]
+        # One row per city in both tables, so matching them case-insensitively stays cheap
+        newest = dict(
+            LatestWeather.objects.annotate(key=Lower('city')).filter(key__in=keys).values_list('key', 'date')
+        )
+        prefetched = dict(
+            PrefetchedLocation.objects.annotate(key=Lower('city')).filter(key__in=keys).values_list('key', 'date')
+        )
+        locations.extend(
+            (row['spelling'], row['searches']) for row in candidates
+            if row['key'] not in newest
+            or (prefetched.get(row['key']) == newest[row['key']] and newest[row['key']] < today)
+        )
+    return locations[:limit]
+
+
+def record_row(location, data, day):
+    """WeatherRecord values for an OpenWeather current weather payload.
+
+    ``temp_max`` and ``temp_min`` of a current weather payload describe the
+    moment of the fetch, not the whole day; ``merge_extremes`` folds them into
+    the day's stored high and low. ``temp_avg`` is the midpoint of the high and
+    low, the usual daily mean, rather than the instantaneous ``temp``. Raises
+    KeyError, IndexError or TypeError for a payload missing required fields.
+    """
+    name = data.get('name') or location
+    main = data['main']
+    precipitation = sum(data.get(kind, {}).get('1h', 0) for kind in ('rain', 'snow'))
+    return {
+        # Searches match cities case-insensitively, so keep a name that matches the search
+        'city': name if name.lower() == location.lower() else location,
+        'date': day,
+        'temp_high': main['temp_max'],
+        'temp_low': main['temp_min'],
+        'temp_avg': round((main['temp_max'] + main['temp_min']) / 2, 2),
+        'precipitation': precipitation,
+        'humidity': main.get('humidity'),
+        'wind_speed': data.get('wind', {}).get('speed'),
+        'condition': CONDITIONS.get(data['weather'][0]['main'], DEFAULT_CONDITION),
+    }
+
+
+def merge_extremes(rows, day):
+    """Widen each row's high and low by the record already stored for ``day``.
+
+    Refreshing a location during the day then keeps the highest high and the
+    lowest low seen so far instead of replacing them with the latest snapshot;
+    the other fields take the latest values.
+    """
+    stored = {
+        city: (high, low) for city, high, low in WeatherRecord.objects.filter(
+            date=day, city__in=[row['city'] for row in rows],
+        ).values_list('city', 'temp_high', 'temp_low')
+    }
+    for row in rows:
+        if row['city'] in stored:
+            high, low = stored[row['city']]
+            row['temp_high'] = max(row['temp_high'], high)
+            row['temp_low'] = min(row['temp_low'], low)
+            row['temp_avg'] = round((row['temp_high'] + row['temp_low']) / 2, 2)
+    return rows
+
+
+def mark_prefetched(cities, day):
+    """Record that prefetch wrote ``day``'s record for ``cities``"""
+    now = timezone.now()
+    PrefetchedLocation.objects.bulk_create(
+        [PrefetchedLocation(city=city, date=day, fetched_at=now) for city in set(cities)],
+        update_conflicts=True,
+        unique_fields=['city'],
+        update_fields=['date', 'fetched_at'],
+    )
+
+
+def prefetch(locations, client=None, workers=None, rate=None, burst=None, today=None):
+    """Fetch ``locations`` and upsert today's WeatherRecord for every one found.
+
+    Returns throughput and outcome counts for the run.
+    """
+    client = client or openweather.get_client()
+    limiter = RateLimiter(
+        rate or settings.OPENWEATHER_PREFETCH_RATE,
+        burst or settings.OPENWEATHER_PREFETCH_BURST,
+    )
+    today = today or timezone.localdate()
+
+    def fetch(location):
+        limiter.acquire()
+        started = time.perf_counter()
+        try:
+            response = client.current_weather(location)
+        except Exception as e:
+            return location, None, e, time.perf_counter() - started
+        return location, response, None, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers or settings.OPENWEATHER_PREFETCH_WORKERS) as pool:
+        results = list(pool.map(fetch, locations))
+    elapsed = time.perf_counter() - started
+
+    rows, coordinates = [], []
+    stats = {'locations': len(locations), 'fetched': 0, 'not_found': 0, 'errors': 0}
+    for location, response, error, _ in results:
+        if error is not None or response.status_code not in (200, 404):
+            stats['errors'] += 1
+        elif response.status_code == 404:
+            stats['not_found'] += 1
+        else:
+            try:
+                row = record_row(location, response.data, today)
+            except (KeyError, IndexError, TypeError):
+                # A malformed payload costs this location, not the run
+                stats['errors'] += 1
+                continue
+            stats['fetched'] += 1
+            rows.append(row)
+            coord = response.data.get('coord') or {}
+            if coord.get('lat') is not None and coord.get('lon') is not None:
+                coordinates.append((row['city'], coord['lat'], coord['lon']))
+    rejected = set()
+    stats['written'], stats['rejected'] = ingest.upsert_batches(
+        merge_extremes(rows, today), on_error=lambda index, error: rejected.add(index),
+    )
+    mark_prefetched([row['city'] for index, row in enumerate(rows, start=1) if index not in rejected], today)
+    # Coordinate searches near these cities are answered locally from now on
+    stats['located'] = geo.upsert_locations(coordinates)
+
+    latencies = sorted(latency for *_, latency in results)
+    stats['elapsed'] = elapsed
+    stats['rate'] = len(results) / elapsed if elapsed else 0.0
+    stats['p50'] = latencies[len(latencies) // 2] if latencies else 0.0
+    stats['p95'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+    return stats
+
+
+def run(limit=None, days=None, **options):
+    """Prefetch the current most searched missing locations"""
+    locations = missing_locations(
+        limit or settings.OPENWEATHER_PREFETCH_LOCATIONS,
+        days or settings.OPENWEATHER_PREFETCH_WINDOW_DAYS,
+    )
+    return prefetch([location for location, _ in locations], **options)
@@ -0,0 +1,83 @@
+"""Response formats for the record APIs.
+
+Clients pick a format with ``?format=`` or the ``Accept`` header:
+
+* ``json`` (``application/json``, the default) - one object per record.
+* ``columnar`` (``application/vnd.weather.columnar+json``) - one array per
+  field, so field names are sent once instead of once per record.
+* ``msgpack`` (``application/msgpack``) - the columnar shape in MessagePack.
+
+Bodies are encoded with orjson or msgpack rather than the stdlib encoder.
+Views wrap themselves in ``gzip_page`` so large bodies are compressed.
+"""
+from datetime import date, datetime
+
+import msgpack
+import orjson
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+FORMATS = {
+    'json': 'application/json',
+    'columnar': 'application/vnd.weather.columnar+json',
+    'msgpack': 'application/msgpack',
+}
+MEDIA_TYPES = {
+    **{media_type: fmt for fmt, media_type in FORMATS.items()},
+    'application/x-msgpack': 'msgpack',
+}
+DEFAULT_FORMAT = 'json'
+
+
+def negotiate(request):
+    """Return the format asked for; raises ValueError for an unknown ``?format=``"""
+    fmt = request.GET.get('format')
+    if fmt:
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+        return fmt
+
+    best, best_quality = DEFAULT_FORMAT, 0.0
+    for item in request.headers.get('Accept', '').split(','):
+        media_type, *params = [part.strip() for part in item.split(';')]
+        fmt = MEDIA_TYPES.get(media_type.lower())
+        if fmt is None:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > best_quality:
+            best, best_quality = fmt, quality
+    return best
+
+
+def shape(records, fmt, fields):
+    """Records as a list of dicts, or as ``{field: [values]}`` for the columnar formats"""
+    if fmt == 'json':
+        return records
+    return {field: [record[field] for record in records] for field in fields}
+
+
+def encode(data, fmt):
+    if fmt == 'msgpack':
+        return msgpack.packb(data, use_bin_type=True, default=_msgpack_default)
+    return orjson.dumps(data)
+
+
+def _msgpack_default(value):
+    # Dates go out as ISO strings, as orjson writes them
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'Cannot serialize {type(value).__name__} to MessagePack')
+
+
+def render(data, fmt, status=200):
+    """HttpResponse with ``data`` encoded as ``fmt``"""
+    response = HttpResponse(encode(data, fmt), content_type=FORMATS[fmt], status=status)
+    patch_vary_headers(response, ['Accept'])
+    return response
@@ -0,0 +1,175 @@
+"""Incrementally maintained per-city aggregates for the analytics views.
+
+Two tables are kept in step with ``WeatherRecord``:
+
+* ``MonthlyWeatherRollup`` - one row per (city, calendar month).
+* ``RollingWeatherRollup`` - one row per city covering the last
+  ``ROLLING_WINDOW_DAYS`` days.
+
+New records are folded in with single UPDATE statements. Corrections and
+deletes can't be subtracted from a min/max, so the affected buckets are
+recomputed from the (at most a month of) raw rows instead. The rolling window
+moves every day; rows left behind by it are recomputed lazily on read.
+"""
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Least, TruncMonth
+
+from .models import MonthlyWeatherRollup, RollingWeatherRollup, WeatherRecord
+
+ROLLING_WINDOW_DAYS = 30
+
+# WeatherRecord field -> (sum column, count column) on the rollup tables
+SUMMED_FIELDS = {
+    'temp_avg': ('temp_avg_sum', 'temp_avg_count'),
+    'precipitation': ('precipitation_sum', 'precipitation_count'),
+    'humidity': ('humidity_sum', 'humidity_count'),
+    'wind_speed': ('wind_speed_sum', 'wind_speed_count'),
+}
+
+
+def rolling_window_start(today=None):
+    return (today or date.today()) - timedelta(days=ROLLING_WINDOW_DAYS)
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+# --- Reads -------------------------------------------------------------------
+
+def rolling_stats(cities):
+    """Return ``{city: stats}`` for the current rolling window.
+
+    Rows that are missing or were computed for an older window are rebuilt in
+    one grouped query before returning.
+    """
+    cities = set(cities)
+    window_start = rolling_window_start()
+    rows = {row.city: row for row in RollingWeatherRollup.objects.filter(city__in=cities)}
+
+    stale = {city for city in cities if city not in rows or rows[city].window_start != window_start}
+    if stale:
+        rows.update(_rebuild_rolling(stale, window_start))
+
+    return {city: row.stats() for city, row in rows.items() if row.record_count}
+
+
+def monthly_stats(city):
+    """Return ``[(month, stats), ...]`` for ``city``, newest month first."""
+    rows = MonthlyWeatherRollup.objects.filter(city=city).order_by('-month')
+    return [(row.month, row.stats()) for row in rows]
+
+
+# --- Incremental maintenance ---------------------------------------------------
+
+def record_added(record):
+    """Fold a newly inserted record into its month and the rolling window."""
+    increments = _increments(record)
+
+    MonthlyWeatherRollup.objects.get_or_create(city=record.city, month=month_start(record.date))
+    MonthlyWeatherRollup.objects.filter(
+        city=record.city, month=month_start(record.date)
+    ).update(**increments)
+
+    window_start = rolling_window_start()
+    if record.date >= window_start:
+        # Stale or missing rows are rebuilt on the next read
+        RollingWeatherRollup.objects.filter(
+            city=record.city, window_start=window_start
+        ).update(**increments)
+
+
+def record_changed(record, previous=None):
+    """Recompute the buckets touched by a corrected or deleted record.
+
+    ``previous`` is the ``(city, date)`` the record had before the change, if
+    it differs from the record's current values.
+    """
+    keys = {(record.city, record.date)}
+    if previous:
+        keys.add(previous)
+    for city, day in keys:
+        _rebuild_monthly([city], month=month_start(day))
+    _rebuild_rolling({city for city, _ in keys}, rolling_window_start())
+
+
+def refresh_cities(cities):
+    """Recompute every rollup row of ``cities`` after a bulk write."""
+    cities = set(cities)
+    if cities:
+        _rebuild_monthly(cities)
+        _rebuild_rolling(cities, rolling_window_start())
+
+
+def rebuild():
+    """Recompute all rollup rows from scratch."""
+    _rebuild_monthly(None)
+    cities = WeatherRecord.objects.order_by().values_list('city', flat=True).distinct()
+    _rebuild_rolling(set(cities), rolling_window_start())
+
+
+# --- Internals -----------------------------------------------------------------
+
+def _increments(record):
+    updates = {
+        'record_count': F('record_count') + 1,
+        'temp_high_max': Greatest(Coalesce(F('temp_high_max'), Value(record.temp_high)), Value(record.temp_high)),
+        'temp_low_min': Least(Coalesce(F('temp_low_min'), Value(record.temp_low)), Value(record.temp_low)),
+    }
+    for field, (sum_column, count_column) in SUMMED_FIELDS.items():
+        value = getattr(record, field)
+        if value is not None:
+            updates[sum_column] = F(sum_column) + value
+            updates[count_column] = F(count_column) + 1
+    return updates
+
+
+def _aggregates():
+    aggregates = {
+        'record_count': Count('id'),
+        'temp_high_max': Max('temp_high'),
+        'temp_low_min': Min('temp_low'),
+    }
+    for field, (sum_column, count_column) in SUMMED_FIELDS.items():
+        aggregates[sum_column] = Coalesce(Sum(field), Value(0.0), output_field=FloatField())
+        aggregates[count_column] = Count(field)
+    return aggregates
+
+
+def _rebuild_monthly(cities, month=None):
+    records = WeatherRecord.objects.order_by()
+    existing = MonthlyWeatherRollup.objects.all()
+    if cities is not None:
+        records = records.filter(city__in=cities)
+        existing = existing.filter(city__in=cities)
+    if month is not None:
+        records = records.filter(date__gte=month, date__lt=_next_month(month))
+        existing = existing.filter(month=month)
+
+    grouped = records.annotate(month=TruncMonth('date')).values('city', 'month').annotate(**_aggregates())
+    rows = [MonthlyWeatherRollup(**values) for values in grouped]
+    with transaction.atomic():
+        existing.delete()
+        MonthlyWeatherRollup.objects.bulk_create(rows)
+
+
+def _rebuild_rolling(cities, window_start):
+    grouped = WeatherRecord.objects.filter(
+        city__in=cities, date__gte=window_start
+    ).order_by().values('city').annotate(**_aggregates())
+    rows = {values['city']: RollingWeatherRollup(window_start=window_start, **values) for values in grouped}
+    for city in cities:
+        # Keep an empty row so cities without recent data aren't recomputed on every read
+        rows.setdefault(city, RollingWeatherRollup(city=city, window_start=window_start))
+
+    with transaction.atomic():
+        RollingWeatherRollup.objects.filter(city__in=cities).delete()
+        RollingWeatherRollup.objects.bulk_create(rows.values())
+    return rows
+
+
+def _next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
@@ -0,0 +1,141 @@
+"""Denormalized achievement scores and leaderboard ranks.
+
+``UserScore`` holds each user's point total and achievement count. The
+UserAchievement signal handlers in ``weather.signals`` recompute the
+affected users' rows whenever an achievement is saved or deleted, inside
+the same transaction when the write goes through ``grant_achievement``.
+
+Ranks are competition ranks ("1224"): a user's rank is one more than the
+number of users with strictly more points. Counting those users would visit
+every one of them, so ``ScoreHistogram`` keeps the number of users per point
+total, adjusted by the same writes that change UserScore. A rank is then a
+sum over the totals above the user's, whose cost follows the number of
+distinct totals (bounded by the points on offer) rather than the number of
+users, so it stays flat at millions of users. ``top_scores`` derives ranks
+while reading the first ``limit`` rows and needs neither.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import ScoreHistogram, UserAchievement, UserScore
+
+REBUILD_BATCH_SIZE = 5000
+
+
+def grant_achievement(user_id, achievement_type, description, points=10):
+    """Grant an achievement once; returns ``(achievement, created)``.
+
+    The achievement row and the user's score are written in one transaction.
+    """
+    with transaction.atomic():
+        return UserAchievement.objects.get_or_create(
+            user_id=user_id,
+            achievement_type=achievement_type,
+            defaults={'description': description, 'points': points},
+        )
+
+
+def refresh_users(user_ids):
+    """Recompute the score rows of ``user_ids`` from their achievements"""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    with transaction.atomic():
+        previous = dict(
+            UserScore.objects.select_for_update().filter(user_id__in=user_ids).values_list('user_id', 'total_points')
+        )
+        totals = (
+            UserAchievement.objects.filter(user_id__in=user_ids)
+            .values('user_id')
+            .annotate(total_points=Sum('points'), achievements_count=Count('id'))
+            .order_by()
+        )
+        scores = [UserScore(updated_at=timezone.now(), **row) for row in totals]
+        UserScore.objects.filter(user_id__in=user_ids - {score.user_id for score in scores}).delete()
+        if scores:
+            UserScore.objects.bulk_create(
+                scores,
+                update_conflicts=True,
+                unique_fields=['user_id'],
+                update_fields=['total_points', 'achievements_count', 'updated_at'],
+            )
+        changes = Counter(score.total_points for score in scores)
+        changes.subtract(previous.values())
+        adjust_histogram(changes)
+
+
+def adjust_histogram(changes):
+    """Apply ``{total_points: change in users}`` to ScoreHistogram; call inside a transaction"""
+    changes = {points: change for points, change in changes.items() if change}
+    if not changes:
+        return
+    ScoreHistogram.objects.bulk_create(
+        [ScoreHistogram(total_points=points, user_count=0) for points, change in changes.items() if change > 0],
+        ignore_conflicts=True,
+    )
+    for points, change in changes.items():
+        ScoreHistogram.objects.filter(total_points=points).update(user_count=F('user_count') + change)
+    ScoreHistogram.objects.filter(total_points__in=list(changes), user_count__lte=0).delete()
+
+
+def rebuild():
+    """Recompute every score row and the histogram from scratch"""
+    totals = (
+        UserAchievement.objects.values('user_id')
+        .annotate(total_points=Sum('points'), achievements_count=Count('id'))
+        .order_by()
+    )
+    now = timezone.now()
+    with transaction.atomic():
+        UserScore.objects.all().delete()
+        batch = []
+        for row in totals.iterator(chunk_size=REBUILD_BATCH_SIZE):
+            batch.append(UserScore(updated_at=now, **row))
+            if len(batch) >= REBUILD_BATCH_SIZE:
+                UserScore.objects.bulk_create(batch)
+                batch = []
+        UserScore.objects.bulk_create(batch)
+        rebuild_histogram()
+
+
+def rebuild_histogram():
+    ScoreHistogram.objects.all().delete()
+    levels = UserScore.objects.values('total_points').annotate(user_count=Count('id')).order_by()
+    ScoreHistogram.objects.bulk_create(
+        [ScoreHistogram(**row) for row in levels], batch_size=REBUILD_BATCH_SIZE,
+    )
+
+
+def rank_of(score):
+    """Competition rank of a UserScore, from the histogram"""
+    above = ScoreHistogram.objects.filter(total_points__gt=score.total_points).aggregate(users=Sum('user_count'))
+    return (above['users'] or 0) + 1
+
+
+def user_standing(user_id):
+    """Return ``{'rank', 'user_id', 'total_points', 'achievements_count'}`` or None if unranked"""
+    score = UserScore.objects.filter(user_id=user_id).first()
+    if score is None:
+        return None
+    return standing(score, rank_of(score))
+
+
+def top_scores(limit):
+    """The ``limit`` best scores with their ranks, best first"""
+    rows = []
+    for position, score in enumerate(UserScore.objects.order_by('-total_points', 'user_id')[:limit], start=1):
+        rank = rows[-1]['rank'] if rows and rows[-1]['total_points'] == score.total_points else position
+        rows.append(standing(score, rank))
+    return rows
+
+
+def standing(score, rank):
+    return {
+        'rank': rank,
+        'user_id': score.user_id,
+        'total_points': score.total_points,
+        'achievements_count': score.achievements_count,
+    }
@@ -0,0 +1,126 @@
+"""Query parsing and indexed lookups for the record search API.
+
+A query such as ``"new york 2024-01..2024-03"`` is split into city terms
+(``new``, ``york``) and date ranges (January to March 2024). City terms are
+matched as prefixes against the FTS5 index over city names (migration 0006),
+ranked with bm25, and the records of the matched cities are then read
+through the ``(city, date)`` index. Nothing scans the WeatherRecord table.
+"""
+import re
+from datetime import date, timedelta
+
+from django.db import connections, router
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import LatestWeather, WeatherRecord
+
+MAX_MATCHED_CITIES = 20
+
+_DATE_PART = r'\d{4}(?:-\d{1,2}(?:-\d{1,2})?)?'
+_DATE_TOKEN = re.compile(rf'^({_DATE_PART})(?:\.\.({_DATE_PART})?)?$|^\.\.({_DATE_PART})$')
+_TERM_SPLIT = re.compile(r'[^\w]+', re.UNICODE)
+
+
+class SearchQuery:
+    def __init__(self, city_terms, date_ranges):
+        self.city_terms = city_terms
+        self.date_ranges = date_ranges  # [(start, end_exclusive)], None for an open end
+
+    def __bool__(self):
+        return bool(self.city_terms or self.date_ranges)
+
+
+def parse_query(text):
+    """Split free text into city terms and date ranges.
+
+    Date tokens are ``YYYY``, ``YYYY-MM`` or ``YYYY-MM-DD``, optionally joined
+    into an inclusive range with ``..`` (either side may be omitted).
+    Raises ValueError for a date token that isn't a real date.
+    """
+    city_terms = []
+    date_ranges = []
+    for token in text.split():
+        match = _DATE_TOKEN.match(token)
+        if match:
+            start, end, open_start_end = match.groups()
+            if open_start_end:
+                date_ranges.append((None, _period(open_start_end)[1]))
+            elif '..' in token:
+                date_ranges.append((_period(start)[0], _period(end)[1] if end else None))
+            else:
+                date_ranges.append(_period(start))
+        else:
+            city_terms.extend(term for term in _TERM_SPLIT.split(token.lower()) if term)
+    return SearchQuery(city_terms, date_ranges)
+
+
+def match_cities(terms, limit=MAX_MATCHED_CITIES):
+    """Return city names matching every term as a word prefix, best match first"""
+    if not terms:
+        return []
+    # The FTS table shadows LatestWeather, so read it wherever the router reads the snapshot
+    connection = connections[router.db_for_read(LatestWeather)]
+    if connection.vendor == 'sqlite':
+        expression = ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT city FROM weather_city_fts WHERE weather_city_fts MATCH %s ORDER BY rank LIMIT %s',
+                [expression, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    # Backends without the FTS index: substring match over the per-city snapshot
+    cities = LatestWeather.objects.all()
+    for term in terms:
+        cities = cities.filter(city__icontains=term)
+    return list(cities.order_by('city').values_list('city', flat=True)[:limit])
+
+
+def search_records(query, limit, fields):
+    """Return ``(cities, rows)``: the matched cities and up to ``limit`` record dicts.
+
+    Rows are ordered by city rank, then newest first.
+    """
+    records = WeatherRecord.objects.all()
+    cities = []
+    if query.city_terms:
+        cities = match_cities(query.city_terms)
+        if not cities:
+            return cities, []
+        records = records.filter(city__in=cities)
+
+    if query.date_ranges:
+        in_ranges = Q()
+        for start, end in query.date_ranges:
+            condition = Q()
+            if start:
+                condition &= Q(date__gte=start)
+            if end:
+                condition &= Q(date__lt=end)
+            in_ranges |= condition
+        records = records.filter(in_ranges)
+
+    ordering = ['-date', 'city']
+    if len(cities) > 1:
+        rank = Case(
+            *[When(city=city, then=Value(position)) for position, city in enumerate(cities)],
+            output_field=IntegerField(),
+        )
+        ordering.insert(0, rank)
+    return cities, list(records.order_by(*ordering).values(*fields)[:limit])
+
+
+def _period(text):
+    """Return ``(start, end_exclusive)`` of the year, month or day in ``text``"""
+    parts = [int(part) for part in text.split('-')]
+    try:
+        if len(parts) == 1:
+            return date(parts[0], 1, 1), date(parts[0] + 1, 1, 1)
+        if len(parts) == 2:
+            start = date(parts[0], parts[1], 1)
+            return start, (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        start = date(*parts)
+        return start, start + timedelta(days=1)
+    except OverflowError:
+        # The exclusive end of a period in year 9999 is past date.max
+        raise ValueError(f'date {text} is out of range')
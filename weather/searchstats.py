@@ -0,0 +1,190 @@
+"""Compaction of SearchHistory into hourly and daily counts.
+
+``compact`` folds every complete hour of raw searches since the last run into
+``SearchRollup`` rows per (hour, location, source, found), recomputes the
+daily rows of the days it touched from those hours, and then purges:
+
+* raw searches older than ``SEARCH_HISTORY_RETENTION_DAYS``,
+* hourly rows older than ``SEARCH_ROLLUP_HOURLY_RETENTION_DAYS``,
+* daily rows older than ``SEARCH_ROLLUP_DAILY_RETENTION_DAYS`` (None keeps them).
+
+Progress is kept in the ``SearchCompaction`` watermark, so each run only reads
+the raw rows written since the previous one, and nothing is purged before it
+has been counted. An hour is compacted ``SEARCH_ROLLUP_GRACE`` seconds after it
+ends, leaving the buffered history writer time to flush it.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Q, Sum
+from django.db.models.functions import Coalesce, Lower, TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import SearchCompaction, SearchHistory, SearchRollup
+
+COMPACT_CHUNK_HOURS = 24
+PURGE_BATCH_SIZE = 5000
+
+
+def hour_start(moment):
+    return timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+
+
+def day_start(moment):
+    return timezone.localtime(moment).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def compacted_until():
+    """End of the compacted range, or None before the first compaction"""
+    return SearchCompaction.objects.values_list('compacted_until', flat=True).first()
+
+
+# --- Compaction ----------------------------------------------------------------
+
+def compact(now=None, retention_days=None, hourly_retention_days=None, daily_retention_days=None):
+    """Roll up complete hours of raw searches, then apply the retention windows.
+
+    Retention arguments default to the settings. Returns counts of what was
+    done.
+    """
+    now = now or timezone.now()
+    if retention_days is None:
+        retention_days = settings.SEARCH_HISTORY_RETENTION_DAYS
+    if hourly_retention_days is None:
+        hourly_retention_days = settings.SEARCH_ROLLUP_HOURLY_RETENTION_DAYS
+    if daily_retention_days is None:
+        daily_retention_days = settings.SEARCH_ROLLUP_DAILY_RETENTION_DAYS
+
+    cutoff = hour_start(now - timedelta(seconds=settings.SEARCH_ROLLUP_GRACE))
+    stats = {'hours': 0, 'searches': 0}
+    while True:
+        compacted = _compact_chunk(cutoff)
+        if compacted is None:
+            break
+        stats['hours'] += compacted[0]
+        stats['searches'] += compacted[1]
+
+    # Never purge what hasn't been counted yet
+    watermark = compacted_until()
+    stats['purged_searches'] = _purge(
+        SearchHistory.objects.filter(searched_at__lt=min(now - timedelta(days=retention_days), watermark))
+    )
+    # The daily rows of the day in progress are recomputed from its hourly rows
+    stats['purged_hourly'] = _purge(SearchRollup.objects.filter(
+        period='hour', period_start__lt=min(now - timedelta(days=hourly_retention_days), day_start(watermark)),
+    ))
+    stats['purged_daily'] = 0
+    if daily_retention_days is not None:
+        stats['purged_daily'] = _purge(SearchRollup.objects.filter(
+            period='day', period_start__lt=now - timedelta(days=daily_retention_days),
+        ))
+    stats['compacted_until'] = watermark
+    return stats
+
+
+def _compact_chunk(cutoff):
+    """Compact up to ``COMPACT_CHUNK_HOURS`` hours in one transaction.
+
+    Returns ``(hours, searches)`` or None when everything before ``cutoff`` is done.
+    """
+    with transaction.atomic():
+        state = SearchCompaction.objects.select_for_update().first()
+        if state is None:
+            earliest = SearchHistory.objects.aggregate(earliest=Min('searched_at'))['earliest']
+            start = hour_start(earliest) if earliest else cutoff
+            state = SearchCompaction(compacted_until=min(start, cutoff))
+        start = state.compacted_until
+        if start >= cutoff:
+            if state.pk is None:
+                state.save()
+            return None
+        end = min(start + timedelta(hours=COMPACT_CHUNK_HOURS), cutoff)
+
+        grouped = (
+            SearchHistory.objects.filter(searched_at__gte=start, searched_at__lt=end)
+            .annotate(period_start=TruncHour('searched_at'), key=Lower('location'))
+            .values('period_start', 'key', 'source', 'found')
+            .annotate(searches=Count('id'), results=Coalesce(Sum('result_count'), 0))
+            .order_by()
+        )
+        hourly = [
+            SearchRollup(
+                period='hour',
+                period_start=row['period_start'],
+                location=row['key'],
+                source=row['source'],
+                found=row['found'],
+                searches=row['searches'],
+                results=row['results'],
+            )
+            for row in grouped
+        ]
+        SearchRollup.objects.bulk_create(hourly)
+        _rebuild_daily(day_start(start), day_start(end - timedelta(microseconds=1)) + timedelta(days=1))
+
+        state.compacted_until = end
+        state.save()
+    return (end - start) // timedelta(hours=1), sum(row.searches for row in hourly)
+
+
+def _rebuild_daily(first_day, end):
+    """Recompute the daily rows of the days in ``[first_day, end)`` from their hourly rows"""
+    grouped = (
+        SearchRollup.objects.filter(period='hour', period_start__gte=first_day, period_start__lt=end)
+        .annotate(day=TruncDay('period_start'))
+        .values('day', 'location', 'source', 'found')
+        .annotate(total_searches=Sum('searches'), total_results=Sum('results'))
+        .order_by()
+    )
+    daily = [
+        SearchRollup(
+            period='day',
+            period_start=row['day'],
+            location=row['location'],
+            source=row['source'],
+            found=row['found'],
+            searches=row['total_searches'],
+            results=row['total_results'],
+        )
+        for row in grouped
+    ]
+    SearchRollup.objects.filter(period='day', period_start__gte=first_day, period_start__lt=end).delete()
+    SearchRollup.objects.bulk_create(daily)
+
+
+def _purge(queryset):
+    """Delete ``queryset`` in batches so no single transaction holds the write lock for long"""
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by().values_list('pk', flat=True)[:PURGE_BATCH_SIZE])
+        if not ids:
+            return deleted
+        deleted += queryset.model.objects.filter(pk__in=ids).delete()[0]
+
+
+# --- Reads ---------------------------------------------------------------------
+
+def popular_locations(since, period='day', limit=10, source=None):
+    """Most searched locations in rollup buckets starting at or after ``since``"""
+    rollups = SearchRollup.objects.filter(period=period, period_start__gte=since)
+    if source:
+        rollups = rollups.filter(source=source)
+    rows = (
+        rollups.values('location')
+        .annotate(
+            total_searches=Sum('searches'),
+            found_searches=Coalesce(Sum('searches', filter=Q(found=True)), 0),
+            total_results=Sum('results'),
+        )
+        .order_by('-total_searches', 'location')[:limit]
+    )
+    return [
+        {
+            'location': row['location'],
+            'searches': row['total_searches'],
+            'found': row['found_searches'],
+            'results': row['total_results'],
+        }
+        for row in rows
+    ]
@@ -0,0 +1,128 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from . import geo, latest, observations, rollups, scoring, timeseries, versions
+from .models import Location, Observation, UserAchievement, WeatherRecord
+
+# Sent by bulk writers (which bypass the model signals) with ``cities``, the
+# set of cities whose WeatherRecord rows were inserted or updated.
+weather_records_bulk_saved = Signal()
+
+
+@receiver(pre_save, sender=WeatherRecord)
+def weather_record_presave(sender, instance, raw=False, **kwargs):
+    instance._previous_key = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    previous = WeatherRecord.objects.filter(pk=instance.pk).values_list('city', 'date').first()
+    if previous and previous != (instance.city, instance.date):
+        instance._previous_key = previous
+
+
+@receiver(post_save, sender=WeatherRecord)
+def weather_record_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_key', None)
+    cities = {instance.city, previous[0]} if previous else {instance.city}
+    versions.bump(cities)
+    latest.record_saved(instance)
+    if created:
+        rollups.record_added(instance)
+        timeseries.cache.record_added(instance)
+    else:
+        rollups.record_changed(instance, previous=previous)
+        timeseries.cache.invalidate(cities)
+
+
+@receiver(post_delete, sender=WeatherRecord)
+def weather_record_deleted(sender, instance, **kwargs):
+    versions.bump([instance.city])
+    latest.record_deleted(instance)
+    rollups.record_changed(instance)
+    timeseries.cache.invalidate([instance.city])
+
+
+@receiver(weather_records_bulk_saved)
+def weather_records_bulk_saved_handler(sender, cities, **kwargs):
+    versions.bump(cities)
+    latest.refresh_cities(cities)
+    rollups.refresh_cities(cities)
+    timeseries.cache.invalidate(cities)
+
+
+@receiver(pre_save, sender=Observation)
+def observation_presave(sender, instance, raw=False, **kwargs):
+    instance._previous_day = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    previous = Observation.objects.filter(pk=instance.pk).first()
+    if previous is not None:
+        instance._previous_day = observations.day_key(previous)
+
+
+@receiver(post_save, sender=Observation)
+def observation_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    keys = {observations.day_key(instance), getattr(instance, '_previous_day', None)} - {None}
+    materialize_observations(keys)
+
+
+@receiver(post_delete, sender=Observation)
+def observation_deleted(sender, instance, **kwargs):
+    materialize_observations({observations.day_key(instance)})
+
+
+def materialize_observations(keys):
+    cities = observations.materialize(keys)
+    if cities:
+        weather_records_bulk_saved.send(sender=Observation, cities=cities)
+
+
+@receiver(pre_save, sender=UserAchievement)
+def user_achievement_presave(sender, instance, raw=False, **kwargs):
+    instance._previous_user_id = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    previous = UserAchievement.objects.filter(pk=instance.pk).values_list('user_id', flat=True).first()
+    if previous is not None and previous != instance.user_id:
+        instance._previous_user_id = previous
+
+
+@receiver(post_save, sender=UserAchievement)
+def user_achievement_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_user_id', None)
+    scoring.refresh_users({instance.user_id, previous} - {None})
+
+
+@receiver(post_delete, sender=UserAchievement)
+def user_achievement_deleted(sender, instance, **kwargs):
+    scoring.refresh_users([instance.user_id])
+
+
+@receiver(pre_save, sender=Location)
+def location_presave(sender, instance, raw=False, **kwargs):
+    instance._previous_city = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    previous = Location.objects.filter(pk=instance.pk).values_list('city', flat=True).first()
+    if previous is not None and previous != instance.city:
+        instance._previous_city = previous
+
+
+@receiver(post_save, sender=Location)
+def location_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    geo.index.location_saved(
+        instance.city, instance.latitude, instance.longitude,
+        previous_city=getattr(instance, '_previous_city', None),
+    )
+
+
+@receiver(post_delete, sender=Location)
+def location_deleted(sender, instance, **kwargs):
+    geo.index.location_deleted(instance.city)
@@ -0,0 +1,54 @@
+"""Template tags for per-city fragment caching.
+
+Usage::
+
+    {% load weather_cache %}
+    {% citycache "city_card" record.city %}...{% endcitycache %}
+
+Extra arguments after the city vary the key like Django's ``{% cache %}``.
+The city's version token is read from the ``city_versions`` context
+variable when the view provides one (one query for the whole page), and
+looked up individually otherwise.
+"""
+from django import template
+
+from .. import pagecache, versions
+
+register = template.Library()
+
+
+class CityCacheNode(template.Node):
+    def __init__(self, nodelist, name, city, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.city = city
+        self.vary_on = vary_on
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        city = self.city.resolve(context)
+        tokens = context.get('city_versions')
+        if tokens is None:
+            tokens = versions.city_tokens([city])
+        return pagecache.cached_fragment(
+            name,
+            city,
+            tokens.get(city),
+            lambda: self.nodelist.render(context),
+            vary_on=[var.resolve(context) for var in self.vary_on],
+        )
+
+
+@register.tag('citycache')
+def do_citycache(parser, token):
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name and a city")
+    nodelist = parser.parse(('endcitycache',))
+    parser.delete_first_token()
+    return CityCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        parser.compile_filter(bits[2]),
+        [parser.compile_filter(bit) for bit in bits[3:]],
+    )
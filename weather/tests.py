@@ -0,0 +1,365 @@
+import asyncio
+import threading
+from datetime import date, timedelta
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import prefetch, scoring
+from .fake_openweather import FakeOpenWeatherServer
+from .models import (
+    LatestWeather, MonthlyWeatherRollup, PrefetchedLocation, SearchHistory, UserAchievement, WeatherRecord,
+)
+from .openweather import AsyncOpenWeatherClient, OpenWeatherClient
+from .pagination import keyset_page
+
+
+def make_record(city, day, temp_high=20.0, temp_low=10.0, **fields):
+    values = {
+        'temp_avg': (temp_high + temp_low) / 2,
+        'precipitation': 0.0,
+        'humidity': 50,
+        'wind_speed': 3.0,
+        'condition': 'sunny',
+        **fields,
+    }
+    return WeatherRecord.objects.create(city=city, date=day, temp_high=temp_high, temp_low=temp_low, **values)
+
+
+class FakeServerTestCase(SimpleTestCase):
+    latency = 0.2
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeOpenWeatherServer(latency=cls.latency).__enter__()
+        cls.addClassCleanup(cls.server.__exit__, None, None, None)
+
+    def setUp(self):
+        self.calls_before = self.server.request_count
+
+    def upstream_calls(self):
+        return self.server.request_count - self.calls_before
+
+
+class OpenWeatherClientTests(FakeServerTestCase):
+    def make_client(self, **kwargs):
+        client = OpenWeatherClient(api_key='test', base_url=self.server.url, **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_concurrent_lookups_are_coalesced(self):
+        client = self.make_client()
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(client.current_weather('Paris'))) for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([response.status_code for response in results], [200] * 8)
+        self.assertEqual(self.upstream_calls(), 1)
+        self.assertEqual(client.stats()['coalesced'], 7)
+
+    def test_successful_lookups_are_cached(self):
+        client = self.make_client()
+        first = client.current_weather('Paris')
+        second = client.current_weather('  paris ')
+        self.assertEqual(first, second)
+        self.assertEqual(self.upstream_calls(), 1)
+        self.assertEqual(client.stats()['hits'], 1)
+
+    def test_not_found_is_cached_for_the_negative_ttl(self):
+        client = self.make_client()
+        self.assertEqual(client.current_weather('unknown place').status_code, 404)
+        self.assertEqual(client.current_weather('unknown place').status_code, 404)
+        self.assertEqual(self.upstream_calls(), 1)
+        self.assertEqual(client.stats()['negative_hits'], 1)
+
+        expiring = self.make_client(negative_ttl=0)
+        expiring.current_weather('unknown town')
+        expiring.current_weather('unknown town')
+        self.assertEqual(self.upstream_calls(), 3)
+
+    def test_server_errors_are_not_cached(self):
+        client = self.make_client()
+        self.assertEqual(client.current_weather('error city').status_code, 503)
+        self.assertEqual(client.current_weather('error city').status_code, 503)
+        self.assertEqual(self.upstream_calls(), 2)
+        self.assertEqual(client.stats()['cached_entries'], 0)
+
+
+class AsyncOpenWeatherClientTests(FakeServerTestCase):
+    def run_with_client(self, test):
+        async def main():
+            client = AsyncOpenWeatherClient(api_key='test', base_url=self.server.url)
+            try:
+                return await test(client)
+            finally:
+                await client.aclose()
+        return asyncio.run(main())
+
+    def test_concurrent_lookups_are_coalesced(self):
+        async def test(client):
+            responses = await asyncio.gather(*[client.current_weather('Lyon') for _ in range(8)])
+            return responses, client.stats()
+
+        responses, stats = self.run_with_client(test)
+        self.assertEqual([response.status_code for response in responses], [200] * 8)
+        self.assertEqual(self.upstream_calls(), 1)
+        self.assertEqual(stats['coalesced'], 7)
+
+    def test_not_found_is_cached_and_server_errors_are_not(self):
+        async def test(client):
+            statuses = [(await client.current_weather(name)).status_code
+                        for name in ('unknown a', 'unknown a', 'error b', 'error b')]
+            return statuses, client.stats()
+
+        statuses, stats = self.run_with_client(test)
+        self.assertEqual(statuses, [404, 404, 503, 503])
+        self.assertEqual(self.upstream_calls(), 3)
+        self.assertEqual(stats['negative_hits'], 1)
+
+    def test_cancelled_leader_does_not_cancel_waiters(self):
+        async def test(client):
+            leader = asyncio.create_task(client.current_weather('Nice'))
+            await asyncio.sleep(0.05)
+            waiters = [asyncio.create_task(client.current_weather('Nice')) for _ in range(3)]
+            await asyncio.sleep(0.05)
+            leader.cancel()
+            return await asyncio.gather(*waiters)
+
+        responses = self.run_with_client(test)
+        self.assertEqual([response.status_code for response in responses], [200] * 3)
+
+
+class LatestWeatherTests(TestCase):
+    def latest(self, city):
+        return LatestWeather.objects.filter(city=city).values_list('date', flat=True).first()
+
+    def test_snapshot_follows_creates_corrections_and_deletes(self):
+        older = make_record('Oslo', date(2024, 1, 1))
+        newest = make_record('Oslo', date(2024, 1, 3))
+        self.assertEqual(self.latest('Oslo'), date(2024, 1, 3))
+
+        # An older record doesn't displace the snapshot
+        make_record('Oslo', date(2024, 1, 2))
+        self.assertEqual(self.latest('Oslo'), date(2024, 1, 3))
+
+        # Correcting the latest record back in time re-points the snapshot
+        newest.date = date(2023, 12, 1)
+        newest.save()
+        self.assertEqual(self.latest('Oslo'), date(2024, 1, 2))
+
+        # Moving a record to another city refreshes both cities
+        newest.city = 'Bergen'
+        newest.save()
+        self.assertEqual(self.latest('Bergen'), date(2023, 12, 1))
+        self.assertEqual(self.latest('Oslo'), date(2024, 1, 2))
+
+        WeatherRecord.objects.filter(city='Oslo', date=date(2024, 1, 2)).get().delete()
+        self.assertEqual(self.latest('Oslo'), date(2024, 1, 1))
+        older.delete()
+        self.assertIsNone(self.latest('Oslo'))
+
+
+class RollupTests(TestCase):
+    def month(self, city, month):
+        return MonthlyWeatherRollup.objects.get(city=city, month=month).stats()
+
+    def test_monthly_rollup_follows_creates_corrections_and_deletes(self):
+        january = date(2024, 1, 1)
+        first = make_record('Rome', date(2024, 1, 5), temp_high=14, temp_low=4)
+        make_record('Rome', date(2024, 1, 6), temp_high=18, temp_low=6)
+        stats = self.month('Rome', january)
+        self.assertEqual(stats['record_count'], 2)
+        self.assertEqual(stats['max_temp'], 18)
+        self.assertEqual(stats['min_temp'], 4)
+        self.assertAlmostEqual(stats['avg_temp'], 10.5)
+
+        # A correction can lower the extremes, which an increment alone couldn't
+        first.temp_low = 5
+        first.save()
+        self.assertEqual(self.month('Rome', january)['min_temp'], 5)
+
+        # Moving a record to another month updates both buckets
+        first.date = date(2024, 2, 1)
+        first.save()
+        self.assertEqual(self.month('Rome', january)['record_count'], 1)
+        self.assertEqual(self.month('Rome', date(2024, 2, 1))['record_count'], 1)
+
+        first.delete()
+        self.assertFalse(
+            MonthlyWeatherRollup.objects.filter(city='Rome', month=date(2024, 2, 1), record_count__gt=0).exists()
+        )
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        # Several cities share every date, so pages must break ties on id
+        for day in range(12):
+            for city in ('Ghent', 'Bruges', 'Liege'):
+                make_record(city, date(2024, 3, 1) + timedelta(days=day))
+
+    def test_pages_cover_every_record_once_newest_first(self):
+        seen = []
+        cursor = None
+        while True:
+            rows, cursor = keyset_page(WeatherRecord.objects.all(), 5, cursor=cursor)
+            seen.extend((row['date'], row['city']) for row in rows)
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 36)
+        self.assertEqual(len(set(seen)), 36)
+        self.assertEqual([day for day, _ in seen], sorted((day for day, _ in seen), reverse=True))
+
+    def test_api_next_cursor_walks_the_whole_city(self):
+        records = []
+        params = {'city': 'Ghent', 'limit': 5}
+        while True:
+            data = self.client.get(reverse('api_weather_data'), params).json()
+            records.extend(data['records'])
+            if not data['next']:
+                break
+            params['cursor'] = data['next']
+        self.assertEqual(len(records), 12)
+        self.assertEqual(len({record['date'] for record in records}), 12)
+
+    def test_malformed_cursor_is_a_bad_request(self):
+        response = self.client.get(reverse('api_weather_data'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        make_record('Porto', date(2024, 5, 1))
+
+    def test_etag_answers_304_until_the_city_changes(self):
+        url = reverse('api_weather_data')
+        first = self.client.get(url, {'city': 'Porto'})
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+
+        repeat = self.client.get(url, {'city': 'Porto'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(repeat.status_code, 304)
+
+        # Other parameters are a different representation
+        self.assertEqual(self.client.get(url, {'city': 'Porto', 'limit': 1}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        make_record('Porto', date(2024, 5, 2))
+        changed = self.client.get(url, {'city': 'Porto'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+        # Writes to another city leave this city's validator alone
+        make_record('Faro', date(2024, 5, 2))
+        self.assertEqual(self.client.get(url, {'city': 'Porto'}, HTTP_IF_NONE_MATCH=changed['ETag']).status_code, 304)
+
+
+@override_settings(WEATHER_PAGE_CACHE_ENABLED=False)
+class BadRequestTests(TestCase):
+    def assertBadRequest(self, name, params):
+        response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, 400, f'{name} {params}: {response.content[:200]!r}')
+
+    def test_trends_range(self):
+        for params in (
+            {'days': -5}, {'days': 'x'}, {'start': '2024-02-01', 'end': '2024-01-01'},
+            {'end': '9999-12-31'}, {'start': '0001-01-01', 'end': '2024-01-01'}, {'points': 'x'},
+        ):
+            self.assertBadRequest('weather_trends', params)
+        # An oversized days is clamped rather than overflowing
+        self.assertEqual(self.client.get(reverse('weather_trends'), {'days': 99999999}).status_code, 200)
+
+    def test_batch_range(self):
+        for params in (
+            {'days': 0}, {'start': '2024-02-01', 'end': '2024-01-01'}, {'end': '9999-12-31'},
+            {'start': '2023-01-01', 'end': '2024-06-01'}, {'format': 'xml'},
+        ):
+            self.assertBadRequest('api_weather_batch', {'cities': 'Porto', 'upstream': 0, **params})
+        self.assertBadRequest('api_weather_batch', {'days': 30})
+        response = self.client.get(reverse('api_weather_batch'), {'cities': 'Porto', 'upstream': 0, 'days': 99999999})
+        self.assertEqual(response.status_code, 200)
+
+    def test_observations_range(self):
+        for params in (
+            {'end': '9999-12-31'}, {'start': '2024-02-01', 'end': '2024-01-01'},
+            {'start': '2020-01-01', 'end': '2024-01-01'}, {'bucket': 'minute'},
+        ):
+            self.assertBadRequest('api_observations', {'cities': 'Porto', **params})
+        self.assertBadRequest('api_observations', {})
+
+    def test_export_range(self):
+        self.assertBadRequest('api_export', {'start': '2024-02-01', 'end': '2024-01-01'})
+        self.assertBadRequest('api_export', {'end': '9999-12-31'})
+        self.assertBadRequest('api_export', {'format': 'xlsx'})
+
+    def test_record_search_dates(self):
+        for query in ('9999', '9999-12', '9999-12-31', '..9999-12', '2024-13', '2024-02-30'):
+            self.assertBadRequest('api_search', {'q': query})
+        self.assertBadRequest('api_search', {'q': ''})
+
+    def test_bulk_mode_is_json_only(self):
+        self.assertBadRequest('api_weather_data', {'bulk': 1, 'format': 'msgpack'})
+
+
+class ScoreRankTests(TestCase):
+    def test_ranks_come_from_the_histogram(self):
+        for user_id, points in ((1, 30), (2, 30), (3, 20), (4, 10)):
+            scoring.grant_achievement(user_id, 'weather_watcher', 'Watched', points=points)
+
+        self.assertEqual(
+            [(row['user_id'], row['rank']) for row in scoring.top_scores(10)], [(1, 1), (2, 1), (3, 3), (4, 4)],
+        )
+        self.assertEqual(scoring.user_standing(4)['rank'], 4)
+
+        scoring.grant_achievement(4, 'explorer', 'Explored', points=25)
+        self.assertEqual(scoring.user_standing(4)['rank'], 1)
+        self.assertEqual(scoring.user_standing(3)['rank'], 4)
+
+        UserAchievement.objects.filter(user_id=1).delete()
+        self.assertIsNone(scoring.user_standing(1))
+        self.assertEqual(scoring.user_standing(3)['rank'], 3)
+
+        scoring.rebuild()
+        self.assertEqual(scoring.user_standing(3)['rank'], 3)
+
+
+class PrefetchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeOpenWeatherServer().__enter__()
+        cls.addClassCleanup(cls.server.__exit__, None, None, None)
+
+    def search(self, location, source):
+        SearchHistory.objects.create(location=location, source=source, found=True, result_count=1)
+
+    def test_only_new_or_prefetched_locations_are_refreshed(self):
+        today = timezone.localdate()
+        make_record('Station', today - timedelta(days=1))
+        for location, source in (('newcity', 'api'), ('newcity', 'api'), ('Station', 'database')):
+            self.search(location, source)
+        self.assertEqual(prefetch.missing_locations(10, 7), [('newcity', 2)])
+
+        client = OpenWeatherClient(api_key='test', base_url=self.server.url)
+        self.addCleanup(client.close)
+        stats = prefetch.prefetch(['newcity', 'unknown place'], client=client)
+        self.assertEqual((stats['written'], stats['not_found'], stats['errors']), (1, 1, 0))
+        self.assertEqual(PrefetchedLocation.objects.get().city, 'Newcity')
+
+        # Fetched today, so nothing is missing until tomorrow; the station city never is
+        self.assertEqual(prefetch.missing_locations(10, 7), [])
+        self.assertEqual(prefetch.missing_locations(10, 7, today=today + timedelta(days=1)), [('newcity', 2)])
+
+    def test_refresh_keeps_the_days_extremes(self):
+        today = timezone.localdate()
+        make_record('Newcity', today, temp_high=90, temp_low=-90)
+        client = OpenWeatherClient(api_key='test', base_url=self.server.url)
+        self.addCleanup(client.close)
+        prefetch.prefetch(['newcity'], client=client)
+        record = WeatherRecord.objects.get(city='Newcity', date=today)
+        self.assertEqual((record.temp_high, record.temp_low, record.temp_avg), (90, -90, 0))
@@ -0,0 +1,306 @@
+"""In-process columnar cache of each city's daily weather series.
+
+Every city's history is held as contiguous NumPy arrays sorted by date:
+``days`` (int days since 1970-01-01, the ``datetime64[D]`` epoch) plus one
+float column per measurement, with NaN for missing values. Series are loaded
+with one ``values_list`` pass for any number of cities and kept current by
+the WeatherRecord signal handlers: inserts are spliced into a loaded series
+and corrections, deletes and bulk writes evict it so it reloads on next use.
+Evictions only reach the process that saw the write, so entries also expire
+after ``SERIES_MAX_AGE`` seconds.
+
+Long ranges are reduced to a point budget for charting with
+Largest-Triangle-Three-Buckets or min/max bucketing; the reduced series are
+cached per (city, range, budget, method) until the city's data changes.
+"""
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from datetime import date
+from itertools import groupby
+from operator import itemgetter
+
+import numpy as np
+
+from .models import WeatherRecord
+
+COLUMNS = ('temp_high', 'temp_low', 'temp_avg', 'precipitation', 'humidity', 'wind_speed')
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+SERIES_MAX_AGE = 300  # seconds
+DOWNSAMPLE_CACHE_SIZE = 512
+DOWNSAMPLE_METHODS = ('lttb', 'minmax')
+
+
+def to_day(value):
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+def to_list(array, missing=0.0, decimals=1):
+    """Plain Python floats for templates and JSON, with NaN replaced by ``missing``"""
+    return np.round(np.nan_to_num(array, nan=missing), decimals).tolist()
+
+
+class CitySeries:
+    """Immutable date-sorted arrays for one city"""
+
+    def __init__(self, city, days, columns):
+        self.city = city
+        self.days = days
+        self.columns = columns
+
+    @classmethod
+    def from_rows(cls, city, rows):
+        """Build from ``(date, *COLUMNS)`` tuples sorted by date"""
+        if not rows:
+            return cls.empty(city)
+        values = list(zip(*rows))
+        days = np.fromiter((to_day(d) for d in values[0]), dtype=np.int32, count=len(rows))
+        # None becomes NaN in a float array
+        columns = {name: np.array(column, dtype=np.float64) for name, column in zip(COLUMNS, values[1:])}
+        return cls(city, days, columns)
+
+    @classmethod
+    def empty(cls, city):
+        return cls(city, np.empty(0, dtype=np.int32), {name: np.empty(0) for name in COLUMNS})
+
+    def __len__(self):
+        return len(self.days)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def slice(self, start=None, stop=None):
+        return CitySeries(self.city, self.days[start:stop], {
+            name: column[start:stop] for name, column in self.columns.items()
+        })
+
+    def since(self, day):
+        """Records dated on or after ``day`` (a date)"""
+        return self.slice(int(np.searchsorted(self.days, to_day(day), side='left')))
+
+    def between(self, start, end):
+        """Records dated from ``start`` to ``end`` inclusive"""
+        return self.slice(
+            int(np.searchsorted(self.days, to_day(start), side='left')),
+            int(np.searchsorted(self.days, to_day(end), side='right')),
+        )
+
+    def take(self, indices):
+        return CitySeries(self.city, self.days[indices], {
+            name: column[indices] for name, column in self.columns.items()
+        })
+
+    def downsample(self, name, budget, method='lttb'):
+        """Keep at most ``budget`` rows that preserve the shape of column ``name``.
+
+        Rows where ``name`` is missing are dropped first.
+        """
+        present = np.flatnonzero(~np.isnan(self.columns[name]))
+        y = self.columns[name][present]
+        if method == 'minmax':
+            chosen = minmax_indices(y, budget)
+        else:
+            chosen = lttb_indices(self.days[present].astype(np.float64), y, budget)
+        return self.take(present[chosen])
+
+    def tail(self, count):
+        return self.slice(max(0, len(self) - count))
+
+    def inserted(self, record):
+        """Return a copy with ``record`` spliced in at its date (replacing a same-day row)"""
+        day = to_day(record.date)
+        position = int(np.searchsorted(self.days, day, side='left'))
+        values = [np.nan if getattr(record, name) is None else getattr(record, name) for name in COLUMNS]
+        if position < len(self.days) and self.days[position] == day:
+            columns = {name: column.copy() for name, column in self.columns.items()}
+            for name, value in zip(COLUMNS, values):
+                columns[name][position] = value
+            return CitySeries(self.city, self.days, columns)
+        return CitySeries(self.city, np.insert(self.days, position, day), {
+            name: np.insert(self.columns[name], position, value) for name, value in zip(COLUMNS, values)
+        })
+
+    def date_strings(self):
+        return self.days.astype('datetime64[D]').astype(str).tolist()
+
+    def values(self, name, missing=0.0, decimals=1):
+        return to_list(self.columns[name], missing, decimals)
+
+    # --- Analytics -----------------------------------------------------------
+
+    def rolling_mean(self, name, window):
+        """Trailing mean over ``window`` rows, ignoring missing values"""
+        column = self.columns[name]
+        present = ~np.isnan(column)
+        sums = np.cumsum(np.where(present, column, 0.0))
+        counts = np.cumsum(present)
+        sums[window:] = sums[window:] - sums[:-window]
+        counts[window:] = counts[window:] - counts[:-window]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+    def percentiles(self, name, q=(10, 50, 90)):
+        column = self.columns[name]
+        column = column[~np.isnan(column)]
+        if not len(column):
+            return {p: None for p in q}
+        return dict(zip(q, np.percentile(column, q).tolist()))
+
+    def degree_days(self, base=18.0):
+        """Heating and cooling degree-days of the daily average temperature"""
+        temps = self.columns['temp_avg']
+        temps = temps[~np.isnan(temps)]
+        return {
+            'heating': float(np.clip(base - temps, 0, None).sum()),
+            'cooling': float(np.clip(temps - base, 0, None).sum()),
+        }
+
+    def anomalies(self, name='temp_avg', reference=None):
+        """Z-scores of ``name`` against the mean and spread of ``reference`` (default: self)"""
+        baseline = (reference or self).columns[name]
+        baseline = baseline[~np.isnan(baseline)]
+        column = self.columns[name]
+        if len(baseline) < 2 or not baseline.std():
+            return np.full(len(column), np.nan)
+        return (column - baseline.mean()) / baseline.std()
+
+
+def lttb_indices(x, y, budget):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept; every bucket in between
+    contributes the point forming the largest triangle with the previously
+    kept point and the average of the next bucket.
+    """
+    count = len(x)
+    if budget >= count or budget < 3:
+        return np.arange(count)
+
+    every = (count - 2) / (budget - 2)
+    kept = np.empty(budget, dtype=np.int64)
+    kept[0], kept[-1] = 0, count - 1
+    previous = 0
+    for bucket in range(budget - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, count)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+    return kept
+
+
+def minmax_indices(y, budget):
+    """Indices of the minimum and maximum of each of ``budget // 2`` buckets, in order"""
+    count = len(y)
+    if budget >= count or budget < 2:
+        return np.arange(count)
+    kept = []
+    for bucket in np.array_split(np.arange(count), budget // 2):
+        kept.extend((bucket[np.argmin(y[bucket])], bucket[np.argmax(y[bucket])]))
+    return np.unique(kept)
+
+
+class SeriesCache:
+    def __init__(self, max_age=SERIES_MAX_AGE):
+        self.max_age = max_age
+        self._series = {}  # city -> (loaded_at, CitySeries)
+        self._downsampled = OrderedDict()  # (city, start, end, budget, method) -> (weakref to source, CitySeries)
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        self.downsample_hits = self.downsample_misses = 0
+
+    def get(self, city):
+        return self.get_many([city])[city]
+
+    def get_many(self, cities):
+        """Return ``{city: CitySeries}``, loading every missing city in one query"""
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            for city in cities:
+                entry = self._series.get(city)
+                if entry is not None and now - entry[0] < self.max_age:
+                    found[city] = entry[1]
+                else:
+                    missing.append(city)
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        if missing:
+            loaded = self._load(missing)
+            with self._lock:
+                for city, series in loaded.items():
+                    self._series[city] = (now, series)
+            found.update(loaded)
+        return found
+
+    def downsampled(self, city, start, end, budget, method='lttb'):
+        """``temp_avg`` of ``city`` between two dates reduced to ``budget`` points.
+
+        Reduced series are cached until the city's full series is replaced
+        by an insert, eviction or reload.
+        """
+        series = self.get(city)
+        key = (city, start, end, budget, method)
+        with self._lock:
+            entry = self._downsampled.get(key)
+            if entry is not None and entry[0]() is series:
+                self._downsampled.move_to_end(key)
+                self.downsample_hits += 1
+                return entry[1]
+            self.downsample_misses += 1
+
+        reduced = series.between(start, end).downsample('temp_avg', budget, method)
+        with self._lock:
+            self._downsampled[key] = (weakref.ref(series), reduced)
+            self._downsampled.move_to_end(key)
+            while len(self._downsampled) > DOWNSAMPLE_CACHE_SIZE:
+                self._downsampled.popitem(last=False)
+        return reduced
+
+    def record_added(self, record):
+        with self._lock:
+            entry = self._series.get(record.city)
+            if entry is not None:
+                self._series[record.city] = (entry[0], entry[1].inserted(record))
+
+    def invalidate(self, cities=None):
+        with self._lock:
+            if cities is None:
+                self._series.clear()
+            for city in cities or ():
+                self._series.pop(city, None)
+
+    def _load(self, cities):
+        rows = WeatherRecord.objects.filter(city__in=cities).order_by('city', 'date').values_list(
+            'city', 'date', *COLUMNS
+        )
+        series = {
+            city: CitySeries.from_rows(city, [row[1:] for row in group])
+            for city, group in groupby(rows.iterator(chunk_size=10000), key=itemgetter(0))
+        }
+        for city in cities:
+            series.setdefault(city, CitySeries.empty(city))
+        return series
+
+
+cache = SeriesCache()
+
+
+def get_series(city):
+    return cache.get(city)
+
+
+def get_many(cities):
+    return cache.get_many(cities)
+
+
+def get_downsampled(city, start, end, budget, method='lttb'):
+    return cache.downsampled(city, start, end, budget, method)
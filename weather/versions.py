@@ -0,0 +1,71 @@
+"""Per-city data versions and conditional GET validators for the JSON API.
+
+``CityDataVersion`` rows are bumped by the WeatherRecord signal handlers on
+every save, delete and bulk write. API views derive an ETag and
+Last-Modified from them with a single query on that small table, so Django's
+``condition`` decorator can answer ``If-None-Match`` / ``If-Modified-Since``
+with a 304 before any WeatherRecord row is read.
+"""
+import hashlib
+
+from django.db.models import Count, Exists, F, Max, OuterRef, Sum
+from django.utils import timezone
+
+from .models import CityDataVersion, LatestWeather
+
+
+def bump(cities):
+    """Advance the version of every city in ``cities``"""
+    cities = set(cities)
+    if not cities:
+        return
+    now = timezone.now()
+    existing = set(CityDataVersion.objects.filter(city__in=cities).values_list('city', flat=True))
+    if existing:
+        CityDataVersion.objects.filter(city__in=existing).update(version=F('version') + 1, updated_at=now)
+    CityDataVersion.objects.bulk_create(
+        [CityDataVersion(city=city, updated_at=now) for city in cities - existing],
+        ignore_conflicts=True,
+    )
+
+
+def city_state(city, iexact=False):
+    """Return ``(token, last_modified)`` for one city, or None if it has no data"""
+    lookup = {'city__iexact' if iexact else 'city': city}
+    has_data = Exists(LatestWeather.objects.filter(city=OuterRef('city')))
+    row = CityDataVersion.objects.filter(has_data, **lookup).values_list('city', 'version', 'updated_at').first()
+    if row is None:
+        return None
+    return f'{row[0]}:{row[1]}', row[2]
+
+
+def city_tokens(cities=None):
+    """Map cities (default: all) to their version tokens in one query"""
+    rows = CityDataVersion.objects.all()
+    if cities is not None:
+        rows = rows.filter(city__in=cities)
+    return {city: f'{city}:{version}' for city, version in rows.values_list('city', 'version')}
+
+
+def global_state():
+    """Return ``(token, last_modified)`` covering every city"""
+    state = CityDataVersion.objects.aggregate(
+        cities=Count('id'), versions=Sum('version'), updated_at=Max('updated_at')
+    )
+    return f"{state['cities']}:{state['versions'] or 0}", state['updated_at']
+
+
+def request_state(request, city=None, iexact=False):
+    """Memoize the data state on the request so ETag and Last-Modified share one query"""
+    if not hasattr(request, '_data_state'):
+        request._data_state = city_state(city, iexact) if city else global_state()
+    return request._data_state
+
+
+def make_etag(request, state):
+    """ETag for ``state``, the exact query parameters and the ``Accept`` header of ``request``"""
+    if state is None:
+        return None
+    accept = request.headers.get('Accept', '')
+    digest = hashlib.sha1(f'{request.path}?{request.GET.urlencode()}|{accept}|{state[0]}'.encode()).hexdigest()
+    return digest[:32]
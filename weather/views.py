@@ -1,116 +1,138 @@
+from django.conf import settings
+from django.db import router
 from django.shortcuts import render
-from django.db.models import Avg, Max, Min, Count, Q
-from django.http import JsonResponse
-from .models import WeatherRecord, UserAchievement, SearchHistory
-from datetime import datetime, timedelta
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition, require_POST
+from .models import LatestWeather, WeatherRecord, UserAchievement, UserScore
+from .latest import latest_records as get_latest_records
+from .pagination import API_RECORD_FIELDS, api_record, keyset_page, stream_records_json
+from .rollups import monthly_stats, rolling_stats
+from .search import parse_query, search_records
+from .db import read_replica
+from .renderers import negotiate, render as render_api, shape
+from . import export, feeds, geo, history, metrics, observations, openweather, pagecache, scoring, searchstats, timeseries, versions
+from datetime import date, timedelta
+import hmac
 import json
+import math
+import httpx
 import requests
-from dotenv import load_dotenv
-import os
 
-# Load environment variables from .env file
-load_dotenv()
+MAX_PAGE_SIZE = 1000
+EARLIEST_DATE = date(1800, 1, 1)  # Dates accepted in start/end, well inside date.min/date.max
+LATEST_DATE = date(2999, 12, 31)
+MAX_BATCH_CITIES = 50
+MAX_BATCH_DAYS = 366
+MAX_OBSERVATION_BUCKETS = 2000
+MAX_SEARCH_RESULTS = 500
+DEFAULT_TREND_POINTS = 200
+MAX_TREND_POINTS = 2000
+DEFAULT_LEADERBOARD_SIZE = 10
+MAX_LEADERBOARD_SIZE = 100
+DEFAULT_POPULAR_DAYS = 7
+MAX_POPULAR_SIZE = 100
+DEFAULT_NEARBY = 5
+MAX_NEARBY = 100
+NEARBY_SEARCH_CANDIDATES = 10  # nearest cities tried for a lat/lon search before giving up
+NEARBY_FIELDS = ['city', 'latitude', 'longitude', 'distance_km'] + API_RECORD_FIELDS[1:]
 
-# Replace hardcoded API key with environment variable
-OPENWEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY')
-
-# Debugging: Log the loaded API key
-print(f"Loaded API Key: {OPENWEATHER_API_KEY}")
 
+@read_replica
+@pagecache.cached_page('dashboard')
 def dashboard(request):
     """Main dashboard with recent weather data and analytics"""
     records = WeatherRecord.objects.all()[:30]
     
-    # Get unique cities
-    cities = WeatherRecord.objects.values_list('city', flat=True).distinct()
-    
-    # Get latest records by city
-    latest_records = []
-    for city in cities:
-        latest = WeatherRecord.objects.filter(city=city).latest('date')
-        latest_records.append(latest)
+    # Latest record of every city, read from the snapshot table in one query
+    latest_records = get_latest_records()
     
     context = {
         'records': records,
         'latest_records': latest_records,
         'total_records': WeatherRecord.objects.count(),
-        'cities_count': len(cities),
+        'cities_count': len(latest_records),
+        'city_versions': versions.city_tokens(),
     }
     return render(request, 'dashboard.html', context)
 
 
+@read_replica
+@pagecache.cached_page('city_analytics', city=lambda city_name: city_name)
 def city_analytics(request, city_name):
     """Detailed analytics for a specific city"""
     city_records = WeatherRecord.objects.filter(city=city_name).order_by('-date')
     
-    # Calculate statistics for the last 30 days
-    thirty_days_ago = datetime.now().date() - timedelta(days=30)
-    recent_records = city_records.filter(date__gte=thirty_days_ago)
-    
-    stats = recent_records.aggregate(
-        avg_temp=Avg('temp_avg'),
-        max_temp=Max('temp_high'),
-        min_temp=Min('temp_low'),
-        total_precipitation=Avg('precipitation'),
-        avg_humidity=Avg('humidity'),
-        avg_wind=Avg('wind_speed'),
-        record_count=Count('id')
-    )
+    # Statistics for the last 30 days, read from the rolling rollup
+    stats = rolling_stats([city_name]).get(city_name, {})
+    
+    # Chart and derived statistics are computed from the cached columnar series
+    series = timeseries.get_series(city_name)
     
     context = {
         'city': city_name,
         'records': city_records[:30],
         'stats': stats,
-        'chart_data': generate_chart_data(city_records[:30])
+        'monthly_stats': monthly_stats(city_name),
+        'series_stats': generate_series_stats(series),
+        'chart_data': generate_chart_data(series)
     }
     return render(request, 'analytics.html', context)
 
 
+@read_replica
+@pagecache.cached_page('weather_comparison')
 def weather_comparison(request):
     """Compare weather across multiple cities"""
-    cities = WeatherRecord.objects.values_list('city', flat=True).distinct()
+    latest_by_city = {record.city: record for record in get_latest_records()}
+    cities = sorted(latest_by_city)
+    
+    # 30-day statistics for every city, read from the rolling rollups
+    stats_by_city = rolling_stats(cities)
     
     comparison_data = {}
     for city in cities:
-        latest = WeatherRecord.objects.filter(city=city).latest('date')
-        thirty_days_ago = datetime.now().date() - timedelta(days=30)
-        recent_stats = WeatherRecord.objects.filter(
-            city=city,
-            date__gte=thirty_days_ago
-        ).aggregate(
-            avg_temp=Avg('temp_avg'),
-            max_temp=Max('temp_high'),
-            min_temp=Min('temp_low'),
-            total_precipitation=Avg('precipitation')
-        )
         comparison_data[city] = {
-            'latest': latest,
-            'stats': recent_stats
+            'latest': latest_by_city[city],
+            'stats': stats_by_city.get(city, {})
         }
     
     context = {
         'comparison_data': comparison_data,
-        'cities': list(cities)
+        'cities': cities,
+        'city_versions': versions.city_tokens(cities),
     }
     return render(request, 'comparison.html', context)
 
 
+@read_replica
+@pagecache.cached_page('weather_trends')
 def weather_trends(request):
-    """Display weather trends and forecasts"""
-    # Get all records from last 60 days grouped by city
-    sixty_days_ago = datetime.now().date() - timedelta(days=60)
-    records = WeatherRecord.objects.filter(date__gte=sixty_days_ago).order_by('city', 'date')
-    
-    # Group by city
-    trends = {}
-    for record in records:
-        if record.city not in trends:
-            trends[record.city] = []
-        trends[record.city].append(record)
+    """Display weather trends over any date range.
+
+    ``start``/``end`` (ISO dates) or ``days`` pick the range (default: last 60
+    days) and ``points`` caps how many points each city's chart gets; longer
+    series are downsampled server-side with ``method`` (``lttb`` or ``minmax``).
+    """
+    try:
+        start, end = parse_date_range(request, default_days=60)
+        points = max(3, min(int(request.GET.get('points', DEFAULT_TREND_POINTS)), MAX_TREND_POINTS))
+    except ValueError as e:
+        return HttpResponseBadRequest(f'Invalid trend range: {e}')
+    method = request.GET.get('method', 'lttb')
+    if method not in timeseries.DOWNSAMPLE_METHODS:
+        return HttpResponseBadRequest(f'method must be one of {", ".join(timeseries.DOWNSAMPLE_METHODS)}')
+    
+    # Cities with data on or after the start of the range
+    cities = LatestWeather.objects.filter(date__gte=start).order_by('city').values_list('city', flat=True)
     
     context = {
-        'trends': trends,
-        'chart_data': generate_trend_chart_data(records)
+        'start': start,
+        'end': end,
+        'points': points,
+        'chart_data': generate_trend_chart_data(cities, start, end, points, method)
     }
     return render(request, 'trends.html', context)
 
@@ -118,73 +140,373 @@ def weather_trends(request):
 def user_achievements(request, user_id=1):
     """Display user achievements and gamification stats"""
     achievements = UserAchievement.objects.filter(user_id=user_id).order_by('-achieved_at')
-    total_points = sum(a.points for a in achievements)
+    
+    # Totals come from the denormalized score row instead of summing every achievement
+    score = UserScore.objects.filter(user_id=user_id).first()
+    total_points = score.total_points if score else 0
     
     context = {
         'user_id': user_id,
         'achievements': achievements,
         'total_points': total_points,
-        'achievements_count': achievements.count(),
+        'achievements_count': score.achievements_count if score else 0,
         'next_milestone': calculate_next_milestone(total_points)
     }
     return render(request, 'achievements.html', context)
 
 
+def leaderboard(request):
+    """Top ``limit`` users by achievement points, plus the standing of ``user_id`` if given"""
+    try:
+        limit = max(1, min(int(request.GET.get('limit', DEFAULT_LEADERBOARD_SIZE)), MAX_LEADERBOARD_SIZE))
+        user_id = int(request.GET['user_id']) if request.GET.get('user_id') else None
+    except ValueError:
+        return JsonResponse({'error': 'limit and user_id must be integers'}, status=400)
+    
+    data = {'top': scoring.top_scores(limit)}
+    if user_id is not None:
+        data['user'] = scoring.user_standing(user_id)
+    return JsonResponse(data)
+
+
+def cache_stats(request):
+    """Hit rates of the page, fragment and OpenWeather caches in this process"""
+    stats = pagecache.stats()
+    stats['openweather'] = openweather.get_client().stats()
+    return JsonResponse(stats)
+
+
+def metrics_view(request):
+    """Prometheus metrics, merged across worker processes in multiprocess mode"""
+    body, content_type = metrics.exposition()
+    return HttpResponse(body, content_type=content_type)
+
+
+def weather_data_etag(request):
+    return versions.make_etag(request, versions.request_state(request, request.GET.get('city')))
+
+
+def weather_data_last_modified(request):
+    state = versions.request_state(request, request.GET.get('city'))
+    return state[1] if state else None
+
+
+@read_replica
+@gzip_page
+@condition(etag_func=weather_data_etag, last_modified_func=weather_data_last_modified)
 def api_weather_data(request):
-    """API endpoint for weather data"""
+    """API endpoint for weather data.
+
+    Returns ``limit`` records (``days`` is accepted as an alias) newest first,
+    plus a ``next`` cursor to pass back as ``cursor`` for the following page.
+    With ``bulk=1`` every matching record is streamed as JSON in a single
+    response; other formats are refused there. Pages are rendered in the format negotiated by ``weather.renderers``.
+    """
     city = request.GET.get('city', None)
-    days = int(request.GET.get('days', 30))
+    try:
+        limit = int(request.GET.get('limit', request.GET.get('days', 30)))
+        fmt = negotiate(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     
     query = WeatherRecord.objects.all()
     if city:
         query = query.filter(city=city)
     
-    records = query.order_by('-date')[:days]
+    if request.GET.get('bulk') in ('1', 'true'):
+        if fmt != 'json':
+            return JsonResponse({'error': 'bulk=1 streams JSON only; use /api/export/ for other formats'}, status=400)
+        # The body is produced after the view returns, so pin the replica routing now
+        query = query.using(router.db_for_read(WeatherRecord))
+        response = StreamingHttpResponse(stream_records_json(query), content_type='application/json')
+        response['Cache-Control'] = 'no-store'
+        return response
+    
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    try:
+        data, next_cursor = keyset_page(query, limit, cursor=request.GET.get('cursor'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return render_api({'records': shape(data, fmt, API_RECORD_FIELDS), 'next': next_cursor}, fmt)
+
+
+def requested_cities(request):
+    """Cities from repeated ``city`` and comma-separated ``cities`` parameters, in order"""
+    names = request.GET.getlist('city')
+    for value in request.GET.getlist('cities'):
+        names.extend(value.split(','))
+    return list(dict.fromkeys(name.strip() for name in names if name.strip()))
+
+
+def parse_date_range(request, default_days=None, max_days=None):
+    """Return ``(start, end)`` from the ``start``/``end`` (ISO dates) and ``days`` parameters.
+
+    ``end`` defaults to today and ``start`` to ``days`` (inclusive, default
+    ``default_days``) before it; ``days`` is clamped to ``max_days`` and to
+    EARLIEST_DATE. Without a ``default_days`` an absent bound stays None.
+    Raises ValueError for malformed or out-of-range dates, a non-positive
+    ``days``, ``start`` after ``end`` or an explicit range over ``max_days``.
+    """
+    start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else None
+    end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else None
+    for value in (start, end):
+        if value is not None and not EARLIEST_DATE <= value <= LATEST_DATE:
+            raise ValueError(f'dates must be between {EARLIEST_DATE} and {LATEST_DATE}')
+
+    if default_days is not None:
+        end = end or timezone.localdate()
+        if start is None:
+            try:
+                days = int(request.GET.get('days', default_days))
+            except ValueError:
+                raise ValueError('days must be an integer')
+            if days < 1:
+                raise ValueError('days must be at least 1')
+            days = min(days, max_days or days, (end - EARLIEST_DATE).days + 1)
+            start = end - timedelta(days=days - 1)
+    if start is not None and end is not None:
+        if start > end:
+            raise ValueError(f'start {start} is after end {end}')
+        if max_days and (end - start).days >= max_days:
+            raise ValueError(f'{start} to {end} is longer than {max_days} days')
+    return start, end
+
+
+@read_replica
+@gzip_page
+def api_weather_batch(request):
+    """API endpoint for the records of several cities over one date range.
+
+    ``cities`` (comma-separated, or repeated ``city``) names up to
+    ``MAX_BATCH_CITIES`` cities; ``start``/``end`` (ISO dates) or ``days``
+    pick the range (default: last 30 days). Records come from a single
+    ``city__in`` query, newest first per city. Cities without any records are
+    looked up on OpenWeather concurrently, unless ``upstream=0``.
+    """
+    try:
+        fmt = negotiate(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    cities = requested_cities(request)
+    if not cities:
+        return JsonResponse({'error': 'cities parameter is required'}, status=400)
+    if len(cities) > MAX_BATCH_CITIES:
+        return JsonResponse({'error': f'At most {MAX_BATCH_CITIES} cities per request'}, status=400)
+    
+    try:
+        start, end = parse_date_range(request, default_days=30, max_days=MAX_BATCH_DAYS)
+    except ValueError as e:
+        return JsonResponse({'error': f'Invalid date range: {e}'}, status=400)
+    
+    records = {city: [] for city in cities}
+    rows = WeatherRecord.objects.filter(
+        city__in=cities, date__gte=start, date__lte=end
+    ).order_by('city', '-date').values_list(*API_RECORD_FIELDS)
+    for row in rows:
+        records[row[0]].append(api_record(row))
+    results = {
+        city: {'source': 'database', 'records': shape(city_records, fmt, API_RECORD_FIELDS)}
+        for city, city_records in records.items()
+    }
+    
+    # Cities with no rows in range but data on other dates are answered with an empty list
+    empty = [city for city, city_records in records.items() if not city_records]
+    known = set(LatestWeather.objects.filter(city__in=empty).order_by().values_list('city', flat=True)) if empty else set()
+    unknown = [city for city in empty if city not in known]
+    if unknown and request.GET.get('upstream') not in ('0', 'false'):
+        for city, response in openweather.get_client().current_weather_many(unknown).items():
+            if isinstance(response, Exception):
+                results[city] = {'source': 'openweather_api', 'error': f'API request failed: {response}'}
+            elif response.status_code == 200:
+                results[city] = api_search_data(city, response.data)
+            else:
+                results[city] = {'source': 'openweather_api', 'error': f'Location not found: {city}'}
+    
+    return render_api({'start': start.isoformat(), 'end': end.isoformat(), 'cities': results}, fmt)
+
+
+@read_replica
+@gzip_page
+def api_observations(request):
+    """Sub-daily observations bucketed by ``hour`` (default), ``day`` or ``week``.
+
+    ``cities`` (comma-separated, or repeated ``city``) is required;
+    ``start``/``end`` (ISO dates, inclusive) or ``days`` pick the range
+    (default: last 7 days). Each bucket has the reading count, min/max/avg
+    temperature, total precipitation, average humidity and average/max wind
+    speed.
+    """
+    try:
+        fmt = negotiate(request)
+        start, end = parse_date_range(request, default_days=7)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    bucket = request.GET.get('bucket', 'hour')
+    if bucket not in observations.BUCKETS:
+        return JsonResponse({'error': f"bucket must be one of: {', '.join(observations.BUCKETS)}"}, status=400)
+    cities = requested_cities(request)
+    if not cities or len(cities) > MAX_BATCH_CITIES:
+        return JsonResponse({'error': f'Between 1 and {MAX_BATCH_CITIES} cities are required'}, status=400)
+    if observations.bucket_count(start, end, bucket) > MAX_OBSERVATION_BUCKETS:
+        return JsonResponse(
+            {'error': f'Invalid range: {start} to {end} (at most {MAX_OBSERVATION_BUCKETS} {bucket} buckets)'},
+            status=400,
+        )
+    
+    rows = observations.aggregate(cities, start, end, bucket)
+    return render_api({
+        'bucket': bucket,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'buckets': shape(rows, fmt, observations.AGGREGATE_FIELDS),
+    }, fmt)
+
+
+@read_replica
+def api_export(request):
+    """Stream every matching record as CSV (``format=csv``, the default), ``csv.gz`` or ``parquet``.
+
+    ``cities`` (comma-separated, or repeated ``city``) and ``start``/``end``
+    (ISO dates) filter the export; without them the whole history is sent.
+    Rows are ordered by city, then date.
+    """
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        return JsonResponse({'error': f"format must be one of: {', '.join(export.FORMATS)}"}, status=400)
+    if fmt == 'parquet' and not export.parquet_available():
+        return JsonResponse({'error': 'Parquet export requires the pyarrow package'}, status=501)
+    try:
+        start, end = parse_date_range(request)
+    except ValueError as e:
+        return JsonResponse({'error': f'Invalid date range: {e}'}, status=400)
+    
+    # The body is produced after the view returns, so pin the replica routing now
+    records = export.export_queryset(requested_cities(request), start, end)
+    records = records.using(router.db_for_read(WeatherRecord))
     
-    data = [{
-        'city': r.city,
-        'date': r.date.isoformat(),
-        'temp_high': r.temp_high,
-        'temp_low': r.temp_low,
-        'temp_avg': r.temp_avg,
-        'precipitation': r.precipitation,
-        'humidity': r.humidity,
-        'wind_speed': r.wind_speed,
-        'condition': r.condition,
-    } for r in records]
+    content_type, extension = export.FORMATS[fmt]
+    response = StreamingHttpResponse(export.stream(export.iter_rows(records), fmt), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="weather-export.{extension}"'
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+@read_replica
+@gzip_page
+def api_nearby(request):
+    """The ``k`` cities nearest to ``lat``/``lon`` with their latest records, nearest first.
+
+    ``k`` defaults to 5 (at most 100) and ``radius`` (km) limits the distance.
+    Cities come from the in-memory spatial index of Location coordinates
+    (see ``weather.geo``) and their records from one LatestWeather query;
+    record fields are null for cities without records.
+    """
+    try:
+        fmt = negotiate(request)
+        point = requested_point(request)
+        k = max(1, min(int(request.GET.get('k', DEFAULT_NEARBY)), MAX_NEARBY))
+        radius = max(0.0, float(request.GET['radius'])) if request.GET.get('radius') else None
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if point is None:
+        return JsonResponse({'error': 'lat and lon are required'}, status=400)
     
-    return JsonResponse({'records': data})
+    matches = geo.nearest(*point, k=k, max_km=radius)
+    latest = {
+        row[0]: row
+        for row in LatestWeather.objects.filter(city__in=[match.city for match in matches]).order_by().values_list(
+            'city', *[f'record__{name}' for name in API_RECORD_FIELDS[1:]]
+        )
+    }
+    results = []
+    for match in matches:
+        row = latest.get(match.city)
+        record = api_record(row) if row else dict.fromkeys(API_RECORD_FIELDS, None)
+        results.append({
+            'city': match.city,
+            'latitude': match.latitude,
+            'longitude': match.longitude,
+            'distance_km': round(match.distance_km, 3),
+            **{name: record[name] for name in API_RECORD_FIELDS[1:]},
+        })
+    return render_api({
+        'lat': point[0],
+        'lon': point[1],
+        'results': shape(results, fmt, NEARBY_FIELDS),
+    }, fmt)
+
 
+@csrf_exempt
+@require_POST
+def api_ingest(request):
+    """Upsert a streamed NDJSON body of observations (or daily records with ``?kind=records``).
 
-def generate_chart_data(records):
-    """Generate data for charts"""
-    dates = []
-    temps_high = []
-    temps_low = []
-    temps_avg = []
+    Lines are validated and written in batches as they arrive. The response
+    counts ``accepted`` and ``rejected`` rows and the body ``lines`` that are
+    committed; it is 429 with ``Retry-After`` when the write queue is full.
+    Requires ``Authorization: Bearer <INGEST_FEED_TOKEN>`` when that is set.
+    """
+    token = settings.INGEST_FEED_TOKEN
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return JsonResponse({'error': 'Invalid or missing ingest token'}, status=401)
+    kind = request.GET.get('kind', feeds.DEFAULT_KIND)
+    if kind not in feeds.KINDS:
+        return JsonResponse({'error': f"kind must be one of: {', '.join(feeds.KINDS)}"}, status=400)
     
-    for record in reversed(records):
-        dates.append(str(record.date))
-        temps_high.append(record.temp_high)
-        temps_low.append(record.temp_low)
-        temps_avg.append(record.temp_avg or 0)
+    writer = feeds.get_writer()
+    if writer.saturated():
+        # Refuse before reading anything rather than part way through the body
+        result = {'status': 429, 'error': 'Ingest queue is full; retry later.', 'accepted': 0, 'rejected': 0, 'lines': 0}
+        metrics.INGEST_FEED_THROTTLED.inc()
+    else:
+        result = feeds.receive(feeds.body_stream(request), kind, writer)
+    
+    status = result.pop('status')
+    response = JsonResponse(result, status=status)
+    if status == 429:
+        response['Retry-After'] = str(settings.INGEST_FEED_RETRY_AFTER)
+    return response
+
+
+def generate_chart_data(series, days=30):
+    """Generate data for charts from the last ``days`` points of a CitySeries"""
+    # Rolling mean over the full series so the first charted days have a full window
+    rolling = series.rolling_mean('temp_avg', 7)[-days:]
+    recent = series.tail(days)
     
     return {
-        'dates': dates,
-        'temps_high': temps_high,
-        'temps_low': temps_low,
-        'temps_avg': temps_avg,
+        'dates': recent.date_strings(),
+        'temps_high': recent.values('temp_high'),
+        'temps_low': recent.values('temp_low'),
+        'temps_avg': recent.values('temp_avg'),
+        'temps_rolling': timeseries.to_list(rolling),
     }
 
 
-def generate_trend_chart_data(records):
-    """Generate trend data for visualization"""
+def generate_series_stats(series, days=30):
+    """Percentiles, degree-days and the latest anomaly for a CitySeries"""
+    if not len(series):
+        return {}
+    percentiles = series.percentiles('temp_avg', (10, 50, 90))
+    latest_anomaly = series.tail(1).anomalies('temp_avg', reference=series)[0]
+    return {
+        'p10': percentiles[10],
+        'p50': percentiles[50],
+        'p90': percentiles[90],
+        'degree_days': series.tail(days).degree_days(),
+        'latest_anomaly': None if math.isnan(latest_anomaly) else float(latest_anomaly),
+    }
+
+
+def generate_trend_chart_data(cities, start, end, points, method='lttb'):
+    """Generate trend data for visualization, at most ``points`` per city"""
+    timeseries.get_many(cities)  # Load every missing series in one query
     by_city = {}
-    for record in records:
-        if record.city not in by_city:
-            by_city[record.city] = {'dates': [], 'temps': []}
-        by_city[record.city]['dates'].append(str(record.date))
-        by_city[record.city]['temps'].append(record.temp_avg or 0)
+    for city in cities:
+        series = timeseries.get_downsampled(city, start, end, points, method)
+        if len(series):
+            by_city[city] = {'dates': series.date_strings(), 'temps': series.values('temp_avg')}
     
     return by_city
 
@@ -194,131 +516,262 @@ def calculate_next_milestone(current_points):
     milestones = [50, 100, 250, 500, 1000]
     for milestone in milestones:
         if current_points < milestone:
-            return {'points': milestone, 'remaining': milestone - current_points}
-    return {'points': 1500, 'remaining': 1500 - current_points}
+            return milestone_progress(current_points, milestone)
+    return milestone_progress(current_points, 1500)
+
 
+def milestone_progress(current_points, milestone):
+    return {
+        'points': milestone,
+        'remaining': milestone - current_points,
+        'percent': max(0, min(100, round(current_points * 100 / milestone))),
+    }
+
+
+def location_etag(request):
+    # Only database answers are versioned; OpenWeather lookups always run
+    location = request.GET.get('location', '').strip()
+    if not location:
+        return None
+    return versions.make_etag(request, versions.request_state(request, location, iexact=True))
 
+
+@gzip_page
+@condition(etag_func=location_etag)
 def search_location(request):
-    """Search for weather data by location - checks database first, then OpenWeather API"""
+    """Search for weather data by location - checks database first, then OpenWeather API.
+
+    ``lat``/``lon`` instead of ``location`` answers from the nearest city with
+    records within ``GEO_SEARCH_RADIUS_KM``, without calling OpenWeather.
+    """
     location = request.GET.get('location', '').strip()
     
+    try:
+        point = None if location else requested_point(request)
+        fmt = negotiate(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if point is not None:
+        return coordinate_search(point, fmt)
     if not location:
-        return JsonResponse({'error': 'Location parameter is required'}, status=400)
+        return JsonResponse({'error': 'Location parameter (or lat and lon) is required'}, status=400)
     
     # First, try to find in database
-    db_records = WeatherRecord.objects.filter(
+    db_records = list(WeatherRecord.objects.filter(
         city__iexact=location
-    ).order_by('-date')[:7]
+    ).order_by('-date')[:7])
     
-    if db_records.exists():
+    if db_records:
         # Found in database - save to search history
-        SearchHistory.objects.create(
-            location=location,
-            source='database',
-            result_count=len(db_records),
-            found=True
-        )
-        
-        # Found in database
-        data = {
-            'source': 'database',
-            'location': location,
-            'records': [{
-                'city': r.city,
-                'date': r.date.isoformat(),
-                'temp_high': r.temp_high,
-                'temp_low': r.temp_low,
-                'temp_avg': r.temp_avg,
-                'precipitation': r.precipitation,
-                'humidity': r.humidity,
-                'wind_speed': r.wind_speed,
-                'condition': r.get_condition_display(),
-            } for r in db_records]
-        }
-        return JsonResponse(data)
+        history.record_search(location, 'database', result_count=len(db_records), found=True)
+        data = database_search_data(location, db_records)
+        data['records'] = shape(data['records'], fmt, API_RECORD_FIELDS)
+        return render_api(data, fmt)
     
-    # Not in database, try OpenWeather API
+    # Not in database, try OpenWeather API (pooled, cached and coalesced per location)
     try:
-        # You need to set your OpenWeather API key
-        # OPENWEATHER_API_KEY='your_api_key_here' # Replace with actual API key
-        
-        # Get current weather
-        url = f'https://api.openweathermap.org/data/2.5/weather?q={location}&appid={OPENWEATHER_API_KEY}&units=metric'
-        response = requests.get(url, timeout=5)
-        
-        # Debugging: Log the API response
-        print(f"API Response: {response.json()}")
-        
-        if response.status_code == 200:
-            weather_data = response.json()
-            
-            # Save successful API search to history
-            SearchHistory.objects.create(
-                location=location,
-                source='api',
-                result_count=1,
-                found=True
-            )
-            
-            # Format the response
-            data = {
-                'source': 'openweather_api',
-                'location': weather_data.get('name', location),
-                'current': {
-                    'temp': weather_data['main']['temp'],
-                    'temp_high': weather_data['main']['temp_max'],
-                    'temp_low': weather_data['main']['temp_min'],
-                    'humidity': weather_data['main']['humidity'],
-                    'wind_speed': weather_data.get('wind', {}).get('speed', None),
-                    'condition': weather_data['weather'][0]['main'],
-                    'description': weather_data['weather'][0]['description'],
-                }
-            }
-            return JsonResponse(data)
-        else:
-            # Save failed search to history
-            SearchHistory.objects.create(
-                location=location,
-                source='api',
-                result_count=0,
-                found=False
-            )
-            return JsonResponse({'error': f'Location not found: {location}'}, status=404)
+        response = openweather.get_client().current_weather(location)
+        found = response.status_code == 200
+        history.record_search(location, 'api', result_count=1 if found else 0, found=found)
+        if found:
+            return render_api(api_search_data(location, response.data), fmt)
+        return JsonResponse({'error': f'Location not found: {location}'}, status=404)
     
     except requests.exceptions.RequestException as e:
         # Save failed API request to history
-        SearchHistory.objects.create(
-            location=location,
-            source='api',
-            result_count=0,
-            found=False
-        )
+        history.record_search(location, 'api', result_count=0, found=False)
         return JsonResponse({'error': f'API request failed: {str(e)}'}, status=500)
     except Exception as e:
         # Save unexpected error to history
-        SearchHistory.objects.create(
-            location=location,
-            source='api',
-            result_count=0,
-            found=False
+        history.record_search(location, 'api', result_count=0, found=False)
+        return JsonResponse({'error': f'An error occurred: {str(e)}'}, status=500)
+
+
+def requested_point(request):
+    """``(lat, lon)`` from the query string, or None when neither is given; raises ValueError if invalid"""
+    if not request.GET.get('lat') and not request.GET.get('lon'):
+        return None
+    try:
+        latitude, longitude = float(request.GET['lat']), float(request.GET['lon'])
+    except (KeyError, ValueError):
+        raise ValueError('lat and lon must both be numbers')
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('lat must be between -90 and 90 and lon between -180 and 180')
+    return latitude, longitude
+
+
+def coordinate_search(point, fmt):
+    """Answer a location search for coordinates from the nearest city that has records"""
+    candidates = geo.nearest(*point, k=NEARBY_SEARCH_CANDIDATES, max_km=settings.GEO_SEARCH_RADIUS_KM)
+    with_records = set(
+        LatestWeather.objects.filter(city__in=[candidate.city for candidate in candidates])
+        .order_by().values_list('city', flat=True)
+    )
+    match = next((candidate for candidate in candidates if candidate.city in with_records), None)
+    if match is None:
+        history.record_search(f'{point[0]:.4f},{point[1]:.4f}', 'database', found=False)
+        return JsonResponse(
+            {'error': f'No city with records within {settings.GEO_SEARCH_RADIUS_KM} km of {point[0]}, {point[1]}'},
+            status=404,
         )
+    
+    db_records = list(WeatherRecord.objects.filter(city=match.city).order_by('-date')[:7])
+    history.record_search(match.city, 'database', result_count=len(db_records), found=True)
+    data = database_search_data(match.city, db_records)
+    data['distance_km'] = round(match.distance_km, 3)
+    data['records'] = shape(data['records'], fmt, API_RECORD_FIELDS)
+    return render_api(data, fmt)
+
+
+async def search_location_async(request):
+    """Non-blocking version of search_location for ASGI deployments.
+
+    Upstream lookups await the async OpenWeather client, so a slow upstream
+    holds no worker thread while the request waits.
+    """
+    location = request.GET.get('location', '').strip()
+    
+    if not location:
+        return JsonResponse({'error': 'Location parameter is required'}, status=400)
+    
+    # First, try to find in database
+    db_records = [
+        record async for record in WeatherRecord.objects.filter(
+            city__iexact=location
+        ).order_by('-date')[:7]
+    ]
+    
+    if db_records:
+        await history.arecord_search(location, 'database', result_count=len(db_records), found=True)
+        return JsonResponse(database_search_data(location, db_records))
+    
+    # Not in database, try OpenWeather API
+    try:
+        response = await openweather.get_async_client().current_weather(location)
+        found = response.status_code == 200
+        await history.arecord_search(location, 'api', result_count=1 if found else 0, found=found)
+        if found:
+            return JsonResponse(api_search_data(location, response.data))
+        return JsonResponse({'error': f'Location not found: {location}'}, status=404)
+    
+    except httpx.HTTPError as e:
+        await history.arecord_search(location, 'api', result_count=0, found=False)
+        return JsonResponse({'error': f'API request failed: {str(e)}'}, status=500)
+    except Exception as e:
+        await history.arecord_search(location, 'api', result_count=0, found=False)
         return JsonResponse({'error': f'An error occurred: {str(e)}'}, status=500)
 
 
+def database_search_data(location, records):
+    """Format WeatherRecords found for a location search"""
+    return {
+        'source': 'database',
+        'location': location,
+        'records': [{
+            'city': r.city,
+            'date': r.date.isoformat(),
+            'temp_high': r.temp_high,
+            'temp_low': r.temp_low,
+            'temp_avg': r.temp_avg,
+            'precipitation': r.precipitation,
+            'humidity': r.humidity,
+            'wind_speed': r.wind_speed,
+            'condition': r.get_condition_display(),
+        } for r in records]
+    }
+
+
+def api_search_data(location, weather_data):
+    """Format an OpenWeather current weather payload for a location search"""
+    return {
+        'source': 'openweather_api',
+        'location': weather_data.get('name', location),
+        'current': {
+            'temp': weather_data['main']['temp'],
+            'temp_high': weather_data['main']['temp_max'],
+            'temp_low': weather_data['main']['temp_min'],
+            'humidity': weather_data['main']['humidity'],
+            'wind_speed': weather_data.get('wind', {}).get('speed', None),
+            'condition': weather_data['weather'][0]['main'],
+            'description': weather_data['weather'][0]['description'],
+        }
+    }
+
+
+def records_search_etag(request):
+    # Any city may match the query, so validate against every city's version
+    return versions.make_etag(request, versions.request_state(request))
+
+
+def records_search_last_modified(request):
+    return versions.request_state(request)[1]
+
+
+@read_replica
+@gzip_page
+@condition(etag_func=records_search_etag, last_modified_func=records_search_last_modified)
 def api_search(request):
-    """API endpoint to search weather records by city or date."""
+    """API endpoint to search weather records by city name and/or date.
+
+    City words match as prefixes through the full-text city index; date
+    tokens (``2024``, ``2024-01``, ``2024-01-15``, ``2024-01..2024-03``) limit
+    the dates returned. At most ``limit`` records are returned, best match first.
+    """
     query = request.GET.get('q', '').strip()
 
     if not query:
         return JsonResponse({'error': 'Query parameter is required'}, status=400)
 
-    # Search weather records by city or date
-    results = WeatherRecord.objects.filter(
-        Q(city__icontains=query) |
-        Q(date__icontains=query)
-    ).values('city', 'date', 'temp_high', 'temp_low', 'temp_avg', 'precipitation', 'humidity', 'wind_speed', 'condition')
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 50)), MAX_SEARCH_RESULTS))
+        parsed = parse_query(query)
+    except ValueError as e:
+        return JsonResponse({'error': f'Invalid query: {e}'}, status=400)
+    try:
+        fmt = negotiate(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    if not parsed:
+        return JsonResponse({'error': 'Query has no searchable terms'}, status=400)
 
-    if not results.exists():
+    cities, results = search_records(parsed, limit, API_RECORD_FIELDS)
+
+    if not results:
         return JsonResponse({'message': 'No records found for the given query.'}, status=404)
 
-    return JsonResponse({'results': list(results)})
+    return render_api({'cities': cities, 'results': shape(results, fmt, API_RECORD_FIELDS)}, fmt)
+
+
+@read_replica
+def popular_searches(request):
+    """Most searched locations, served from the compacted SearchHistory rollups.
+
+    ``?days=`` counts whole days (default 7) from the daily rollups; ``?hours=``
+    counts hours from the hourly ones instead. ``?source=`` limits the count to
+    ``database`` or ``api`` searches. Searches from the current hour are not
+    included until the next ``compact_search_history`` run.
+    """
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), MAX_POPULAR_SIZE))
+        if request.GET.get('hours'):
+            hours = min(int(request.GET['hours']), settings.SEARCH_ROLLUP_HOURLY_RETENTION_DAYS * 24)
+            period, since = 'hour', searchstats.hour_start(timezone.now()) - timedelta(hours=max(1, hours))
+        else:
+            days = int(request.GET.get('days', DEFAULT_POPULAR_DAYS))
+            if settings.SEARCH_ROLLUP_DAILY_RETENTION_DAYS is not None:
+                days = min(days, settings.SEARCH_ROLLUP_DAILY_RETENTION_DAYS)
+            period, since = 'day', searchstats.day_start(timezone.now()) - timedelta(days=max(1, days) - 1)
+    except ValueError:
+        return JsonResponse({'error': 'limit, days and hours must be integers'}, status=400)
+    
+    source = request.GET.get('source') or None
+    if source not in (None, 'database', 'api'):
+        return JsonResponse({'error': "source must be 'database' or 'api'"}, status=400)
+    
+    return JsonResponse({
+        'period': period,
+        'since': since.isoformat(),
+        'compacted_until': searchstats.compacted_until(),
+        'locations': searchstats.popular_locations(since, period, limit, source),
+    })
@@ -0,0 +1,8 @@
+import os
+from django.core.asgi import get_asgi_application
+os.environ.setdefault('DJANGO_SETTINGS_MODULE','weather_site.settings')
+application = get_asgi_application()
+
+# Build the in-memory location index before the first request needs it
+from weather import geo  # noqa: E402
+geo.warm()
@@ -10,6 +10,7 @@ INSTALLED_APPS = [
     'weather',
 ]
 MIDDLEWARE = [
+    'weather.middleware.request_timing_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -30,6 +31,103 @@ TEMPLATES=[{
     ]}
 }]
 WSGI_APPLICATION='weather_site.wsgi.application'
+ASGI_APPLICATION='weather_site.asgi.application'
 DATABASES={'default':{'ENGINE':'django.db.backends.sqlite3','NAME':os.path.join(BASE_DIR,'db.sqlite3')}}
 STATIC_URL='/static/'
 DEFAULT_AUTO_FIELD='django.db.models.BigAutoField'
+
+# OpenWeather client (see weather/openweather.py); the API key is read from OPENWEATHER_API_KEY
+OPENWEATHER_BASE_URL = os.getenv('OPENWEATHER_BASE_URL', 'https://api.openweathermap.org/data/2.5')
+OPENWEATHER_TIMEOUT = 5
+OPENWEATHER_CACHE_SIZE = 1024
+OPENWEATHER_CACHE_TTL = 600  # seconds
+OPENWEATHER_NEGATIVE_CACHE_TTL = 60  # seconds to remember "city not found"
+
+# Buffered SearchHistory writes (see weather/history.py)
+SEARCH_HISTORY_BUFFERED = True
+SEARCH_HISTORY_BATCH_SIZE = 100
+SEARCH_HISTORY_FLUSH_INTERVAL = 1.0  # seconds an entry may wait before being written
+SEARCH_HISTORY_QUEUE_SIZE = 10000
+SEARCH_HISTORY_FULL_POLICY = 'drop'  # or 'block'
+SEARCH_HISTORY_BLOCK_TIMEOUT = 0.05  # seconds to wait for room under the 'block' policy
+
+# Rendered pages and per-city fragments are cached until the city's data version changes
+# (see weather/pagecache.py); entries have no timeout and are culled by the backend
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+WEATHER_PAGE_CACHE_ENABLED = True
+WEATHER_PAGE_CACHE_ALIAS = 'default'
+
+# Opt-in production database profile (see weather/db.py): WAL and tuned pragmas, persistent
+# connections, and a read-only replica connection for the read-heavy views
+WEATHER_DB_PROFILE = os.getenv('WEATHER_DB_PROFILE', 'development')
+WEATHER_DB_REPLICA = os.getenv('WEATHER_DB_REPLICA', '')  # separate replica file; default: the primary, read-only
+SQLITE_PRAGMAS = {}
+if WEATHER_DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'timeout': 20},
+    })
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{WEATHER_DB_REPLICA or DATABASES['default']['NAME']}?mode=ro",
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'uri': True, 'timeout': 20},
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['weather.db.ReadReplicaRouter']
+    SQLITE_PRAGMAS = {
+        'default': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 20000,
+            'mmap_size': 268435456,  # 256 MiB
+            'cache_size': -65536,  # 64 MiB
+            'temp_store': 'MEMORY',
+        },
+        'replica': {
+            'mmap_size': 268435456,
+            'cache_size': -65536,
+            'temp_store': 'MEMORY',
+        },
+    }
+
+# Per-request Server-Timing header and slow request / N+1 logging (see weather/middleware.py)
+REQUEST_TIMING_ENABLED = True
+REQUEST_TIMING_SLOW_MS = 500
+REQUEST_TIMING_REPEATED_QUERIES = 10  # calls of one SQL shape flagged as a possible N+1
+REQUEST_TIMING_LOGGED_STATEMENTS = 5
+
+# SearchHistory compaction (see weather/searchstats.py and the compact_search_history command)
+SEARCH_HISTORY_RETENTION_DAYS = 30  # raw searches
+SEARCH_ROLLUP_HOURLY_RETENTION_DAYS = 14
+SEARCH_ROLLUP_DAILY_RETENTION_DAYS = 730  # None keeps daily counts forever
+SEARCH_ROLLUP_GRACE = 60  # seconds after an hour ends before it is compacted
+
+# Background prefetch of popular locations only answered by OpenWeather
+# (see weather/prefetch.py and the prefetch_locations command)
+OPENWEATHER_PREFETCH_LOCATIONS = 50
+OPENWEATHER_PREFETCH_WINDOW_DAYS = 7  # days of searches ranked
+OPENWEATHER_PREFETCH_WORKERS = 4
+OPENWEATHER_PREFETCH_RATE = 1.0  # upstream calls per second (the free plan allows 60 per minute)
+OPENWEATHER_PREFETCH_BURST = 5
+
+# Streaming NDJSON ingest endpoint for station feeds (see weather/feeds.py)
+INGEST_FEED_TOKEN = os.getenv('WEATHER_INGEST_TOKEN', '')  # when set, POSTs need "Authorization: Bearer <token>"
+INGEST_FEED_BATCH_SIZE = 500  # rows a request validates before queueing them for the writer
+INGEST_FEED_COMMIT_ROWS = 5000  # most rows the writer upserts in one transaction
+INGEST_FEED_QUEUE_SIZE = 64  # batches waiting for the writer before requests are answered 429
+INGEST_FEED_QUEUE_TIMEOUT = 0.5  # seconds a request waits for room in the queue
+INGEST_FEED_COMMIT_TIMEOUT = 30  # seconds a request waits for its rows to be committed
+INGEST_FEED_MAX_LINE_BYTES = 65536
+INGEST_FEED_RETRY_AFTER = 1  # seconds, sent with 429 responses
+
+# Nearest-city lookups from Location coordinates (see weather/geo.py)
+GEO_SEARCH_RADIUS_KM = 50  # /api/search/?lat=&lon= answers from the nearest city with records this close
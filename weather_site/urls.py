@@ -6,9 +6,19 @@ from weather.views import (
     weather_comparison,
     weather_trends,
     user_achievements,
+    leaderboard,
     api_weather_data,
+    api_weather_batch,
+    api_export,
+    api_observations,
+    api_ingest,
+    api_nearby,
     search_location,
-    api_search
+    search_location_async,
+    api_search,
+    popular_searches,
+    cache_stats,
+    metrics_view
 )
 
 urlpatterns = [
@@ -18,7 +28,17 @@ urlpatterns = [
     path('comparison/', weather_comparison, name='weather_comparison'),
     path('trends/', weather_trends, name='weather_trends'),
     path('achievements/', user_achievements, name='achievements'),
+    path('leaderboard/', leaderboard, name='leaderboard'),
     path('api/weather/', api_weather_data, name='api_weather_data'),
+    path('api/weather/batch/', api_weather_batch, name='api_weather_batch'),
+    path('api/export/', api_export, name='api_export'),
+    path('api/observations/', api_observations, name='api_observations'),
+    path('api/ingest/', api_ingest, name='api_ingest'),
+    path('api/nearby/', api_nearby, name='api_nearby'),
     path('api/search/', search_location, name='search_location'),
-    path('api/search/', api_search, name='api_search'),
+    path('api/search/async/', search_location_async, name='search_location_async'),
+    path('api/search/records/', api_search, name='api_search'),
+    path('api/search/popular/', popular_searches, name='popular_searches'),
+    path('api/cache/stats/', cache_stats, name='cache_stats'),
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -3,3 +3,7 @@ import os
 from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE','weather_site.settings')
 application = get_wsgi_application()
+
+# Build the in-memory location index before the first request needs it
+from weather import geo  # noqa: E402
+geo.warm()